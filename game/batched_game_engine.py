@@ -0,0 +1,407 @@
+import numpy as np
+from model.wall_scoring import RUN_LENGTH_TABLE, ROW_MASK_WEIGHTS
+from neural_network_interface import (BOARD_INPUT_SIZE, FACTORY_INPUT_SIZE, CENTRAL_FACTORY_INPUT_SIZE,
+                                      encode_boards, encode_tile_slots)
+from phase_profiler import profiler, perf_counter
+
+PLAYER_COUNT = 4
+FACTORY_COUNT = 9
+FLOOR_LINE_CAPACITY = 7
+# Floor line penalty by floor line length, the starting player tile can push the length to 8
+FLOOR_PENALTIES = np.array([0, -1, -2, -4, -6, -8, -11, -14, -17], dtype=np.int32)
+
+
+class BatchedGameEngine:
+    """
+    Plays many independent 4-player games in lockstep.
+
+    Boards, factories, the center, the tile bag and the box lid of every game live in NumPy arrays
+    with the game as the first axis, so dealing, applying moves, tiling the walls and scoring run as
+    array operations over the whole batch. The rules follow GameEngine: factory sources use the
+    GameEngine convention (-1 is the central factory, 0-8 the factory displays), colors are indices
+    into TileColor and pattern line 5 sends the tiles straight to the floor line.
+
+    Each seat is played by a policy, a callable taking (engine, games, seat) and returning the
+    (sources, colors, pattern_lines) arrays for the given game indices.
+
+    With a ScenarioTable, game g plays scenario scenario_indices[g] (by default g modulo the number
+    of scenarios): tile draws and random players take their numbers from the table instead of rng.
+    """
+
+    def __init__(self, game_count, policies, seed=None, scenarios=None, scenario_indices=None):
+        self.game_count = game_count
+        self.policies = policies
+        self.rng = np.random.default_rng(seed)
+        self.scenarios = scenarios
+        if scenarios is not None:
+            self.scenario_indices = scenario_indices if scenario_indices is not None else np.arange(game_count) % scenarios.scenario_count
+            self.draw_counts = np.zeros(game_count, dtype=np.int32)
+            self.move_counts = np.zeros((game_count, PLAYER_COUNT), dtype=np.int32)
+
+        # Player boards
+        self.wall = np.zeros((game_count, PLAYER_COUNT, 5, 5), dtype=bool)
+        self.pattern_line_colors = np.full((game_count, PLAYER_COUNT, 5), -1, dtype=np.int8)
+        self.pattern_line_counts = np.zeros((game_count, PLAYER_COUNT, 5), dtype=np.int8)
+        self.floor_counts = np.zeros((game_count, PLAYER_COUNT), dtype=np.int8)
+        self.floor_color_counts = np.zeros((game_count, PLAYER_COUNT, 5), dtype=np.int8)
+        self.first_player_tiles = np.zeros((game_count, PLAYER_COUNT), dtype=bool)
+        self.scores = np.zeros((game_count, PLAYER_COUNT), dtype=np.int32)
+
+        # Tile supply as counts per color
+        self.factories = np.zeros((game_count, FACTORY_COUNT, 5), dtype=np.int8)
+        self.central_factory = np.zeros((game_count, 5), dtype=np.int8)
+        self.starting_player_tile_in_center = np.ones(game_count, dtype=bool)
+        self.tile_bag = np.full((game_count, 5), 20, dtype=np.int16)
+        self.box_lid = np.zeros((game_count, 5), dtype=np.int16)
+
+        self.current_player_index = np.zeros(game_count, dtype=np.int8)
+        self.round_in_progress = np.zeros(game_count, dtype=bool)
+        self.game_over = np.zeros(game_count, dtype=bool)
+        self.round_number = 0
+
+        self.refresh_factories()
+
+    def play_games(self, rounds=1):
+        """Play every game for the given number of rounds and return the score of the first seat in each game."""
+        if self.scenarios is not None and self.scenarios.rounds < rounds:
+            raise ValueError(f"The scenario table only covers {self.scenarios.rounds} rounds")
+        while self.round_number < rounds:
+            self.round_number += 1
+            self.play_round()
+            self.end_round(refresh=self.round_number < rounds)
+        return self.scores[:, 0]
+
+    def play_round(self):
+        self.round_in_progress[:] = True
+        while self.round_in_progress.any():
+            self.play_turn()
+
+    def play_turn(self):
+        """Let the current player of every game that is still in its round make one move."""
+        games = np.flatnonzero(self.round_in_progress)
+        seats = self.current_player_index[games]
+        for seat in range(PLAYER_COUNT):
+            seat_games = games[seats == seat]
+            if seat_games.size and not profiler.enabled:
+                sources, colors, pattern_lines = self.policies[seat](self, seat_games, seat)
+                self.apply_moves(seat_games, seat, sources, colors, pattern_lines)
+            elif seat_games.size:
+                start_time = perf_counter()
+                sources, colors, pattern_lines = self.policies[seat](self, seat_games, seat)
+                decided_time = perf_counter()
+                self.apply_moves(seat_games, seat, sources, colors, pattern_lines)
+                profiler.add("decision", decided_time - start_time, seat_games.size)
+                profiler.add("apply_move", perf_counter() - decided_time, seat_games.size)
+
+        # Move to the next player
+        self.current_player_index[games] = (seats + 1) % PLAYER_COUNT
+
+        # The round ends once no colored tiles are left in the factories and the center
+        tiles_left = self.factories[games].sum(axis=(1, 2), dtype=np.int16) + self.central_factory[games].sum(axis=1, dtype=np.int16)
+        self.round_in_progress[games[tiles_left == 0]] = False
+
+    def source_counts(self, games):
+        """Tile counts per color of every source, (len(games), 10, 5) with the central factory first."""
+        return np.concatenate((self.central_factory[games, None, :], self.factories[games]), axis=1)
+
+    def apply_moves(self, games, seat, sources, colors, pattern_lines):
+        """Apply one move per game for the player in the given seat."""
+        selected_counts = np.empty(games.size, dtype=np.int8)
+
+        # Factory displays: take the color and push the rest of the display to the center
+        from_factory = sources != -1
+        factory_games = games[from_factory]
+        factory_indices = sources[from_factory]
+        factory_colors = colors[from_factory]
+        selected_counts[from_factory] = self.factories[factory_games, factory_indices, factory_colors]
+        self.factories[factory_games, factory_indices, factory_colors] = 0
+        self.central_factory[factory_games] += self.factories[factory_games, factory_indices]
+        self.factories[factory_games, factory_indices] = 0
+
+        # Central factory: the first player to take from it also takes the starting player tile
+        from_center = ~from_factory
+        center_games = games[from_center]
+        center_colors = colors[from_center]
+        selected_counts[from_center] = self.central_factory[center_games, center_colors]
+        self.central_factory[center_games, center_colors] = 0
+        marker_games = center_games[self.starting_player_tile_in_center[center_games]]
+        self.starting_player_tile_in_center[marker_games] = False
+        self.first_player_tiles[marker_games, seat] = True
+
+        self.place_tiles(games, seat, colors, pattern_lines, selected_counts)
+
+    def place_tiles(self, games, seat, colors, pattern_lines, tile_counts):
+        """Vectorized PlayerBoard.place_tiles for one seat across games."""
+        rows = np.minimum(pattern_lines, 4)
+        columns = (colors + rows) % 5
+        line_colors = self.pattern_line_colors[games, seat, rows]
+        line_counts = self.pattern_line_counts[games, seat, rows]
+        fits = ((pattern_lines < 5)
+                & ~self.wall[games, seat, rows, columns]
+                & ((line_colors == -1) | (line_colors == colors)))
+        placed = np.where(fits, np.minimum(rows + 1 - line_counts, tile_counts), 0).astype(np.int8)
+        fit_games = games[fits]
+        fit_rows = rows[fits]
+        self.pattern_line_colors[fit_games, seat, fit_rows] = colors[fits]
+        self.pattern_line_counts[fit_games, seat, fit_rows] += placed[fits]
+
+        # Whatever did not fit goes to the floor line, and whatever does not fit there goes to the box lid
+        remaining = tile_counts - placed
+        floor_length = self.floor_counts[games, seat] + self.first_player_tiles[games, seat]
+        to_floor = np.minimum(np.maximum(FLOOR_LINE_CAPACITY - floor_length, 0), remaining).astype(np.int8)
+        self.floor_counts[games, seat] += to_floor
+        self.floor_color_counts[games, seat, colors] += to_floor
+        self.box_lid[games, colors] += remaining - to_floor
+
+    def end_round(self, refresh=True):
+        """Vectorized GameEngine.end_round for every game."""
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
+        self.set_new_starting_player()
+
+        for row in range(5):
+            line_colors = self.pattern_line_colors[:, :, row]
+            completed_games, completed_seats = np.nonzero((line_colors >= 0) & (self.pattern_line_counts[:, :, row] == row + 1))
+            if not completed_games.size:
+                continue
+            colors = line_colors[completed_games, completed_seats]
+            columns = (colors + row) % 5
+            self.wall[completed_games, completed_seats, row, columns] = True
+            self.scores[completed_games, completed_seats] += self.score_placed_tiles(completed_games, completed_seats, row, columns)
+
+            # The rest of a completed line goes to the box lid
+            np.add.at(self.box_lid, (completed_games, colors), row)
+            self.pattern_line_colors[completed_games, completed_seats, row] = -1
+            self.pattern_line_counts[completed_games, completed_seats, row] = 0
+
+        floor_length = self.floor_counts + self.first_player_tiles
+        self.scores += FLOOR_PENALTIES[floor_length]
+        self.box_lid += self.floor_color_counts.sum(axis=1, dtype=np.int16)
+        self.floor_counts[:] = 0
+        self.floor_color_counts[:] = 0
+        self.first_player_tiles[:] = False
+        if timed:
+            profiler.add("end_round", perf_counter() - start_time, self.game_count)
+
+        if refresh:
+            self.refresh_factories()
+        self.check_game_over()
+
+    def score_placed_tiles(self, games, seats, row, columns):
+        """Score tiles just placed at (row, column) on the given walls with the wall_scoring run-length table."""
+        walls = self.wall[games, seats]
+        row_masks = walls[:, row, :] @ ROW_MASK_WEIGHTS
+        column_masks = walls[np.arange(games.size), :, columns] @ ROW_MASK_WEIGHTS
+        return RUN_LENGTH_TABLE[row_masks, columns] + RUN_LENGTH_TABLE[column_masks, row] - 1
+
+    def set_new_starting_player(self):
+        # Games where nobody took the starting player tile keep the current player
+        has_marker = self.first_player_tiles.any(axis=1)
+        self.current_player_index[has_marker] = self.first_player_tiles[has_marker].argmax(axis=1)
+
+    def refresh_factories(self):
+        """Clear the center, put the starting player tile back and deal 4 tiles to every factory display."""
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
+        self.central_factory[:] = 0
+        self.starting_player_tile_in_center[:] = True
+        for factory_index in range(FACTORY_COUNT):
+            self.factories[:, factory_index] += self.draw_tiles(4)
+        if timed:
+            profiler.add("refill_factories", perf_counter() - start_time, self.game_count)
+
+    def draw_tiles(self, number):
+        """Vectorized TileBag.draw_tiles, one draw per game. Returns a (games, 5) count array."""
+        bag_counts = self.tile_bag.sum(axis=1)
+        short = bag_counts < number
+        refill = short & (self.box_lid.sum(axis=1) > 0)
+        self.tile_bag[refill] += self.box_lid[refill]
+        self.box_lid[refill] = 0
+
+        # A short bag with an empty box lid deals nothing, just like TileBag
+        bag_counts = self.tile_bag.sum(axis=1)
+        draw_counts = np.where(short & ~refill, 0, np.minimum(number, bag_counts))
+        drawn = np.zeros((self.game_count, 5), dtype=np.int8)
+        for tile in range(number):
+            games = np.flatnonzero(draw_counts > tile)
+            if not games.size:
+                break
+            bag = self.tile_bag[games]
+            positions = (self.draw_uniforms(games) * bag.sum(axis=1)).astype(np.int16)
+            colors = (positions[:, None] >= bag.cumsum(axis=1)).sum(axis=1)
+            self.tile_bag[games, colors] -= 1
+            drawn[games, colors] += 1
+        return drawn
+
+    def draw_uniforms(self, games):
+        """One uniform [0, 1) number per game for the next tile draw."""
+        if self.scenarios is None:
+            return self.rng.random(games.size)
+        uniforms = self.scenarios.deal_uniforms[self.scenario_indices[games], self.draw_counts[games]]
+        self.draw_counts[games] += 1
+        return uniforms
+
+    def opponent_uniforms(self, games, seat):
+        """The scenario table's three uniform numbers for the next move of the seat in every game, (len(games), 3)."""
+        uniforms = self.scenarios.opponent_uniforms[self.scenario_indices[games], seat, self.move_counts[games, seat]]
+        self.move_counts[games, seat] += 1
+        return uniforms
+
+    def check_game_over(self):
+        self.game_over |= self.wall.all(axis=3).any(axis=(1, 2))
+
+    def simplest_input(self, games, seat=0):
+        """
+        NeuralNetworkInterface.simplest_input for many games at once: the board of the given seat
+        followed by the factory displays, as a (len(games), 253) float32 array.
+        """
+        network_input = np.empty((games.size, BOARD_INPUT_SIZE + FACTORY_COUNT * FACTORY_INPUT_SIZE), dtype=np.float32)
+        self.encode_board(games, seat, network_input[:, :BOARD_INPUT_SIZE])
+        encode_tile_slots(self.factories[games], 4, network_input[:, BOARD_INPUT_SIZE:])
+        return network_input
+
+    def game_state_to_network_input(self, games, seat):
+        """
+        NeuralNetworkInterface.game_state_to_network_input for many games at once, seen from the given
+        seat: every board starting with that seat's, the factory displays and the center, as a
+        (len(games), 608) float32 array.
+        """
+        factories_offset = PLAYER_COUNT * BOARD_INPUT_SIZE
+        central_factory_offset = factories_offset + FACTORY_COUNT * FACTORY_INPUT_SIZE
+        network_input = np.empty((games.size, central_factory_offset + CENTRAL_FACTORY_INPUT_SIZE), dtype=np.float32)
+        for position in range(PLAYER_COUNT):
+            self.encode_board(games, (seat + position) % PLAYER_COUNT,
+                              network_input[:, position * BOARD_INPUT_SIZE:(position + 1) * BOARD_INPUT_SIZE])
+        encode_tile_slots(self.factories[games], 4, network_input[:, factories_offset:central_factory_offset])
+        network_input[:, central_factory_offset] = self.starting_player_tile_in_center[games]
+        encode_tile_slots(self.central_factory[games][:, None, :], 27, network_input[:, central_factory_offset + 1:])
+        return network_input
+
+    def encode_board(self, games, seat, out):
+        encode_boards(self.pattern_line_colors[games, seat], self.pattern_line_counts[games, seat],
+                      self.wall[games, seat].reshape(games.size, 25),
+                      self.floor_counts[games, seat] + self.first_player_tiles[games, seat], out)
+
+
+def select_highest(preferences, valid):
+    """
+    Index of the highest valid preference in each row, walking np.argsort(preferences)[::-1] like
+    the network players do, so ties resolve exactly as they do there.
+    """
+    ranking = np.argsort(preferences, axis=1)[:, ::-1]
+    rows = np.arange(ranking.shape[0])
+    first_valid = np.argmax(valid[rows[:, None], ranking], axis=1)
+    return ranking[rows, first_valid]
+
+
+def select_uniform(valid, uniform):
+    """Pick a uniformly random True column in each row, given one uniform [0, 1) number per row."""
+    option_counts = valid.sum(axis=1)
+    choices = (uniform * option_counts).astype(np.int64)
+    return (valid.cumsum(axis=1) <= choices[:, None]).sum(axis=1)
+
+
+class BatchedRandomPolicy:
+    """
+    Batched RandomPlayer: a uniformly random valid factory, then a random color there, then any of
+    the 5 pattern lines. Takes its numbers from the engine's scenario table when it has one.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, engine, games, seat):
+        source_counts = engine.source_counts(games)
+        valid_sources = source_counts.any(axis=2)
+        if engine.scenarios is not None:
+            uniforms = engine.opponent_uniforms(games, seat)
+            source_uniforms, color_uniforms = uniforms[:, 0], uniforms[:, 1]
+            pattern_lines = (uniforms[:, 2] * 5).astype(np.int64)
+        else:
+            source_uniforms = self.rng.random(games.size)
+            color_uniforms = self.rng.random(games.size)
+            pattern_lines = None
+        source_indices = select_uniform(valid_sources, source_uniforms)
+        available_colors = source_counts[np.arange(games.size), source_indices] > 0
+        colors = select_uniform(available_colors, color_uniforms)
+        if pattern_lines is None:
+            pattern_lines = self.rng.integers(0, 5, games.size)
+        return source_indices - 1, colors, pattern_lines
+
+
+class BatchedNetworkPolicy:
+    """Batched NeuralNetworkPlayer: activates the network on simplest_input and decodes its outputs the same way."""
+
+    def __init__(self, neural_network):
+        self.neural_network = neural_network
+
+    def __call__(self, engine, games, seat):
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
+        network_input = engine.simplest_input(games)
+        if timed:
+            encoded_time = perf_counter()
+        if hasattr(self.neural_network, "activate_batch"):
+            output = self.neural_network.activate_batch(network_input)
+        else:
+            output = np.array([self.neural_network.activate(row) for row in network_input], dtype=np.float64)
+        if timed:
+            activated_time = perf_counter()
+        decisions = self.decode_output(engine, games, output)
+        if timed:
+            profiler.add("decision.encode", encoded_time - start_time, games.size)
+            profiler.add("decision.activate", activated_time - encoded_time, games.size)
+            profiler.add("decision.decode", perf_counter() - activated_time, games.size)
+        return decisions
+
+    @staticmethod
+    def decode_output(engine, games, output):
+        source_counts = engine.source_counts(games)
+        source_indices = select_highest(output[:, :10], source_counts.any(axis=2))
+        available_colors = source_counts[np.arange(games.size), source_indices] > 0
+        colors = select_highest(output[:, 10:15], available_colors)
+        pattern_lines = np.argmax(output[:, 15:21], axis=1)
+        return source_indices - 1, colors, pattern_lines
+
+
+class BatchedPopulationPolicy:
+    """
+    BatchedNetworkPolicy for many networks at once: games are handed out in consecutive blocks of
+    games_per_network, the first block to the first network and so on. The input is encoded once for
+    every game and each network is activated on its own block in one call. Networks with 253 inputs
+    get simplest_input, the others game_state_to_network_input seen from their seat.
+    """
+
+    def __init__(self, neural_networks, games_per_network):
+        self.neural_networks = neural_networks
+        self.games_per_network = games_per_network
+
+    def __call__(self, engine, games, seat):
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
+        if self.neural_networks[0].input_count == BOARD_INPUT_SIZE + FACTORY_COUNT * FACTORY_INPUT_SIZE:
+            network_input = engine.simplest_input(games)
+        else:
+            network_input = engine.game_state_to_network_input(games, seat)
+        if timed:
+            encoded_time = perf_counter()
+        output = np.empty((games.size, 21), dtype=np.float64)
+
+        # games is sorted, so the games of one network form a contiguous block
+        owners = games // self.games_per_network
+        block_starts = np.flatnonzero(np.diff(owners)) + 1
+        for start, end in zip(np.concatenate(([0], block_starts)), np.concatenate((block_starts, [games.size]))):
+            output[start:end] = self.neural_networks[owners[start]].activate_batch(network_input[start:end])
+        if timed:
+            activated_time = perf_counter()
+        decisions = BatchedNetworkPolicy.decode_output(engine, games, output)
+        if timed:
+            profiler.add("decision.encode", encoded_time - start_time, games.size)
+            profiler.add("decision.activate", activated_time - encoded_time, games.size)
+            profiler.add("decision.decode", perf_counter() - activated_time, games.size)
+        return decisions
+
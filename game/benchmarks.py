@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import numpy as np
+import neat
+from game_engine import GameEngine
+from batched_game_engine import BatchedGameEngine, BatchedRandomPolicy
+from neural_network_interface import NeuralNetworkInterface
+from model.ai_players.random_player import RandomPlayer
+from model.ai_players.fast_random_player import FastRandomPlayer
+from model.ai_players.nn_player import NeuralNetworkPlayer
+from neat_package.compiled_network import CompiledNetwork
+from neat_package.population_evaluator import PopulationEvaluator
+from neat_package.neat import eval_genome
+
+CONFIG_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "neat_package", "config")
+ONE_ROUND_CONFIG = os.path.join(CONFIG_DIRECTORY, "config_one_round_one_board.txt")
+FULL_CONFIG = os.path.join(CONFIG_DIRECTORY, "neat_config.txt")
+DEFAULT_TOLERANCE = 0.15
+
+
+class Result:
+    """One measurement. Rates are better higher, wall times lower."""
+
+    def __init__(self, name, value, unit, higher_is_better=True):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def to_json(self):
+        return {"value": self.value, "unit": self.unit, "higher_is_better": self.higher_is_better}
+
+
+def best_time(function, repeats):
+    """Shortest wall time of repeats calls, the one least disturbed by the rest of the machine."""
+    times = []
+    for ignored_repeat in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def load_config(config_file):
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                       config_file)
+
+
+def new_genome(config, key=0, mutations=20):
+    """A fresh genome of the config, mutated a little so it has some hidden structure. Seeded through random."""
+    random.seed(key)
+    genome = config.genome_type(key)
+    genome.configure_new(config.genome_config)
+    for ignored_mutation in range(mutations):
+        genome.mutate(config.genome_config)
+    return genome
+
+
+def positions(count, seed=0):
+    """Mid-round game positions, reached with seeded random players."""
+    engines = []
+    for game_seed in range(seed, seed + count):
+        game_engine = GameEngine([RandomPlayer(f"Player {seat + 1}", seed=game_seed * 4 + seat) for seat in range(4)],
+                                 seed=game_seed)
+        for ignored_turn in range(game_seed % 8):
+            game_engine.play_turn(game_engine.players[game_engine.current_player_index])
+            game_engine.next_player()
+        engines.append(game_engine)
+    return engines
+
+
+def bench_play_game(repeats, game_count=300):
+    one_round_config = load_config(ONE_ROUND_CONFIG)
+    network = CompiledNetwork.create(new_genome(one_round_config), one_round_config)
+    seat_mixes = {
+        "random": lambda seed: [RandomPlayer(f"Player {seat + 1}", seed=seed * 4 + seat) for seat in range(4)],
+        "fast_random": lambda seed: [FastRandomPlayer(f"Player {seat + 1}", seed=seed * 4 + seat) for seat in range(4)],
+        "network_vs_random": lambda seed: [NeuralNetworkPlayer("Network", network)]
+                                          + [RandomPlayer(f"Player {seat + 1}", seed=seed * 4 + seat) for seat in range(1, 4)],
+    }
+    results = []
+    for mix_name, players in seat_mixes.items():
+        def play():
+            for seed in range(game_count):
+                GameEngine(players(seed), seed=seed).play_game()
+        results.append(Result(f"play_game.{mix_name}", game_count / best_time(play, repeats), "games/s"))
+    return results
+
+
+def bench_play_turn(repeats, game_count=300):
+    turn_times = []
+    turn_count = 0
+    for ignored_repeat in range(repeats):
+        total = 0.0
+        turn_count = 0
+        for game_engine in positions(game_count):
+            while not game_engine.is_round_over():
+                player = game_engine.players[game_engine.current_player_index]
+                start_time = time.perf_counter()
+                game_engine.play_turn(player)
+                total += time.perf_counter() - start_time
+                game_engine.next_player()
+                turn_count += 1
+        turn_times.append(total)
+    return [Result("play_turn", turn_count / min(turn_times), "turns/s")]
+
+
+def bench_end_round(repeats, game_count=300):
+    # Every game is played to the last move of the round, end_round then runs on a restored copy each time
+    round_ends = []
+    for game_engine in positions(game_count):
+        while not game_engine.is_round_over():
+            game_engine.play_turn(game_engine.players[game_engine.current_player_index])
+            game_engine.next_player()
+        round_ends.append((game_engine, game_engine.snapshot()))
+
+    def end_rounds():
+        total = 0.0
+        for game_engine, state in round_ends:
+            game_engine.restore(state)
+            start_time = time.perf_counter()
+            game_engine.end_round()
+            total += time.perf_counter() - start_time
+        return total
+
+    seconds = min(end_rounds() for ignored_repeat in range(repeats))
+    return [Result("end_round", seconds / game_count * 1e6, "us/call", higher_is_better=False)]
+
+
+def bench_encoders(repeats, position_count=500, batch_size=256):
+    interface = NeuralNetworkInterface()
+    engines = positions(position_count)
+    results = [
+        Result("encode.game_state_to_network_input",
+               position_count / best_time(lambda: [interface.game_state_to_network_input(e) for e in engines], repeats), "encodes/s"),
+        Result("encode.simplest_input",
+               position_count / best_time(lambda: [interface.simplest_input(e) for e in engines], repeats), "encodes/s"),
+    ]
+
+    batched_engine = BatchedGameEngine(batch_size, [BatchedRandomPolicy(seat) for seat in range(4)], seed=0)
+    games = np.arange(batch_size)
+    results.append(Result("encode.batched_simplest_input",
+                          batch_size / best_time(lambda: batched_engine.simplest_input(games), repeats), "encodes/s"))
+    results.append(Result("encode.batched_game_state_to_network_input",
+                          batch_size / best_time(lambda: batched_engine.game_state_to_network_input(games, 0), repeats),
+                          "encodes/s"))
+    return results
+
+
+def bench_activations(repeats, activation_count=200, batch_size=256):
+    # Network of the 608/600/21 config
+    full_config = load_config(FULL_CONFIG)
+    genome = new_genome(full_config)
+    inputs = np.random.default_rng(0).integers(0, 2, (batch_size, full_config.genome_config.num_inputs)).astype(np.float32)
+    input_lists = inputs[:activation_count].tolist()
+    reference = neat.nn.FeedForwardNetwork.create(genome, full_config)
+    compiled = CompiledNetwork.create(genome, full_config)
+    return [
+        Result("activate.feed_forward_network",
+               activation_count / best_time(lambda: [reference.activate(row) for row in input_lists], repeats), "activations/s"),
+        Result("activate.compiled_network",
+               activation_count / best_time(lambda: [compiled.activate(row) for row in input_lists], repeats), "activations/s"),
+        Result("activate.compiled_network_batch",
+               batch_size / best_time(lambda: compiled.activate_batch(inputs), repeats), "activations/s"),
+    ]
+
+
+def bench_eval_genome(repeats):
+    one_round_config = load_config(ONE_ROUND_CONFIG)
+    genome = new_genome(one_round_config)
+    return [Result("eval_genome", best_time(lambda: eval_genome(genome, one_round_config, seed=0), repeats), "s",
+                   higher_is_better=False)]
+
+
+def bench_generation(repeats, population_size=50):
+    one_round_config = load_config(ONE_ROUND_CONFIG)
+    one_round_config.pop_size = population_size
+    evaluator = PopulationEvaluator(os.cpu_count(), seed=0)
+    evaluator.start(one_round_config)
+    times = []
+    try:
+        for ignored_repeat in range(repeats):
+            random.seed(0)
+            population = neat.Population(one_round_config)
+            start_time = time.perf_counter()
+            population.run(evaluator.evaluate, 1)
+            times.append(time.perf_counter() - start_time)
+    finally:
+        evaluator.close()
+    return [Result(f"generation.population_{population_size}", min(times), "s", higher_is_better=False)]
+
+
+BENCHMARKS = {
+    "play_game": bench_play_game,
+    "play_turn": bench_play_turn,
+    "end_round": bench_end_round,
+    "encode": bench_encoders,
+    "activate": bench_activations,
+    "eval_genome": bench_eval_genome,
+    "generation": bench_generation,
+}
+
+
+def run_benchmarks(names=None, repeats=3):
+    """Run the named benchmarks (all by default) and return their Results."""
+    results = []
+    for name in names or BENCHMARKS:
+        benchmark_results = BENCHMARKS[name](repeats)
+        for result in benchmark_results:
+            print(f"{result.name:45s} {result.value:14.2f} {result.unit}")
+        results.extend(benchmark_results)
+    return results
+
+
+def save_baseline(results, path):
+    baseline = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": {result.name: result.to_json() for result in results},
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+
+
+def regressions(results, baseline_path, tolerance=DEFAULT_TOLERANCE):
+    """Results worse than the baseline by more than tolerance, as (name, baseline value, value, change) tuples."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    found = []
+    for result in results:
+        if result.name not in baseline:
+            continue
+        baseline_value = baseline[result.name]["value"]
+        change = (result.value - baseline_value) / baseline_value
+        if (change < -tolerance) if result.higher_is_better else (change > tolerance):
+            found.append((result.name, baseline_value, result.value, change))
+    return found
+
+
+if __name__ == "__main__":
+    # python benchmarks.py [--only play_game encode] [--save baseline.json] [--compare baseline.json], from the game directory
+    parser = argparse.ArgumentParser(description="Throughput of the engine, encoders, networks and evaluation")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run, all by default")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="flag results worse than this baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="relative slowdown that counts as a regression")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.only, arguments.repeats)
+    if arguments.save:
+        save_baseline(results, arguments.save)
+    if arguments.compare:
+        found = regressions(results, arguments.compare, arguments.tolerance)
+        for name, baseline_value, value, change in found:
+            print(f"REGRESSION {name}: {baseline_value:.2f} -> {value:.2f} ({change:+.0%})")
+        sys.exit(1 if found else 0)
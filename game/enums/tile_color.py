@@ -5,4 +5,8 @@ class TileColor(Enum):
     YELLOW = "yellow"
     RED = "red"
     BLACK = "black"
-    WHITE = "white"
\ No newline at end of file
+    WHITE = "white"
+
+# Integer-backed state refers to colors by their position in TileColor
+TILE_COLORS = list(TileColor)
+TILE_COLOR_INDEX = {color: index for index, color in enumerate(TILE_COLORS)}
@@ -1,22 +1,34 @@
 from model.factory import Factory
 from model.tile_bag import TileBag
 from model.central_factory import CentralFactory
-from model.starting_player_tile import StartingPlayerTile
 from model.box_lid import BoxLid
-from enums.tile_color import TileColor
+from enums.tile_color import TileColor, TILE_COLOR_INDEX
+from model.move_tables import FACTORY_CONTENT_MOVES, COLOR_MASK_MOVES, NO_MOVES, MOVE_DECODING, encode_move, color_mask
+from model import zobrist
 from neural_network_interface import NeuralNetworkInterface
+from game_observer import ConsolePrinter
+from phase_profiler import profiler, perf_counter
+import random
+import numpy as np
+from array import array
 
 class GameEngine:
-    def __init__(self, players):
+    def __init__(self, players, seed=None):
         self.players = players
         self.player_count = len(players)
         self.game_over = False
+        # The tile bag draws from this stream, seed it to replay the same deals
+        self.seed = seed
+        self.rng = random.Random(seed) if seed is not None else random
         self.box_lid = BoxLid()
         self.tile_bag = TileBag(self.box_lid, self)
         self.neural_network_interface = NeuralNetworkInterface()
         self.factories = []
         self.current_player_index = 0
-        self.print_enabled = False
+        self.round_number = 0
+        self.undo_stack = []  # Undo records pushed by make_move, newest last
+        self.encoders = []  # IncrementalEncoders patched on every move
+        self.observers = []  # GameObservers told about turns, moves, rounds and the end of the game
         self.setup_game()
 
     def setup_game(self):
@@ -42,21 +54,34 @@ class GameEngine:
             player.game_engine = self
             player.board.box_lid = self.box_lid
 
-    def play_game(self):
-        if self.print_enabled:
-            print("Starting the game...")
+        # Zobrist hash of the position, kept up to date by apply_move and end_round
+        self.hash = zobrist.compute_hash(self)
+
+    @property
+    def print_enabled(self):
+        """Whether a ConsolePrinter is attached. Setting it attaches or detaches one."""
+        return any(isinstance(observer, ConsolePrinter) for observer in self.observers)
 
+    @print_enabled.setter
+    def print_enabled(self, enabled):
+        if enabled and not self.print_enabled:
+            self.observers.append(ConsolePrinter())
+        elif not enabled:
+            self.observers = [observer for observer in self.observers if not isinstance(observer, ConsolePrinter)]
+
+    def play_game(self):
         self.round_number = 0
         # while not self.game_over:
         while self.round_number < 1:
             self.round_number += 1
-            if self.print_enabled:
-                print(f"\n-------------------------------------\nRound {self.round_number}\n-------------------------------------")
+            for observer in self.observers:
+                observer.on_round_start(self)
             self.play_round()
             # self.log_points()
             # After each round, check if the game should end
             self.check_game_over()
-        self.print_final_scores()
+        for observer in self.observers:
+            observer.on_game_end(self)
         self.players[0].fitness += self.players[0].score
         return self.players[0].fitness
 
@@ -72,45 +97,236 @@ class GameEngine:
     def play_round(self):
         while True:
             current_player = self.players[self.current_player_index]
-            if self.print_enabled:
-                print(self.neural_network_interface.game_state_to_network_input(self))
-                print(len(self.neural_network_interface.game_state_to_network_input(self)))
             self.play_turn(current_player)
 
             # Move to the next player
             self.current_player_index = (self.current_player_index + 1) % self.player_count
 
             # Check for end of round condition
-            if all(not factory.tiles for factory in self.factories) and not self.central_factory.tiles:
+            if self.is_round_over():
                 self.end_round()
                 break  # End the round
 
     def play_turn(self, player):
-        if self.print_enabled:
-            print(f"\n-------------------------------------\n{player.name}'s turn\n-------------------------------------")
-
-        self.print_game_state()
+        for observer in self.observers:
+            observer.on_turn_start(self, player)
+        if not profiler.enabled:
+            factory_index, selected_color, pattern_line_index = player.make_decision()
+            self.apply_move(encode_move(factory_index, TILE_COLOR_INDEX[selected_color], pattern_line_index))
+            return
+        start_time = perf_counter()
         factory_index, selected_color, pattern_line_index = player.make_decision()
-
+        decided_time = perf_counter()
+        self.apply_move(encode_move(factory_index, TILE_COLOR_INDEX[selected_color], pattern_line_index))
+        profiler.add("decision", decided_time - start_time)
+        profiler.add("apply_move", perf_counter() - decided_time)
+
+    def state_key(self):
+        """
+        64-bit key of the position including the player to move. Positions that only differ by the
+        order of the factory displays share a key. Scores, the tile bag and the box lid are not part of it.
+        """
+        return (self.hash + zobrist.PLAYER_TO_MOVE_KEYS[self.current_player_index]) & zobrist.MASK
+
+    def is_round_over(self):
+        """The round ends when no colored tiles are left in the factories and the central factory."""
+        return not self.central_factory.tile_count and not any(factory.tile_count for factory in self.factories)
+
+    def legal_sources(self):
+        """Factory indices that hold colored tiles, -1 being the central factory."""
+        sources = [-1] if self.central_factory.tile_count else []
+        sources.extend(i for i, factory in enumerate(self.factories) if factory.tile_count)
+        return sources
+
+    def legal_colors(self, factory_index):
+        """Color indices that can be taken from a factory, -1 being the central factory."""
         selected_factory = self.central_factory if factory_index == -1 else self.factories[factory_index]
-        
-        if any(isinstance(tile, StartingPlayerTile) for tile in selected_factory.tiles):
-                if self.print_enabled:
-                    print("Starting player marker taken!")
-                selected_factory.starting_player_marker_taken = True
-                for tile in selected_factory.tiles:
-                    if isinstance(tile, StartingPlayerTile):
-                        selected_factory.tiles.remove(tile)
-                        break
-                player.board.place_starting_player_tile_on_floor_line()
-
-        # Applying the decisions
-        selected_tiles = selected_factory.remove_and_return_tiles_of_color(selected_color)
-        remaining_tiles = selected_factory.get_and_clear_remaining_tiles()
-        self.central_factory.add_tiles(remaining_tiles)
-        player.place_tile_in_pattern_line(selected_color, pattern_line_index, len(selected_tiles))
-        if self.print_enabled:
-            print(f"{player.name} placed {len(selected_tiles)} {selected_color.name} tiles in pattern line {pattern_line_index + 1}.")
+        return selected_factory.colors()
+
+    def legal_moves(self):
+        """
+        All legal moves for the current player as an int16 array of moves packed by encode_move,
+        covering every (source, color, pattern line) combination. The floor line is pattern line 5.
+        """
+        moves = []
+        if self.central_factory.tile_count:
+            moves.append(COLOR_MASK_MOVES[0][color_mask(self.central_factory.counts)])
+        for i, factory in enumerate(self.factories):
+            if factory.tile_count:
+                if factory.content_index != -1:
+                    moves.append(FACTORY_CONTENT_MOVES[i][factory.content_index])
+                else:
+                    moves.append(COLOR_MASK_MOVES[i + 1][color_mask(factory.counts)])
+        return np.concatenate(moves) if moves else NO_MOVES
+
+    def apply_move(self, move):
+        """
+        Apply a move packed by encode_move for the current player and return how many tiles were taken.
+        The move is trusted to be legal.
+        """
+        factory_index, color_index, pattern_line_index = MOVE_DECODING[move]
+        player_index = self.current_player_index
+        board = self.players[player_index].board
+        central_factory = self.central_factory
+        line = min(pattern_line_index, 4)
+
+        # Only the source, the center, one pattern line and the floor line change
+        changed_key = (zobrist.central_factory_key(central_factory)
+                       + zobrist.pattern_line_key(player_index, board, line)
+                       + zobrist.floor_line_key(player_index, board))
+
+        starting_player_tile = factory_index == -1 and central_factory.has_starting_player_tile
+        if factory_index == -1:
+            # The first player to take from the center also takes the starting player tile
+            if starting_player_tile:
+                central_factory.take_starting_player_tile()
+                board.place_starting_player_tile_on_floor_line()
+            selected_tile_count = central_factory.remove_and_return_tiles_of_color(color_index)
+        else:
+            # The rest of a factory display goes to the center
+            selected_factory = self.factories[factory_index]
+            changed_key += zobrist.factory_key(selected_factory)
+            selected_tile_count = selected_factory.remove_and_return_tiles_of_color(color_index)
+            central_factory.add_tiles(selected_factory.get_and_clear_remaining_tiles())
+
+        board.place_tiles(color_index, pattern_line_index, selected_tile_count)
+        self.hash = (self.hash - changed_key
+                     + zobrist.central_factory_key(central_factory)
+                     + zobrist.pattern_line_key(player_index, board, line)
+                     + zobrist.floor_line_key(player_index, board)) & zobrist.MASK
+        for encoder in self.encoders:
+            encoder.on_move(player_index, factory_index, pattern_line_index)
+        for observer in self.observers:
+            observer.on_move_applied(self, player_index, factory_index, color_index, pattern_line_index, selected_tile_count,
+                                     starting_player_tile)
+        return selected_tile_count
+
+    def make_move(self, move):
+        """
+        Apply a move for the current player, pass the turn to the next player and push an undo record
+        so unmake_move can take it back. Only moves within a round are reversible, use snapshot and
+        restore around end_round.
+        """
+        factory_index, color_index, pattern_line_index = MOVE_DECODING[move]
+        player_index = self.current_player_index
+        board = self.players[player_index].board
+        central_factory = self.central_factory
+        line = min(pattern_line_index, 4)
+        self.undo_stack.append((
+            move,
+            player_index,
+            self.factories[factory_index].counts[:] if factory_index != -1 else None,
+            central_factory.counts[:],
+            central_factory.has_starting_player_tile,
+            central_factory.starting_player_marker_taken,
+            board.pattern_line_colors[line],
+            board.pattern_line_counts[line],
+            board.floor_count,
+            board.floor_color_counts[color_index],
+            board.has_first_player_tile,
+            self.box_lid.counts[color_index],
+            self.hash,
+        ))
+        self.apply_move(move)
+        self.next_player()
+
+    def unmake_move(self):
+        """Take back the last move applied by make_move."""
+        (move, player_index, factory_counts, central_counts, has_starting_player_tile, starting_player_marker_taken,
+         line_color, line_count, floor_count, floor_color_count, has_first_player_tile, box_lid_count, state_hash) = self.undo_stack.pop()
+        factory_index, color_index, pattern_line_index = MOVE_DECODING[move]
+
+        if factory_index != -1:
+            self.factories[factory_index].set_counts(factory_counts)
+        central_factory = self.central_factory
+        central_factory.set_counts(central_counts)
+        central_factory.has_starting_player_tile = has_starting_player_tile
+        central_factory.starting_player_marker_taken = starting_player_marker_taken
+
+        board = self.players[player_index].board
+        line = min(pattern_line_index, 4)
+        board.pattern_line_colors[line] = line_color
+        board.pattern_line_counts[line] = line_count
+        board.floor_count = floor_count
+        board.floor_color_counts[color_index] = floor_color_count
+        board.has_first_player_tile = has_first_player_tile
+
+        box_lid = self.box_lid
+        box_lid.tile_count += box_lid_count - box_lid.counts[color_index]
+        box_lid.counts[color_index] = box_lid_count
+        self.current_player_index = player_index
+        self.hash = state_hash
+        for encoder in self.encoders:
+            encoder.on_move(player_index, factory_index, pattern_line_index)
+
+    def snapshot(self, buffer=None):
+        """
+        Copy the whole game state into a flat array of ints: every player board and score, the
+        factories, the center, the tile bag, the box lid, the current player, the round and the game
+        over flag. Pass a previous snapshot as buffer to reuse it.
+        """
+        state = []
+        for player in self.players:
+            board = player.board
+            state.append(board.wall_mask)
+            state.extend(board.pattern_line_colors)
+            state.extend(board.pattern_line_counts)
+            state.append(board.floor_count)
+            state.extend(board.floor_color_counts)
+            state.append(board.has_first_player_tile)
+            state.append(player.score)
+        for factory in self.factories:
+            state.extend(factory.counts)
+        central_factory = self.central_factory
+        state.extend(central_factory.counts)
+        state.append(central_factory.has_starting_player_tile)
+        state.append(central_factory.starting_player_marker_taken)
+        state.extend(self.tile_bag.counts)
+        state.extend(self.box_lid.counts)
+        state.append(self.current_player_index)
+        state.append(self.round_number)
+        state.append(self.game_over)
+
+        if buffer is None:
+            return array('q', state)
+        buffer[:] = array('q', state)
+        return buffer
+
+    def restore(self, buffer):
+        """Restore the game state from a snapshot. The undo stack is cleared, its records belong to other states."""
+        position = 0
+        for player in self.players:
+            board = player.board
+            board.wall_mask = buffer[position]
+            board.pattern_line_colors = list(buffer[position + 1:position + 6])
+            board.pattern_line_counts = list(buffer[position + 6:position + 11])
+            board.floor_count = buffer[position + 11]
+            board.floor_color_counts = list(buffer[position + 12:position + 17])
+            board.has_first_player_tile = bool(buffer[position + 17])
+            player.score = buffer[position + 18]
+            position += 19
+        for factory in self.factories:
+            factory.set_counts(list(buffer[position:position + 5]))
+            position += 5
+        central_factory = self.central_factory
+        central_factory.set_counts(list(buffer[position:position + 5]))
+        central_factory.has_starting_player_tile = bool(buffer[position + 5])
+        central_factory.starting_player_marker_taken = bool(buffer[position + 6])
+        position += 7
+        tile_bag = self.tile_bag
+        tile_bag.counts = list(buffer[position:position + 5])
+        tile_bag.tile_count = sum(tile_bag.counts)
+        box_lid = self.box_lid
+        box_lid.counts = list(buffer[position + 5:position + 10])
+        box_lid.tile_count = sum(box_lid.counts)
+        position += 10
+        self.current_player_index = buffer[position]
+        self.round_number = buffer[position + 1]
+        self.game_over = bool(buffer[position + 2])
+        self.undo_stack.clear()
+        self.hash = zobrist.compute_hash(self)
+        for encoder in self.encoders:
+            encoder.refresh()
 
     def check_game_over(self):
         for player in self.players:
@@ -119,47 +335,42 @@ class GameEngine:
                 break
 
     def print_game_state(self):
-        if self.print_enabled:
-            print("\nCurrent Game State:\n")
+        print("\nCurrent Game State:\n")
 
         # Show available factories
         for i, factory in enumerate(self.factories, start=1):
-            if self.print_enabled:
-                print(f"Factory {i}: {[tile.name for tile in factory.tiles]}")
+            print(f"Factory {i}: {[tile.name for tile in factory.tiles]}")
         # Show the central factory
-        if self.print_enabled:
-            print(f"Central Factory: {[tile.name for tile in self.central_factory.tiles]}\n")
+        print(f"Central Factory: {[tile.name for tile in self.central_factory.tiles]}\n")
 
         # Show players' boards
-        if self.print_enabled:
-            for player in self.players:
-                player.print_board()
-                print("")  # Extra newline for spacing
+        for player in self.players:
+            player.print_board()
+            print("")  # Extra newline for spacing
 
-        
     def end_round(self):
         """Handle the end of a round: Move tiles, score points, and check game over condition."""
-        if self.print_enabled:
-            print(f"\n-------------------------------------\nEND OF ROUND\n-------------------------------------")
-
-        for player in self.players:
-            if self.print_enabled:
-                print(f"\n{player.name} board before moving, but after last move:")
-                player.board.print_board()
+        for observer in self.observers:
+            observer.on_round_end(self)
 
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
         self.set_new_starting_player()
-        
-        if self.print_enabled:
-            print(f"\n-------------------------------------\nSCORING AND MOVING TO WALL\n-------------------------------------")
-        for player in self.players:
+
+        for player_index, player in enumerate(self.players):
+            board_key = zobrist.board_key(player_index, player.board)
             score = player.move_tiles_to_wall_and_score()  # Assuming this method returns the score for the round
             player.score += score  # Assuming each player has a 'score' attribute
-            if self.print_enabled:
-                print(f"\n{player.name} scored {score} points this round.")
-                print(f"{player.name} board after moving:")
-                player.board.print_board()
+            self.hash = (self.hash - board_key + zobrist.board_key(player_index, player.board)) & zobrist.MASK
+            for observer in self.observers:
+                observer.on_scoring(self, player_index, score)
+        if timed:
+            profiler.add("end_round", perf_counter() - start_time)
 
         self.refresh_factories()
+        for encoder in self.encoders:
+            encoder.refresh()
         self.check_game_over()
 
     def set_new_starting_player(self):
@@ -176,39 +387,47 @@ class GameEngine:
         # Check if the tile bag is empty and needs to be refilled with discarded tiles
         # This part depends on your TileBag implementation. 
         # For simplicity, assuming tile_bag automatically handles refills
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
+        supply_key = zobrist.central_factory_key(self.central_factory)
         self.central_factory.clear()  # Clear the central factory for the new round
         self.central_factory.add_starting_player_tile()  # Add the starting player tile to the central factory
+        supply_key -= zobrist.central_factory_key(self.central_factory)
         for factory in self.factories:
+            supply_key += zobrist.factory_key(factory)
             factory.add_tiles(self.tile_bag.draw_tiles(4))
+            supply_key -= zobrist.factory_key(factory)
+        self.hash = (self.hash - supply_key) & zobrist.MASK
+        if timed:
+            profiler.add("refill_factories", perf_counter() - start_time)
 
     def print_final_scores(self):
         """Print the final scores of all players."""
-        if self.print_enabled:
-            print(f"\n-------------------------------------\nFINAL SCORES\n-------------------------------------")
-            for player in self.players:
-                print(f"{player.name}: {player.score} points")
-        
+        print(f"\n-------------------------------------\nFINAL SCORES\n-------------------------------------")
+        for player in self.players:
+            print(f"{player.name}: {player.score} points")
+
         # Determine the winner (could be multiple in case of a tie)
         highest_score = max(player.score for player in self.players)
         winners = [player.name for player in self.players if player.score == highest_score]
-        if self.print_enabled:
-            if len(winners) > 1:
-                print(f"Tie between: {', '.join(winners)}")
-            else:
-                print(f"Winner: {winners[0]}")
+        if len(winners) > 1:
+            print(f"Tie between: {', '.join(winners)}")
+        else:
+            print(f"Winner: {winners[0]}")
 
     def count_tiles_in_game(self):
         """Count the number of tiles in the factories, central factory, tile bag, and players' boards."""
-        factory_tile_count = sum(len(factory.tiles) for factory in self.factories)
+        factory_tile_count = sum(factory.tile_count for factory in self.factories)
         print(f"Factory tile count (excluding StartingPlayerTile): {factory_tile_count}")
 
-        central_factory_tile_count = len([tile for tile in self.central_factory.tiles if not isinstance(tile, StartingPlayerTile)])
+        central_factory_tile_count = self.central_factory.tile_count
         print(f"Central factory tile count (excluding StartingPlayerTile): {central_factory_tile_count}")
 
-        tile_bag_tile_count = len(self.tile_bag.tiles)
+        tile_bag_tile_count = self.tile_bag.tile_count
         print(f"Tile bag tile count: {tile_bag_tile_count}")
 
-        box_lid_tile_count = len(self.box_lid.tiles)
+        box_lid_tile_count = self.box_lid.tile_count
         print(f"Box lid tile count: {box_lid_tile_count}")
 
         players_tile_count = sum(player.board.count_placed_tiles() for player in self.players)
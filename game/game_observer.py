@@ -0,0 +1,77 @@
+from enums.tile_color import TILE_COLORS
+
+
+class GameObserver:
+    """
+    Receives the events of a GameEngine it is attached to with game_engine.observers.append(observer).
+    Every method does nothing here, subclasses override the events they care about. The engine
+    only loops over its observers, so a game without observers pays nothing for them.
+
+    Moves played through make_move and unmake_move during a search are not reported, searches
+    detach the observers while they play.
+    """
+
+    def on_round_start(self, game_engine):
+        pass
+
+    def on_turn_start(self, game_engine, player):
+        pass
+
+    def on_move_applied(self, game_engine, player_index, factory_index, color_index, pattern_line_index, tile_count,
+                        starting_player_tile):
+        """starting_player_tile is True when the move took the starting player tile from the central factory."""
+        pass
+
+    def on_round_end(self, game_engine):
+        """Called when the last tile of the round was taken, before the tiles move to the walls."""
+        pass
+
+    def on_scoring(self, game_engine, player_index, score):
+        """Called for every player after their tiles moved to the wall, score being what they scored this round."""
+        pass
+
+    def on_game_end(self, game_engine):
+        pass
+
+
+class ConsolePrinter(GameObserver):
+    """Prints the course of the game, what GameEngine printed with print_enabled."""
+
+    def __init__(self, print_network_input=True):
+        self.print_network_input = print_network_input
+
+    def on_round_start(self, game_engine):
+        if game_engine.round_number == 1:
+            print("Starting the game...")
+        print(f"\n-------------------------------------\nRound {game_engine.round_number}\n-------------------------------------")
+
+    def on_turn_start(self, game_engine, player):
+        if self.print_network_input:
+            network_input = game_engine.neural_network_interface.game_state_to_network_input(game_engine)
+            print(network_input)
+            print(len(network_input))
+        print(f"\n-------------------------------------\n{player.name}'s turn\n-------------------------------------")
+        game_engine.print_game_state()
+
+    def on_move_applied(self, game_engine, player_index, factory_index, color_index, pattern_line_index, tile_count,
+                        starting_player_tile):
+        if starting_player_tile:
+            print("Starting player marker taken!")
+        print(f"{game_engine.players[player_index].name} placed {tile_count} {TILE_COLORS[color_index].name} tiles "
+              f"in pattern line {pattern_line_index + 1}.")
+
+    def on_round_end(self, game_engine):
+        print("\n-------------------------------------\nEND OF ROUND\n-------------------------------------")
+        for player in game_engine.players:
+            print(f"\n{player.name} board before moving, but after last move:")
+            player.board.print_board()
+        print("\n-------------------------------------\nSCORING AND MOVING TO WALL\n-------------------------------------")
+
+    def on_scoring(self, game_engine, player_index, score):
+        player = game_engine.players[player_index]
+        print(f"\n{player.name} scored {score} points this round.")
+        print(f"{player.name} board after moving:")
+        player.board.print_board()
+
+    def on_game_end(self, game_engine):
+        game_engine.print_final_scores()
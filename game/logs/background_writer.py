@@ -0,0 +1,99 @@
+import json
+import time
+import queue
+import threading
+
+# Bytes buffered per open file between flushes
+FILE_BUFFER_SIZE = 1 << 20
+
+
+class BackgroundWriter:
+    """
+    Appends text to files on a background thread. write only puts the text on an unbounded queue,
+    so the caller never waits for the disk, and write_json leaves even the serialization to the
+    thread. The thread drains the queue in batches, keeps the files open and flushes them every
+    flush_interval seconds. close writes out everything still queued.
+
+    A failed write or serialization stops the writing: the error is kept in error and raised from the
+    next write or from close, and the records queued after it are dropped.
+    """
+
+    def __init__(self, flush_interval=1.0):
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, path, text):
+        self.raise_error()
+        self.queue.put((path, text))
+
+    def write_json(self, path, record):
+        """Append record as one line of JSON. The record must not change after it was passed in."""
+        self.raise_error()
+        self.queue.put((path, record))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("Writing in the background failed") from self.error
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            # Take whatever else is already queued, so a burst of records costs one pass
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = False
+            for record in batch:
+                if record is None:
+                    stopping = True
+                    continue
+                if self.error is not None:
+                    continue
+                path, content = record
+                try:
+                    if not isinstance(content, str):
+                        content = json.dumps(content, separators=(",", ":")) + "\n"
+                    self.file(path).write(content)
+                except Exception as error:
+                    self.error = error
+
+            if stopping:
+                for f in self.files.values():
+                    try:
+                        f.close()
+                    except Exception as error:
+                        self.error = self.error or error
+                self.files.clear()
+                return
+            if time.monotonic() - last_flush >= self.flush_interval:
+                try:
+                    for f in self.files.values():
+                        f.flush()
+                except Exception as error:
+                    self.error = self.error or error
+                last_flush = time.monotonic()
+
+    def file(self, path):
+        f = self.files.get(path)
+        if f is None:
+            f = self.files[path] = open(path, "a", buffering=FILE_BUFFER_SIZE)
+        return f
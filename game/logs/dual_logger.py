@@ -0,0 +1,32 @@
+import sys
+from logs.background_writer import BackgroundWriter
+
+
+class DualLogger:
+    """
+    Stand-in for sys.stdout that writes to the console and mirrors everything to a file. The file
+    is written by a BackgroundWriter, so a slow disk doesn't hold up the prints.
+    """
+
+    def __init__(self, path, mode="w", flush_interval=1.0):
+        self.console = sys.stdout
+        self.path = path
+        # Truncate or create the file now, the writer only appends
+        open(path, mode).close()
+        self.writer = BackgroundWriter(flush_interval)
+
+    def write(self, text):
+        self.console.write(text)
+        self.writer.write(self.path, text)
+        return len(text)
+
+    def flush(self):
+        # The file is flushed by the writer on its own schedule
+        self.console.flush()
+
+    def close(self):
+        self.writer.close()
+
+    def __getattr__(self, name):
+        # encoding, isatty and the like come from the console
+        return getattr(self.console, name)
@@ -0,0 +1,83 @@
+import os
+import random
+import numpy as np
+from model.player import Player
+from model.move_tables import SOURCE_MASK_SOURCES
+from enums.tile_color import TILE_COLORS
+
+
+class UniformBlock:
+    """Uniform random numbers filled ahead of time, size decisions of three numbers at a time."""
+
+    def __init__(self, rng, size):
+        self.rng = rng
+        self.size = size * 3
+        self.values = []
+        self.position = self.size
+
+    def refill(self):
+        # A flat list of floats is faster to index one at a time than the array
+        self.values = self.rng.random(self.size).tolist()
+        self.position = 0
+
+    def reseed(self):
+        """A fresh generator from the OS, the numbers left in the block are dropped."""
+        self.rng = np.random.default_rng()
+        self.values = []
+        self.position = self.size
+
+
+# Unseeded players share one block, like RandomPlayer shares the random module, so short games
+# don't pay for a block each. A forked worker would inherit the parent's generator and play the same
+# moves as every other worker, so the child reseeds it; players made before the fork share the
+# reseeded block too.
+shared_block = UniformBlock(np.random.default_rng(), 4096)
+os.register_at_fork(after_in_child=shared_block.reseed)
+
+
+class FastRandomPlayer(Player):
+    """
+    RandomPlayer with the same choices, a uniformly random valid factory, then a random color there,
+    then any of the 5 pattern lines, made with less work per decision. The valid factories and colors
+    are looked up in the precomputed tables instead of being collected on every turn.
+
+    Unseeded players take the three numbers of every decision from the shared block of NumPy
+    uniforms. A seeded player draws them from its own random.Random, which is as cheap to make as
+    RandomPlayer's; a NumPy generator and a block of its own cost more than a whole short game.
+    """
+
+    def __init__(self, name, seed=None):
+        super().__init__(name)
+        self.rng = random.Random(seed) if seed is not None else None
+
+    def make_decision(self):
+        if self.rng is None:
+            block = shared_block
+            position = block.position
+            if position == block.size:
+                block.refill()
+                position = 0
+            block.position = position + 3
+            source_uniform, color_uniform, pattern_line_uniform = block.values[position:position + 3]
+        else:
+            uniform = self.rng.random
+            source_uniform, color_uniform, pattern_line_uniform = uniform(), uniform(), uniform()
+
+        game_engine = self.game_engine
+        central_factory = game_engine.central_factory
+        source_mask = 1 if central_factory.tile_count else 0
+        bit = 2
+        for factory in game_engine.factories:
+            if factory.tile_count:
+                source_mask |= bit
+            bit <<= 1
+        valid_factories = SOURCE_MASK_SOURCES[source_mask]
+        if not valid_factories:
+            print("No valid factories to select from.")
+            return None, None, None
+
+        factory_index = valid_factories[int(source_uniform * len(valid_factories))]
+        selected_factory = central_factory if factory_index == -1 else game_engine.factories[factory_index]
+        available_colors = selected_factory.colors()
+        color_index = available_colors[int(color_uniform * len(available_colors))]
+        return factory_index, TILE_COLORS[color_index], int(pattern_line_uniform * 5)
@@ -0,0 +1,226 @@
+import math
+import random
+import time
+import numpy as np
+from model.player import Player
+from model.player_board import WALL_BITS
+from model.move_tables import MOVE_DECODING, encode_move
+from neural_network_interface import NeuralNetworkInterface
+from enums.tile_color import TILE_COLORS
+
+
+class SearchNode:
+    """Statistics of one game state, shared by every path that reaches it."""
+    __slots__ = ("moves", "priors", "visits", "move_visits", "move_values")
+
+    def __init__(self, moves, priors):
+        self.moves = moves
+        self.priors = priors
+        self.visits = 0
+        self.move_visits = [0] * len(moves)
+        self.move_values = [0.0] * len(moves)
+
+
+class MCTSPlayer(Player):
+    """
+    Monte Carlo Tree Search over the moves of the current round.
+
+    The tree is a transposition table keyed by game state, so positions reached through different
+    move orders share their statistics, and the table is kept between turns so the subtree of the
+    actual game continues to be used. Each playout descends the tree with UCT, plays the rest of the
+    round with the rollout policy and scores the round. When rollout_rounds is above 0 the playout
+    continues into later rounds; the factories are refilled from the bag at random on every
+    playout, which determinizes the hidden bag draws. Those draws, the move order of new nodes and
+    the random rollouts all come from the player's own generator, seeded with seed, so the search
+    never advances the game's random stream.
+
+    A NEAT network can guide the search, as a rollout policy (rollout_network) and/or as a prior on
+    the moves (prior_network). It is fed the same inputs as NeuralNetworkPlayer, seen from the
+    player to move.
+    """
+
+    def __init__(self, name, playouts=200, time_limit=None, exploration=1.4, rollout_rounds=0,
+                 rollout_network=None, prior_network=None, max_table_size=200000, seed=None):
+        super().__init__(name)
+        self.rng = random.Random(seed)
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.rollout_rounds = rollout_rounds
+        self.rollout_network = rollout_network
+        self.prior_network = prior_network
+        self.max_table_size = max_table_size
+        self.nn_interface = NeuralNetworkInterface()
+        self.table = {}
+        self.table_owner = None
+
+    def make_decision(self):
+        move = self.search(self.game_engine)
+        factory_index, color_index, pattern_line_index = MOVE_DECODING[move]
+        return factory_index, TILE_COLORS[color_index], pattern_line_index
+
+    def search(self, game_engine):
+        """
+        Run playouts from the current position until the playout budget or the time limit runs out,
+        whichever comes first, and return the most visited move.
+        """
+        if self.table_owner is not game_engine or len(self.table) > self.max_table_size:
+            self.table = {}
+            self.table_owner = game_engine
+
+        # The playouts are not moves of the game, observers don't hear about them, and their deals
+        # are drawn from the player's generator instead of the game's
+        observers = game_engine.observers
+        game_rng = game_engine.rng
+        game_engine.observers = []
+        game_engine.rng = self.rng
+        root_state = game_engine.snapshot()
+        try:
+            root = self.get_node(game_engine, self.state_key(game_engine))
+
+            deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+            playouts = 0
+            while True:
+                self.playout(game_engine)
+                game_engine.restore(root_state)
+                playouts += 1
+                if self.playouts is not None and playouts >= self.playouts:
+                    break
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+        finally:
+            game_engine.restore(root_state)
+            game_engine.observers = observers
+            game_engine.rng = game_rng
+        best = max(range(len(root.moves)), key=lambda i: root.move_visits[i])
+        return root.moves[best]
+
+    def playout(self, game_engine):
+        path = []
+        while not game_engine.is_round_over():
+            key = self.state_key(game_engine)
+            node = self.table.get(key)
+            expanded = node is None
+            if expanded:
+                node = self.get_node(game_engine, key)
+            move_index = self.select(node)
+            path.append((node, move_index, game_engine.current_player_index))
+            game_engine.make_move(node.moves[move_index])
+            if expanded:
+                break
+
+        rewards = self.rollout(game_engine)
+        for node, move_index, player_index in path:
+            node.visits += 1
+            node.move_visits[move_index] += 1
+            node.move_values[move_index] += rewards[player_index]
+
+    def select(self, node):
+        """UCT, or PUCT when the node has priors from the network."""
+        log_visits = math.log(node.visits + 1)
+        sqrt_visits = math.sqrt(node.visits + 1)
+        best_index = 0
+        best_score = -math.inf
+        for i, visits in enumerate(node.move_visits):
+            if node.priors is None:
+                if not visits:
+                    return i
+                score = node.move_values[i] / visits + self.exploration * math.sqrt(log_visits / visits)
+            else:
+                mean = node.move_values[i] / visits if visits else 0.5
+                score = mean + self.exploration * node.priors[i] * sqrt_visits / (1 + visits)
+            if score > best_score:
+                best_score = score
+                best_index = i
+        return best_index
+
+    def get_node(self, game_engine, key):
+        node = self.table.get(key)
+        if node is None:
+            moves = self.candidate_moves(game_engine)
+            self.rng.shuffle(moves)
+            priors = self.move_priors(game_engine, moves) if self.prior_network is not None else None
+            node = SearchNode(moves, priors)
+            self.table[key] = node
+        return node
+
+    def state_key(self, game_engine):
+        return game_engine.state_key()
+
+    def candidate_moves(self, game_engine):
+        """
+        Legal moves without the duplicates: a pattern line that can't take the color sends every tile
+        to the floor, exactly like choosing the floor line, so only the floor line move is kept.
+        """
+        board = game_engine.players[game_engine.current_player_index].board
+        moves = []
+        for factory_index in game_engine.legal_sources():
+            for color_index in game_engine.legal_colors(factory_index):
+                first_move = encode_move(factory_index, color_index, 0)
+                for line in range(5):
+                    if (not board.wall_mask & WALL_BITS[line][color_index]
+                            and board.pattern_line_counts[line] <= line
+                            and board.pattern_line_colors[line] in (-1, color_index)):
+                        moves.append(first_move + line)
+                moves.append(first_move + 5)
+        return moves
+
+    def rollout(self, game_engine):
+        """Finish the round (and rollout_rounds more), then return a reward in [0, 1] for every player."""
+        rounds_left = self.rollout_rounds
+        while True:
+            while not game_engine.is_round_over():
+                game_engine.make_move(self.rollout_move(game_engine))
+            if not rounds_left:
+                break
+            game_engine.end_round()
+            if game_engine.game_over:
+                return self.rewards([player.score for player in game_engine.players])
+            rounds_left -= 1
+
+        # Score the last round without refilling the factories
+        scores = [player.score + player.move_tiles_to_wall_and_score() for player in game_engine.players]
+        return self.rewards(scores)
+
+    def rewards(self, scores):
+        # Each player is rewarded for its lead over the best of the others
+        rewards = []
+        for i, score in enumerate(scores):
+            best_other = max(other for j, other in enumerate(scores) if j != i)
+            rewards.append(1 / (1 + math.exp((best_other - score) / 5)))
+        return rewards
+
+    def rollout_move(self, game_engine):
+        if self.rollout_network is None:
+            return self.rng.choice(self.candidate_moves(game_engine))
+
+        # Same decoding as NeuralNetworkPlayer
+        output = self.rollout_network.activate(self.network_input(game_engine))
+        valid_factories = [factory_index + 1 for factory_index in game_engine.legal_sources()]
+        factory_index = next(p for p in np.argsort(output[:10])[::-1] if p in valid_factories) - 1
+        available_colors = game_engine.legal_colors(factory_index)
+        color_index = next(p for p in np.argsort(output[10:15])[::-1] if p in available_colors)
+        return encode_move(factory_index, color_index, int(np.argmax(output[15:21])))
+
+    def move_priors(self, game_engine, moves):
+        """Prior of each move as the product of the network's softmaxed factory, color and line outputs."""
+        output = np.asarray(self.prior_network.activate(self.network_input(game_engine)), dtype=np.float64)
+        factory_preferences = softmax(output[:10])
+        color_preferences = softmax(output[10:15])
+        line_preferences = softmax(output[15:21])
+        priors = [factory_preferences[factory_index + 1] * color_preferences[color_index] * line_preferences[pattern_line_index]
+                  for factory_index, color_index, pattern_line_index in (MOVE_DECODING[move] for move in moves)]
+        total = sum(priors)
+        return [prior / total for prior in priors]
+
+    def network_input(self, game_engine):
+        # The network was trained on its own board followed by the factories, see simplest_input
+        board = game_engine.players[game_engine.current_player_index].board
+        network_input = self.nn_interface.player_board_to_network_input(board)
+        network_input.extend(self.nn_interface.factories_to_network_input(game_engine.factories))
+        return network_input
+
+
+def softmax(values):
+    exponents = np.exp(values - values.max())
+    return exponents / exponents.sum()
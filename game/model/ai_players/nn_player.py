@@ -1,8 +1,8 @@
 import random
-from model.starting_player_tile import StartingPlayerTile
 from model.player import Player
-from neural_network_interface import NeuralNetworkInterface
-from enums.tile_color import TileColor
+from neural_network_interface import NeuralNetworkInterface, IncrementalEncoder
+from enums.tile_color import TILE_COLORS
+from phase_profiler import profiler, perf_counter
 import numpy as np
 
 class NeuralNetworkPlayer(Player):
@@ -11,50 +11,60 @@ class NeuralNetworkPlayer(Player):
         super().__init__(name)
         self.neural_network = neural_network
         self.nn_interface = NeuralNetworkInterface()
+        self.encoder = None
 
     def make_decision(self):
         output = self.get_output()
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
         factory_index = self.select_factory(output)
-        selected_factory = self.game_engine.central_factory if factory_index == -1 else self.game_engine.factories[factory_index]
-        selected_color = self.select_color(selected_factory, output)
+        selected_color = self.select_color(factory_index, output)
         pattern_line_index = self.select_pattern_line(output)
+        if timed:
+            profiler.add("decision.decode", perf_counter() - start_time)
 
         return factory_index, selected_color, pattern_line_index
 
     def get_output(self):
-        input = self.nn_interface.simplest_input(self.game_engine)
-        return self.neural_network.activate(input)
+        # The encoder follows the game through the engine's move hooks, so only the changed slots are re-encoded
+        if self.encoder is None or self.encoder.game_engine is not self.game_engine:
+            self.encoder = IncrementalEncoder(self.game_engine, layout="simplest")
+        timed = profiler.enabled
+        if timed:
+            start_time = perf_counter()
+        input = self.encoder.network_input()
+        if not hasattr(self.neural_network, "activate_batch"):
+            # CompiledNetwork reads the encoder's buffer as it is, neat.nn.FeedForwardNetwork wants a list
+            input = input.tolist()
+        if timed:
+            encoded_time = perf_counter()
+        output = self.neural_network.activate(input)
+        if timed:
+            profiler.add("decision.encode", encoded_time - start_time)
+            profiler.add("decision.activate", perf_counter() - encoded_time)
+        return output
 
     def select_factory(self, output):
-        valid_factories = [i for i, factory in enumerate(self.game_engine.factories, start=1) if factory.tiles]
-        # Including central factory as a valid option if it has tiles other than the starting player tile
-        central_has_valid_tiles = any(not isinstance(tile, StartingPlayerTile) for tile in self.game_engine.central_factory.tiles)
-        if central_has_valid_tiles:
-            valid_factories.append(0)  # Using '9' to represent the central factory
+        # Output 0 stands for the central factory (factory index -1), outputs 1-9 for the factory displays
+        valid_factories = [factory_index + 1 for factory_index in self.game_engine.legal_sources()]
         
-        # print("All factories: ", self.game_engine.factories)
-        # print(f"Valid factories: {valid_factories}")
-        # print("Factory preferences: ", output[:10])
-        # print("Factory preferences sorted: ", np.argsort(output[:10])[::-1])
         factory_preferences = np.argsort(output[:10])[::-1]  # Sort indices by preference, descending
         for preference in factory_preferences:
-            # print(f"Preference: {preference}")
             if preference in valid_factories:
                 return preference - 1  # Adjust by -1 to align with list indexing
         return None
     
-    def select_color(self, selected_factory, output):
+    def select_color(self, factory_index, output):
         # Assuming output[10:15] corresponds to color preferences
         color_preferences = np.argsort(output[10:15])[::-1]  # Sort color indices based on preference, descending
 
-        # Map neural network color output indices back to TileColor enum
-        color_mapping = list(TileColor)
-        available_colors = {tile.color for tile in selected_factory.tiles if not isinstance(tile, StartingPlayerTile)}
+        available_colors = self.game_engine.legal_colors(factory_index)
 
         for preference_index in color_preferences:
-            preferred_color = color_mapping[preference_index]
-            if preferred_color in available_colors:
-                return preferred_color  # Return the valid, preferred color based on network output
+            if preference_index in available_colors:
+                # Map neural network color output indices back to TileColor enum
+                return TILE_COLORS[preference_index]  # Return the valid, preferred color based on network output
         return None
     
     def select_pattern_line(self, output):
@@ -1,13 +1,25 @@
+from model.tile import Tile
+from enums.tile_color import TILE_COLORS
+
 #TODO: Add all the remaining tiles into the boxlid
 class BoxLid:
     def __init__(self):
-        self.tiles = []
+        # Tiles of one color are interchangeable, so the lid only keeps a count per color
+        self.counts = [0] * 5
+        self.tile_count = 0
+
+    @property
+    def tiles(self):
+        """Tile objects in the box lid, grouped by color. Meant for printing only."""
+        return [Tile(TILE_COLORS[color_index]) for color_index, count in enumerate(self.counts) for _ in range(count)]
 
-    def add_tiles(self, tiles):
-        """Add tiles to the box lid."""
-        self.tiles.extend(tiles)
+    def add_tiles(self, color_index, tile_count):
+        """Add tiles of one color to the box lid."""
+        self.counts[color_index] += tile_count
+        self.tile_count += tile_count
 
     def empty_into_tile_bag(self, tile_bag):
-        """Empty all tiles from the box lid into the tile bag and shuffle."""
-        tile_bag.add_tiles(self.tiles)
-        self.tiles = []
\ No newline at end of file
+        """Empty all tiles from the box lid into the tile bag."""
+        tile_bag.add_tiles(self.counts)
+        self.counts = [0] * 5
+        self.tile_count = 0
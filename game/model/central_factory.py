@@ -6,14 +6,29 @@ class CentralFactory(Factory):
     def __init__(self):
         super().__init__()
         self.starting_player_marker_taken = False
-        self.tiles.append(StartingPlayerTile())
+        self.has_starting_player_tile = True
 
-    
-    def remove_and_return_tiles_of_color(self, tile_color):
+    @property
+    def tiles(self):
+        """Tile objects in the center, starting player tile first. Meant for printing and human play only."""
+        tiles = super().tiles
+        if self.has_starting_player_tile:
+            tiles.insert(0, StartingPlayerTile())
+        return tiles
+
+    def remove_and_return_tiles_of_color(self, color_index):
         if not self.starting_player_marker_taken:
             self.starting_player_marker_taken = True
-        return super().remove_and_return_tiles_of_color(tile_color)
+        return super().remove_and_return_tiles_of_color(color_index)
+
+    def take_starting_player_tile(self):
+        self.has_starting_player_tile = False
+        self.starting_player_marker_taken = True
     
     def add_starting_player_tile(self):
-        self.tiles.append(StartingPlayerTile())
-        self.starting_player_marker_taken = False
\ No newline at end of file
+        self.has_starting_player_tile = True
+        self.starting_player_marker_taken = False
+
+    def clear(self):
+        super().clear()
+        self.has_starting_player_tile = False
@@ -1,21 +1,55 @@
+from model.tile import Tile
+from enums.tile_color import TILE_COLORS
+from model.move_tables import FACTORY_CONTENT_INDEX, FACTORY_CONTENT_COLORS, COLOR_MASK_COLORS, color_mask
+
 class Factory:
     def __init__(self):
-        self.tiles = []
+        # Tiles on the display as a count per color
+        self.counts = [0] * 5
+        self.tile_count = 0
+        self.content_index = -1  # Index into FACTORY_CONTENTS while the display holds exactly 4 tiles
+
+    @property
+    def tiles(self):
+        """Tile objects on the display, grouped by color. Meant for printing and human play only."""
+        return [Tile(TILE_COLORS[color_index]) for color_index, count in enumerate(self.counts) for _ in range(count)]
+
+    def add_tiles(self, counts):
+        """Add tiles given as a count per color."""
+        for color_index, count in enumerate(counts):
+            self.counts[color_index] += count
+        self.tile_count += sum(counts)
+        self.content_index = FACTORY_CONTENT_INDEX[tuple(self.counts)] if self.tile_count == 4 else -1
+
+    def set_counts(self, counts):
+        """Replace the display contents, used when rolling the game state back."""
+        self.counts = counts
+        self.tile_count = sum(counts)
+        self.content_index = FACTORY_CONTENT_INDEX[tuple(counts)] if self.tile_count == 4 else -1
 
-    def add_tiles(self, tiles):
-        self.tiles.extend(tiles)
+    def colors(self):
+        """Indices of the colors on the display, looked up in the precomputed tables."""
+        if self.content_index != -1:
+            return FACTORY_CONTENT_COLORS[self.content_index]
+        return COLOR_MASK_COLORS[color_mask(self.counts)]
 
-    def remove_and_return_tiles_of_color(self, tile_color):
-        """Remove and return all tiles of a specific color, leaving the rest."""
-        selected_tiles = [tile for tile in self.tiles if tile.color == tile_color]
-        self.tiles = [tile for tile in self.tiles if tile.color != tile_color]
-        return selected_tiles
+    def remove_and_return_tiles_of_color(self, color_index):
+        """Remove all tiles of a specific color, leaving the rest, and return how many were removed."""
+        tile_count = self.counts[color_index]
+        self.counts[color_index] = 0
+        self.tile_count -= tile_count
+        self.content_index = -1
+        return tile_count
     
     def get_and_clear_remaining_tiles(self):
-        """Return and clear all remaining tiles."""
-        remaining_tiles = self.tiles[:]
-        self.tiles = []
-        return remaining_tiles
+        """Return the remaining tiles as a count per color and clear the display."""
+        remaining_counts = self.counts
+        self.counts = [0] * 5
+        self.tile_count = 0
+        self.content_index = -1
+        return remaining_counts
     
     def clear(self):
-        self.tiles = []
\ No newline at end of file
+        self.counts = [0] * 5
+        self.tile_count = 0
+        self.content_index = -1
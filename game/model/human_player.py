@@ -1,24 +1,23 @@
 from model.player import Player
-from model.starting_player_tile import StartingPlayerTile
-from enums.tile_color import TileColor
+from enums.tile_color import TileColor, TILE_COLORS
 
 class HumanPlayer(Player):
 
     def make_decision(self):
         factory_index = self.select_factory()
-        selected_factory = self.game_engine.central_factory if factory_index == -1 else self.game_engine.factories[factory_index]
-        selected_color = self.select_color(selected_factory)
+        selected_color = self.select_color(factory_index)
         pattern_line_index = self.select_pattern_line()
 
         return factory_index, selected_color, pattern_line_index
 
     def select_factory(self):
-        # Determine if the central factory has tiles other than just the starting player tile
-        central_has_valid_tiles = any(not isinstance(tile, StartingPlayerTile) for tile in self.game_engine.central_factory.tiles)
+        # Factories with colored tiles, -1 being the central factory
+        legal_sources = self.game_engine.legal_sources()
+        central_has_valid_tiles = -1 in legal_sources
 
         # List non-empty factories and include the central factory if it has valid tiles
-        non_empty_factories = [(i, factory) for i, factory in enumerate(self.game_engine.factories, start=1) if factory.tiles]
-        non_empty_factory_indices = [str(i) for i, factory in non_empty_factories]
+        non_empty_factories = [factory_index for factory_index in legal_sources if factory_index != -1]
+        non_empty_factory_indices = [str(factory_index + 1) for factory_index in non_empty_factories]
 
         central_factory_option = ""
         if central_has_valid_tiles:  # Only add central factory as an option if it has valid tiles
@@ -42,8 +41,8 @@ class HumanPlayer(Player):
             except ValueError:
                 print("Invalid input. Please enter a valid option.")
 
-    def select_color(self, selected_factory):
-        available_colors = {tile.color.name.upper() for tile in selected_factory.tiles if not isinstance(tile, StartingPlayerTile)}
+    def select_color(self, factory_index):
+        available_colors = {TILE_COLORS[color_index].name.upper() for color_index in self.game_engine.legal_colors(factory_index)}
         print(f"Available colors: {', '.join(sorted(available_colors))}")
         while True:
             color_input = input("Choose a color from the available options: ").upper()
@@ -0,0 +1,67 @@
+import numpy as np
+from itertools import combinations_with_replacement
+
+# A move is (source, color, pattern line) packed into one small integer. Sources follow the network's
+# factory outputs: 0 is the central factory and 1-9 are the factory displays, so a GameEngine
+# factory_index maps to source factory_index + 1. Pattern line 5 is the floor line.
+SOURCE_COUNT = 10
+COLOR_COUNT = 5
+PATTERN_LINE_COUNT = 6
+MOVES_PER_SOURCE = COLOR_COUNT * PATTERN_LINE_COUNT
+MOVE_COUNT = SOURCE_COUNT * MOVES_PER_SOURCE
+
+
+def encode_move(factory_index, color_index, pattern_line_index):
+    """Pack a move given in GameEngine terms (factory_index -1 is the central factory)."""
+    return ((factory_index + 1) * COLOR_COUNT + color_index) * PATTERN_LINE_COUNT + pattern_line_index
+
+
+def decode_move(move):
+    """Unpack a move into (factory_index, color_index, pattern_line_index)."""
+    return MOVE_DECODING[move]
+
+
+MOVE_DECODING = [(source - 1, color_index, pattern_line_index)
+                 for source in range(SOURCE_COUNT)
+                 for color_index in range(COLOR_COUNT)
+                 for pattern_line_index in range(PATTERN_LINE_COUNT)]
+
+
+def _color_moves(colors):
+    return np.array([color_index * PATTERN_LINE_COUNT + pattern_line_index
+                     for color_index in colors
+                     for pattern_line_index in range(PATTERN_LINE_COUNT)], dtype=np.int16)
+
+
+# Every multiset of 4 tiles a factory display can be dealt (70 of them), as count tuples
+FACTORY_CONTENTS = []
+for tiles in combinations_with_replacement(range(COLOR_COUNT), 4):
+    FACTORY_CONTENTS.append(tuple(tiles.count(color_index) for color_index in range(COLOR_COUNT)))
+FACTORY_CONTENT_INDEX = {counts: index for index, counts in enumerate(FACTORY_CONTENTS)}
+
+# Colors present in each factory content and its legal moves, for every display position
+FACTORY_CONTENT_COLORS = [tuple(color_index for color_index, count in enumerate(counts) if count)
+                          for counts in FACTORY_CONTENTS]
+FACTORY_CONTENT_MOVES = [[_color_moves(colors) + (factory_index + 1) * MOVES_PER_SOURCE for colors in FACTORY_CONTENT_COLORS]
+                         for factory_index in range(SOURCE_COUNT - 1)]
+
+# The central factory, or a display that was dealt fewer than 4 tiles, is looked up by its 5-bit color mask
+COLOR_MASK_COLORS = [tuple(color_index for color_index in range(COLOR_COUNT) if color_mask >> color_index & 1)
+                     for color_mask in range(1 << COLOR_COUNT)]
+COLOR_MASK_MOVES = [[_color_moves(colors) + source * MOVES_PER_SOURCE for colors in COLOR_MASK_COLORS]
+                    for source in range(SOURCE_COUNT)]
+
+NO_MOVES = np.zeros(0, dtype=np.int16)
+
+# Factory indices (-1 being the central factory) of the sources with tiles, by the 10-bit mask of
+# non-empty sources where bit 0 is the central factory. Same order as GameEngine.legal_sources
+SOURCE_MASK_SOURCES = [tuple(source - 1 for source in range(SOURCE_COUNT) if source_mask >> source & 1)
+                       for source_mask in range(1 << SOURCE_COUNT)]
+
+
+def color_mask(counts):
+    mask = 0
+    for color_index, count in enumerate(counts):
+        if count:
+            mask |= 1 << color_index
+    return mask
@@ -20,7 +20,7 @@ class Player:
     def select_factory(self):
         pass
 
-    def select_color(self, factory):
+    def select_color(self, factory_index):
         pass
 
     def select_pattern_line(self):
@@ -1,12 +1,25 @@
 from model.tile import Tile
 from model.starting_player_tile import StartingPlayerTile
-from enums.tile_color import TileColor
+from enums.tile_color import TileColor, TILE_COLORS, TILE_COLOR_INDEX
+from model import wall_scoring
+
+FLOOR_LINE_CAPACITY = 7
+
+# Wall cell (row, color) -> bit in the 25-bit wall mask. Bit row * 5 + column is set when the cell is tiled,
+# and a color sits one column further right on every row (column = (color + row) % 5).
+WALL_COLUMNS = [[(color + row) % 5 for color in range(5)] for row in range(5)]
+WALL_BITS = [[1 << (row * 5 + WALL_COLUMNS[row][color]) for color in range(5)] for row in range(5)]
+
 
 class PlayerBoard:
     def __init__(self, player):
-        self.pattern_lines = [[None, None, None, None, None] for _ in range(5)]  # 5 pattern lines, up to 5 tiles each
-        self.wall = [[None for _ in range(5)] for _ in range(5)]  # 5x5 grid, initially empty
-        self.floor_line = []  # Will hold tiles that overflow or are not placed
+        # Compact board state used by the engine, the network interface and the players
+        self.wall_mask = 0  # 25-bit mask, bit row * 5 + column is set when that cell holds a tile
+        self.pattern_line_colors = [-1] * 5  # Color index of each pattern line, -1 when empty
+        self.pattern_line_counts = [0] * 5  # Number of tiles in each pattern line
+        self.floor_count = 0  # Colored tiles on the floor line (the starting player tile is tracked separately)
+        self.floor_color_counts = [0] * 5  # Colors of the floor tiles, needed when they go back to the box lid
+        self.has_first_player_tile = False
         self.player = player
 
         # Define the fixed color pattern on the wall
@@ -18,71 +31,71 @@ class PlayerBoard:
             [TileColor.YELLOW, TileColor.RED, TileColor.BLACK, TileColor.WHITE, TileColor.BLUE]
         ]
 
+    # Object views of the compact state, rebuilt on access. Meant for printing and human play only.
+
+    @property
+    def pattern_lines(self):
+        """5 pattern lines of 5 slots each, holding Tile objects or None."""
+        lines = []
+        for color_index, count in zip(self.pattern_line_colors, self.pattern_line_counts):
+            tiles = [Tile(TILE_COLORS[color_index]) for _ in range(count)]
+            lines.append(tiles + [None] * (5 - count))
+        return lines
+
+    @property
+    def wall(self):
+        """5x5 grid of Tile objects or None."""
+        return [[Tile(self.wall_pattern[row][column]) if self.wall_mask >> (row * 5 + column) & 1 else None
+                 for column in range(5)]
+                for row in range(5)]
+
+    @property
+    def floor_line(self):
+        """Tiles on the floor line, starting player tile first."""
+        floor_line = [StartingPlayerTile()] if self.has_first_player_tile else []
+        for color_index, count in enumerate(self.floor_color_counts):
+            floor_line.extend(Tile(TILE_COLORS[color_index]) for _ in range(count))
+        return floor_line
+
+    def floor_line_length(self):
+        return self.floor_count + self.has_first_player_tile
+
     def place_tile_in_pattern_line(self, tile_color, pattern_line_index, tile_count):
         """
         Attempt to place tiles in a specified pattern line.
-        
+
         :param tile_color: The color of the tiles being placed.
-        :param pattern_line_index: The index of the pattern line (0-4).
+        :param pattern_line_index: The index of the pattern line (0-4), 5 or more sends the tiles to the floor line.
         :param tile_count: The number of tiles being placed.
         """
-        if pattern_line_index < 5:
-            if self.is_color_on_wall(tile_color, pattern_line_index):
-                # Redirect the tiles to the floor line
-                self.add_tiles_to_floor_line([Tile(tile_color)] * tile_count)
-            else:
-                pattern_line = self.pattern_lines[pattern_line_index]
-                line_capacity = pattern_line_index + 1  # The capacity matches the row index + 1
-                existing_tiles = sum(1 for tile in pattern_line if tile is not None)
-                space_left = line_capacity - existing_tiles
-
-                # Calculate how many tiles can be actually placed in the pattern line
+        self.place_tiles(TILE_COLOR_INDEX[tile_color], pattern_line_index, tile_count)
+
+    def place_tiles(self, color_index, pattern_line_index, tile_count):
+        """Same as place_tile_in_pattern_line, but takes the color as an index into TileColor."""
+        if pattern_line_index < 5 and not self.wall_mask & WALL_BITS[pattern_line_index][color_index]:
+            line_color = self.pattern_line_colors[pattern_line_index]
+            if line_color == -1 or line_color == color_index:
+                # Place as many tiles as possible into the pattern line, the capacity matches the row index + 1
+                space_left = pattern_line_index + 1 - self.pattern_line_counts[pattern_line_index]
                 tiles_to_place = min(space_left, tile_count)
+                self.pattern_line_colors[pattern_line_index] = color_index
+                self.pattern_line_counts[pattern_line_index] += tiles_to_place
+                tile_count -= tiles_to_place
 
-                if existing_tiles == 0 or (pattern_line[0] is not None and pattern_line[0].color == tile_color):
-                    # Place as many tiles as possible into the pattern line
-                    for i in range(existing_tiles, existing_tiles + tiles_to_place):
-                        pattern_line[i] = Tile(tile_color)
-                    # Any excess tiles go to the floor line
-                    excess_tiles = tile_count - tiles_to_place
-                    if excess_tiles > 0:
-                        self.add_tiles_to_floor_line([Tile(tile_color)] * excess_tiles)
-                else:
-                    # If the pattern line has tiles of a different color, use the new method to add all tiles to the floor line
-                    self.add_tiles_to_floor_line([Tile(tile_color)] * tile_count)
-        else:
-            self.add_tiles_to_floor_line([Tile(tile_color)] * tile_count)
-
-            
+        # Whatever did not fit (wrong color, color already on the wall, full line or floor selected) goes to the floor line
+        if tile_count > 0:
+            self.add_tiles_to_floor_line(color_index, tile_count)
 
     def is_color_on_wall(self, tile_color, pattern_line_index):
         """
         Check if a tile of the specified color is already on the wall in the row
         corresponding to the pattern line index.
         """
-        # This method assumes the wall_pattern defines the placement rules for tiles
-        # and that self.wall[row][col] is None if no tile is placed at that position.
-        color_position = self.wall_pattern[pattern_line_index].index(tile_color)
-        return self.wall[pattern_line_index][color_position] is not None
+        return bool(self.wall_mask & WALL_BITS[pattern_line_index][TILE_COLOR_INDEX[tile_color]])
 
     def place_starting_player_tile_on_floor_line(self):
         """Place the starting player tile on the floor line."""
-        self.floor_line.append(StartingPlayerTile())
-
-    # def move_tiles_to_wall(self):
-    #     """Move tiles from the pattern lines to the wall, based on the rules."""
-    #     for row_index, row in enumerate(self.pattern_lines):
-    #         if len(row) == row_index + 1:  # Check if the row is full
-    #             tile_color = row[0]
-    #             # Find the correct column based on the wall pattern
-    #             column_index = self.wall_pattern[row_index].index(tile_color)
-    #             if self.wall[row_index][column_index] is None:  # If space is empty
-    #                 self.player.fitness += 10
-    #                 self.wall[row_index][column_index] = tile_color
-    #                 self.pattern_lines[row_index] = []  # Clear the pattern line
-    #             else:
-    #                 # If the space on the wall is already filled, this should be handled as per game rules (e.g., move to floor line)
-    #                 pass
+        self.has_first_player_tile = True
 
     def print_board(self):
         self.print_pattern_lines()
@@ -114,30 +127,25 @@ class PlayerBoard:
 
 
     # Additional methods for scoring, handling the floor line, etc., can be added here.
-        
-    def add_tiles_to_floor_line(self, tiles):
+
+    def add_tiles_to_floor_line(self, color_index, tile_count):
         """
         Add tiles to the floor line, respecting the maximum capacity of 7 tiles.
         Excess tiles are added to the box lid.
-        
-        :param tiles: A list of Tile objects to be added to the floor line.
+
+        :param color_index: Index into TileColor of the tiles being added.
+        :param tile_count: The number of tiles being added.
         """
-        max_capacity = 7
-        # Calculate available space on the floor line
-        available_space = max_capacity - len(self.floor_line)
-
-        if available_space > 0:
-            # If there's space, add tiles up to the available space
-            tiles_to_add = tiles[:available_space]
-            self.floor_line.extend(tiles_to_add)
-            excess_tiles = tiles[available_space:]
-        else:
-            # If no space is available, all tiles are considered excess
-            excess_tiles = tiles
+        # Calculate available space on the floor line, the starting player tile takes a slot too
+        available_space = FLOOR_LINE_CAPACITY - self.floor_line_length()
+        tiles_to_add = min(max(available_space, 0), tile_count)
+        self.floor_count += tiles_to_add
+        self.floor_color_counts[color_index] += tiles_to_add
 
         # Add any excess tiles to the box lid
+        excess_tiles = tile_count - tiles_to_add
         if excess_tiles:
-            self.box_lid.add_tiles(excess_tiles)
+            self.box_lid.add_tiles(color_index, excess_tiles)
 
 
     def move_tiles_to_wall_and_score(self):
@@ -145,100 +153,72 @@ class PlayerBoard:
         Move tiles from completed pattern lines to the wall, score points, and move remaining tiles to the box lid.
         """
         score = 0
-        for row_index, pattern_line in enumerate(self.pattern_lines):
+        for row_index in range(5):
+            color_index = self.pattern_line_colors[row_index]
             # Identify completed pattern lines
-            if None not in pattern_line[:row_index + 1]:
-                # Assume the tile color is the same for all in the line, take the first one
-                tile_color = pattern_line[0].color if pattern_line[0] is not None else None
-                
-                if tile_color is not None:
-                    # Find the correct position on the wall based on the color pattern
-                    column_index = self.wall_pattern[row_index].index(tile_color)
-                    
-                    # Move one tile to the wall
-                    if self.wall[row_index][column_index] is None:  # Ensure the spot is empty
-                        self.wall[row_index][column_index] = Tile(tile_color)
-                        # Calculate score for this move
-                        score += self.calculate_score_for_tile(row_index, column_index)
-                    
-                    # Move the remaining tiles in the completed line to the box lid
-                    excess_tiles = [tile for tile in pattern_line if tile is not None][1:]  # Skip the first tile which was moved to the wall
-                    if excess_tiles:
-                        self.box_lid.add_tiles(excess_tiles)
-                
+            if color_index != -1 and self.pattern_line_counts[row_index] == row_index + 1:
+                # Move one tile to the wall, the spot is empty because placement checks the wall first
+                wall_bit = WALL_BITS[row_index][color_index]
+                if not self.wall_mask & wall_bit:
+                    self.wall_mask |= wall_bit
+                    score += self.calculate_score_for_tile(row_index, WALL_COLUMNS[row_index][color_index])
+
+                # Move the remaining tiles in the completed line to the box lid
+                if row_index:
+                    self.box_lid.add_tiles(color_index, row_index)
+
                 # Clear the pattern line after moving tiles to the wall and box lid
-                self.pattern_lines[row_index] = [None] * 5
+                self.pattern_line_colors[row_index] = -1
+                self.pattern_line_counts[row_index] = 0
 
         # Score the floor line and clear it
         score += self.score_floor_line()
-        tiles_to_box_lid = [tile for tile in self.floor_line if not isinstance(tile, StartingPlayerTile)]
-        self.box_lid.add_tiles(tiles_to_box_lid)
-        self.floor_line = []
+        for color_index, count in enumerate(self.floor_color_counts):
+            if count:
+                self.box_lid.add_tiles(color_index, count)
+        self.floor_count = 0
+        self.floor_color_counts = [0] * 5
+        self.has_first_player_tile = False
 
         # Return the total score for this round
         return score
-    
+
     def calculate_score_for_tile(self, row, column):
         """
         Calculate the score for placing a tile on the wall, considering adjacent tiles.
+        The tile must already be on the wall.
         """
-        score = 1  # Base score for placing a tile
-        
-        # Check horizontally
-        row_score = 1  # Start with 1 for the placed tile
-        # Check left
-        moving_col = column - 1
-        while moving_col >= 0 and self.wall[row][moving_col] is not None:
-            row_score += 1
-            moving_col -= 1
-        # Check right
-        moving_col = column + 1
-        while moving_col < 5 and self.wall[row][moving_col] is not None:
-            row_score += 1
-            moving_col += 1
-        if row_score > 1:  # If there are adjacent tiles horizontally, add to score
-            score += row_score - 1  # Subtract 1 because the tile itself was counted twice
-        
-        # Check vertically
-        column_score = 1  # Start with 1 for the placed tile
-        # Check up
-        moving_row = row - 1
-        while moving_row >= 0 and self.wall[moving_row][column] is not None:
-            column_score += 1
-            moving_row -= 1
-        # Check down
-        moving_row = row + 1
-        while moving_row < 5 and self.wall[moving_row][column] is not None:
-            column_score += 1
-            moving_row += 1
-        if column_score > 1:  # If there are adjacent tiles vertically, add to score
-            score += column_score - 1  # Subtract 1 for the same reason
-        
-        return score
+        return wall_scoring.placement_score(self.wall_mask, row, column)
+
+    def score_if_placed(self, row, color_index):
+        """Score a tile of the color would get on the wall in the given row right now, 0 if the cell is taken."""
+        return wall_scoring.score_if_placed(self.wall_mask, row, WALL_COLUMNS[row][color_index])
+
+    def end_game_bonus(self):
+        """Bonus points for complete rows, columns and colors on the wall."""
+        return wall_scoring.end_game_bonus(self.wall_mask)
     
     def score_floor_line(self):
         penalties = [1, 1, 2, 2, 2, 3, 3]  # Base penalties for the first 7 tiles
-        score = -sum(penalties[:len(self.floor_line)])  # Calculate penalties for up to the first 7 tiles
-        if len(self.floor_line) > 7:  # For more than 7 tiles, each additional tile incurs -3 points
-            score -= (len(self.floor_line) - 7) * 3
+        floor_line_length = self.floor_line_length()
+        score = -sum(penalties[:floor_line_length])  # Calculate penalties for up to the first 7 tiles
+        if floor_line_length > 7:  # For more than 7 tiles, each additional tile incurs -3 points
+            score -= (floor_line_length - 7) * 3
         return score
-    
+
     def has_starting_player_tile(self):
         """Check if this player board has the starting player tile on the floor line."""
-        return any(isinstance(tile, StartingPlayerTile) for tile in self.floor_line)
-    
+        return self.has_first_player_tile
+
     def has_completed_row_on_wall(self):
-        for row in self.wall:
-            if None not in row:
-                return True
-        return False
-    
+        return wall_scoring.completed_rows(self.wall_mask) != 0
+
     def count_placed_tiles(self):
         """Count the number of tiles placed on the pattern lines and wall."""
-        wall_tiles_count = sum(tile is not None for row in self.wall for tile in row)
-        pattern_lines_tiles_count = sum(tile is not None for line in self.pattern_lines for tile in line)
-        floor_line_tiles_count = len([tile for tile in self.floor_line if not isinstance(tile, StartingPlayerTile)])
+        wall_tiles_count = bin(self.wall_mask).count("1")
+        pattern_lines_tiles_count = sum(self.pattern_line_counts)
+        floor_line_tiles_count = self.floor_count
 
         # Sum the counts from the wall and pattern lines
         total_placed_tiles = wall_tiles_count + pattern_lines_tiles_count + floor_line_tiles_count
-        return total_placed_tiles
\ No newline at end of file
+        return total_placed_tiles
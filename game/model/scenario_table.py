@@ -0,0 +1,94 @@
+import os
+from multiprocessing import shared_memory
+import numpy as np
+
+# A round deals 36 tiles and has at most 36 moves, every move takes at least one tile from the supply
+DRAWS_PER_ROUND = 36
+MOVES_PER_ROUND = 36
+PLAYER_COUNT = 4
+
+
+def share_resource_tracker():
+    """
+    Start the resource tracker before worker processes are forked, so they share it with this
+    process. A worker that starts a tracker of its own reports the blocks it attached as leaked.
+    """
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+
+
+class ScenarioTable:
+    """
+    Pre-generated random numbers for a set of game scenarios, for common random numbers: when every
+    genome plays the same scenarios, fitness differences come from the genomes and not from the luck
+    of the deal.
+
+    deal_uniforms[scenario, draw] is used for the draw-th tile drawn from the bag, so games of the
+    same scenario get the same deals as long as their bags hold the same tiles, which holds until
+    the box lid is first emptied into the bag. opponent_uniforms[scenario, seat, move] holds the
+    three numbers a random player uses for its move-th move (factory, color and pattern line).
+
+    The arrays can live in shared memory, so every worker of a generation reads the same table.
+    """
+
+    def __init__(self, deal_uniforms, opponent_uniforms, shm=None):
+        self.deal_uniforms = deal_uniforms
+        self.opponent_uniforms = opponent_uniforms
+        self.shm = shm
+        self.scenario_count = deal_uniforms.shape[0]
+        self.rounds = deal_uniforms.shape[1] // DRAWS_PER_ROUND
+
+    @staticmethod
+    def shapes(scenario_count, rounds):
+        return ((scenario_count, rounds * DRAWS_PER_ROUND),
+                (scenario_count, PLAYER_COUNT, rounds * MOVES_PER_ROUND, 3))
+
+    @staticmethod
+    def generate(seed, scenario_count, rounds=1):
+        """One independent random stream per scenario, all derived from seed (an int or a SeedSequence)."""
+        deal_shape, opponent_shape = ScenarioTable.shapes(scenario_count, rounds)
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        deal_uniforms = np.empty(deal_shape)
+        opponent_uniforms = np.empty(opponent_shape)
+        for scenario, scenario_seed in enumerate(seed_sequence.spawn(scenario_count)):
+            rng = np.random.default_rng(scenario_seed)
+            deal_uniforms[scenario] = rng.random(deal_shape[1:])
+            opponent_uniforms[scenario] = rng.random(opponent_shape[1:])
+        return ScenarioTable(deal_uniforms, opponent_uniforms)
+
+    def to_shared_memory(self):
+        """Copy the table into a new shared memory block. The returned table owns the block, see unlink."""
+        shm = shared_memory.SharedMemory(create=True, size=self.deal_uniforms.nbytes + self.opponent_uniforms.nbytes)
+        table = ScenarioTable.from_buffer(shm, self.scenario_count, self.rounds)
+        table.deal_uniforms[...] = self.deal_uniforms
+        table.opponent_uniforms[...] = self.opponent_uniforms
+        return table
+
+    def descriptor(self):
+        """Small picklable handle for attach."""
+        return self.shm.name, self.scenario_count, self.rounds
+
+    @staticmethod
+    def attach(descriptor):
+        name, scenario_count, rounds = descriptor
+        return ScenarioTable.from_buffer(shared_memory.SharedMemory(name=name), scenario_count, rounds)
+
+    @staticmethod
+    def from_buffer(shm, scenario_count, rounds):
+        deal_shape, opponent_shape = ScenarioTable.shapes(scenario_count, rounds)
+        deal_uniforms = np.ndarray(deal_shape, buffer=shm.buf)
+        opponent_uniforms = np.ndarray(opponent_shape, buffer=shm.buf, offset=deal_uniforms.nbytes)
+        return ScenarioTable(deal_uniforms, opponent_uniforms, shm)
+
+    def close(self):
+        self.deal_uniforms = None
+        self.opponent_uniforms = None
+        if self.shm is not None:
+            self.shm.close()
+
+    def unlink(self):
+        shm = self.shm
+        self.close()
+        if shm is not None:
+            shm.unlink()
@@ -1,35 +1,49 @@
 from enums.tile_color import TileColor
-from model.tile import Tile
 from model.box_lid import BoxLid
-import random
 
 class TileBag:
     def __init__(self, box_lid, game_engine):
-        # Initialize the bag with 20 tiles of each color, using the TileColor enum
-        self.tiles = [Tile(color) for color in TileColor for _ in range(20)]
-        random.shuffle(self.tiles)
+        # Initialize the bag with 20 tiles of each color. Tiles of one color can't be told apart,
+        # so the bag is a count per color and draws sample the counts directly.
+        self.counts = [20] * len(TileColor)
+        self.tile_count = sum(self.counts)
         self.box_lid = box_lid
         self.game_engine = game_engine
 
     def draw_tiles(self, number):
-        """Draw a specified number of tiles from the bag. Refill from the box lid if empty."""
-        if len(self.tiles) < number:  # Check if there are not enough tiles
-            if not self.box_lid.tiles:
+        """
+        Draw a specified number of tiles from the bag. Refill from the box lid if empty.
+        Returns the drawn tiles as a count per color.
+        """
+        if self.tile_count < number:  # Check if there are not enough tiles
+            if not self.box_lid.tile_count:
                 # This scenario implies the game might be in a state where no tiles are available to draw
                 # which could be a condition to check for game end or a specific game state
                 if self.game_engine.print_enabled:
                     print("Tiles in game: ", self.game_engine.count_tiles_in_game())
                     print("Not enough tiles available in the tile bag and the box lid is empty.")
-                return []
+                return [0] * 5
 
             # Refill the tile bag from the box lid if the tile bag is empty or has fewer tiles than needed
             self.box_lid.empty_into_tile_bag(self)
-            random.shuffle(self.tiles)  # Ensure the tiles are shuffled
 
-        drawn_tiles = self.tiles[:number]
-        self.tiles = self.tiles[number:]
-        return drawn_tiles
+        # Drawing one tile at a time without replacement is a multivariate hypergeometric sample,
+        # the same distribution as taking the top tiles of a shuffled bag
+        counts = self.counts
+        drawn_counts = [0] * 5
+        for _ in range(min(number, self.tile_count)):
+            position = self.game_engine.rng.randrange(self.tile_count)
+            color_index = 0
+            while position >= counts[color_index]:
+                position -= counts[color_index]
+                color_index += 1
+            counts[color_index] -= 1
+            drawn_counts[color_index] += 1
+            self.tile_count -= 1
+        return drawn_counts
 
-    def add_tiles(self, tiles):
+    def add_tiles(self, counts):
         """Add tiles back to the bag, typically from the box lid."""
-        self.tiles.extend(tiles)
\ No newline at end of file
+        for color_index, count in enumerate(counts):
+            self.counts[color_index] += count
+        self.tile_count += sum(counts)
@@ -0,0 +1,103 @@
+import numpy as np
+
+# Lookup tables for scoring the wall. The wall is the 25-bit mask kept by PlayerBoard: bit row * 5 + column
+# is set when that cell holds a tile, and color c sits in column (c + row) % 5 of every row.
+FULL_LINE = 0b11111
+ROW_BONUS = 2
+COLUMN_BONUS = 7
+COLOR_BONUS = 10
+
+
+def _run_length(mask, position):
+    if not mask >> position & 1:
+        return 0
+    start = position
+    while start > 0 and mask >> (start - 1) & 1:
+        start -= 1
+    end = position
+    while end < 4 and mask >> (end + 1) & 1:
+        end += 1
+    return end - start + 1
+
+
+# RUN_LENGTHS[mask][position]: length of the run of tiles through position in a 5-bit row or column mask
+RUN_LENGTHS = [[_run_length(mask, position) for position in range(5)] for mask in range(32)]
+
+# Spread a 5-bit row mask into a column-major mask (bit column * 5 + row) and a color-major mask (bit color * 5 + row)
+COLUMN_MAJOR_PARTS = [[sum(1 << (column * 5 + row) for column in range(5) if mask >> column & 1) for mask in range(32)]
+                      for row in range(5)]
+COLOR_MAJOR_PARTS = [[sum(1 << (((column - row) % 5) * 5 + row) for column in range(5) if mask >> column & 1) for mask in range(32)]
+                     for row in range(5)]
+
+# NumPy copy of RUN_LENGTHS for the batched engine
+RUN_LENGTH_TABLE = np.array(RUN_LENGTHS, dtype=np.int32)
+ROW_MASK_WEIGHTS = np.array([1, 2, 4, 8, 16], dtype=np.int32)
+
+
+def row_mask(wall_mask, row):
+    return wall_mask >> (row * 5) & FULL_LINE
+
+
+def column_major(wall_mask):
+    """The wall transposed, bit column * 5 + row."""
+    return (COLUMN_MAJOR_PARTS[0][wall_mask & FULL_LINE]
+            | COLUMN_MAJOR_PARTS[1][wall_mask >> 5 & FULL_LINE]
+            | COLUMN_MAJOR_PARTS[2][wall_mask >> 10 & FULL_LINE]
+            | COLUMN_MAJOR_PARTS[3][wall_mask >> 15 & FULL_LINE]
+            | COLUMN_MAJOR_PARTS[4][wall_mask >> 20 & FULL_LINE])
+
+
+def color_major(wall_mask):
+    """The wall regrouped by color, bit color * 5 + row."""
+    return (COLOR_MAJOR_PARTS[0][wall_mask & FULL_LINE]
+            | COLOR_MAJOR_PARTS[1][wall_mask >> 5 & FULL_LINE]
+            | COLOR_MAJOR_PARTS[2][wall_mask >> 10 & FULL_LINE]
+            | COLOR_MAJOR_PARTS[3][wall_mask >> 15 & FULL_LINE]
+            | COLOR_MAJOR_PARTS[4][wall_mask >> 20 & FULL_LINE])
+
+
+def full_groups(mask):
+    """5-bit mask of the complete 5-bit groups of a 25-bit mask, bit i for bits i * 5 to i * 5 + 4."""
+    complete = mask & mask >> 1 & mask >> 2 & mask >> 3 & mask >> 4
+    return ((complete & 1) | (complete >> 4 & 2) | (complete >> 8 & 4) | (complete >> 12 & 8) | (complete >> 16 & 16))
+
+
+def placement_score(wall_mask, row, column):
+    """
+    Score of the tile at (row, column), with the tile already in wall_mask. Same rules as
+    PlayerBoard.calculate_score_for_tile: 1 for the tile plus the other tiles of its horizontal
+    and vertical runs.
+    """
+    horizontal = RUN_LENGTHS[wall_mask >> (row * 5) & FULL_LINE][column]
+    vertical = RUN_LENGTHS[column_major(wall_mask) >> (column * 5) & FULL_LINE][row]
+    return horizontal + vertical - 1
+
+
+def score_if_placed(wall_mask, row, column):
+    """Score a tile would get at (row, column), 0 when the cell is already taken."""
+    bit = 1 << (row * 5 + column)
+    if wall_mask & bit:
+        return 0
+    return placement_score(wall_mask | bit, row, column)
+
+
+def completed_rows(wall_mask):
+    """5-bit mask of the complete rows."""
+    return full_groups(wall_mask)
+
+
+def completed_columns(wall_mask):
+    """5-bit mask of the complete columns."""
+    return full_groups(column_major(wall_mask))
+
+
+def completed_colors(wall_mask):
+    """5-bit mask of the colors with all 5 tiles on the wall, bit i for TileColor index i."""
+    return full_groups(color_major(wall_mask))
+
+
+def end_game_bonus(wall_mask):
+    """2 points per complete row, 7 per complete column and 10 per color with all 5 tiles."""
+    return (ROW_BONUS * bin(completed_rows(wall_mask)).count("1")
+            + COLUMN_BONUS * bin(completed_columns(wall_mask)).count("1")
+            + COLOR_BONUS * bin(completed_colors(wall_mask)).count("1"))
@@ -0,0 +1,70 @@
+import random
+
+# Zobrist keys for the game state. Components are combined by addition modulo 2**64 instead of XOR,
+# so two factory displays with the same tiles add up instead of cancelling out, and summing the
+# displays makes the key independent of the order of the factories.
+MASK = (1 << 64) - 1
+MAX_PLAYERS = 4
+
+_rng = random.Random(0x5A2A1)
+
+
+def _keys(*shape):
+    if len(shape) == 1:
+        return [_rng.getrandbits(64) for _ in range(shape[0])]
+    return [_keys(*shape[1:]) for _ in range(shape[0])]
+
+
+WALL_ROW_KEYS = _keys(MAX_PLAYERS, 5, 32)  # [player][row][5-bit row mask]
+PATTERN_LINE_KEYS = _keys(MAX_PLAYERS, 5, 5, 6)  # [player][line][color][tile count], an empty line adds nothing
+FLOOR_LINE_KEYS = _keys(MAX_PLAYERS, 8, 2)  # [player][colored tiles][has starting player tile]
+FACTORY_CONTENT_KEYS = _keys(70)  # [FACTORY_CONTENTS index]
+PARTIAL_FACTORY_KEYS = _keys(5, 4)  # [color][tile count] for displays dealt fewer than 4 tiles
+CENTRAL_FACTORY_KEYS = _keys(5, 28)  # [color][tile count]
+STARTING_PLAYER_TILE_KEY = _keys(1)[0]  # Starting player tile still in the center
+PLAYER_TO_MOVE_KEYS = _keys(MAX_PLAYERS)
+
+
+def pattern_line_key(player_index, board, line):
+    count = board.pattern_line_counts[line]
+    return PATTERN_LINE_KEYS[player_index][line][board.pattern_line_colors[line]][count] if count else 0
+
+
+def floor_line_key(player_index, board):
+    return FLOOR_LINE_KEYS[player_index][board.floor_count][board.has_first_player_tile]
+
+
+def board_key(player_index, board):
+    key = floor_line_key(player_index, board)
+    wall_mask = board.wall_mask
+    wall_row_keys = WALL_ROW_KEYS[player_index]
+    for row in range(5):
+        key += wall_row_keys[row][wall_mask >> (row * 5) & 0b11111] + pattern_line_key(player_index, board, row)
+    return key
+
+
+def factory_key(factory):
+    if factory.content_index != -1:
+        return FACTORY_CONTENT_KEYS[factory.content_index]
+    key = 0
+    for color_index, count in enumerate(factory.counts):
+        if count:
+            key += PARTIAL_FACTORY_KEYS[color_index][count - 1]
+    return key
+
+
+def central_factory_key(central_factory):
+    key = STARTING_PLAYER_TILE_KEY if central_factory.has_starting_player_tile else 0
+    for color_index, count in enumerate(central_factory.counts):
+        key += CENTRAL_FACTORY_KEYS[color_index][count]
+    return key
+
+
+def compute_hash(game_engine):
+    """Hash of the whole position, without the player to move. GameEngine keeps it up to date incrementally."""
+    key = central_factory_key(game_engine.central_factory)
+    for factory in game_engine.factories:
+        key += factory_key(factory)
+    for player_index, player in enumerate(game_engine.players):
+        key += board_key(player_index, player.board)
+    return key & MASK
@@ -0,0 +1,224 @@
+import numpy as np
+from neat import activations as neat_activations
+from neat.graphs import feed_forward_layers
+
+
+def inv_activation(z):
+    # neat's inv gives 0.0 where the division fails, which is only at 0.0
+    with np.errstate(divide="ignore", over="ignore"):
+        return np.where(z == 0.0, 0.0, 1.0 / z)
+
+
+# NumPy versions of neat's built-in activations, with the same clamps. Any other activation, or a
+# built-in name the config has replaced, is applied element-wise with the config's own function
+NUMPY_ACTIVATIONS = {
+    neat_activations.sigmoid_activation: lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    neat_activations.tanh_activation: lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    neat_activations.sin_activation: lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    neat_activations.gauss_activation: lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    neat_activations.relu_activation: lambda z: np.where(z > 0.0, z, 0.0),
+    neat_activations.softplus_activation: lambda z: 0.2 * np.log(1 + np.exp(np.clip(5.0 * z, -60.0, 60.0))),
+    neat_activations.identity_activation: lambda z: z,
+    neat_activations.clamped_activation: lambda z: np.clip(z, -1.0, 1.0),
+    neat_activations.inv_activation: inv_activation,
+    neat_activations.log_activation: lambda z: np.log(np.maximum(z, 1e-7)),
+    neat_activations.exp_activation: lambda z: np.exp(np.clip(z, -60.0, 60.0)),
+    neat_activations.abs_activation: np.abs,
+    neat_activations.hat_activation: lambda z: np.maximum(0.0, 1 - np.abs(z)),
+    neat_activations.square_activation: lambda z: z ** 2,
+    neat_activations.cube_activation: lambda z: z ** 3,
+}
+
+# Layers with at least this share of their possible links are multiplied as dense matrices when exact is False
+DENSE_LAYER_DENSITY = 0.25
+
+
+def activation_function(name, genome_config):
+    function = genome_config.activation_defs.get(name)
+    numpy_function = NUMPY_ACTIVATIONS.get(function)
+    if numpy_function is None:
+        numpy_function = np.frompyfunc(function, 1, 1)
+    return numpy_function
+
+
+class CompiledLayer:
+    """
+    One feed-forward layer, stored as padded sparse rows: row i lists the value columns feeding the
+    i-th node of the layer and their weights, padded with column 0, which always holds 0.0.
+    """
+
+    def __init__(self, columns, sources, weights, biases, responses, activations, dense_weights=None):
+        self.columns = columns  # Value columns the layer writes
+        self.sources = sources
+        self.weights = weights
+        self.biases = biases
+        self.responses = responses
+        self.activations = activations  # (activation name, function, node positions within the layer)
+        self.dense_weights = dense_weights  # (source columns, weight matrix) for dense layers
+
+    def aggregate(self, values):
+        if self.dense_weights is not None:
+            source_columns, weight_matrix = self.dense_weights
+            return values[:, source_columns] @ weight_matrix
+        # Links are added one at a time in genome order, exactly like the sum aggregation in FeedForwardNetwork
+        sums = np.zeros((values.shape[0], self.sources.shape[0]))
+        for k in range(self.sources.shape[1]):
+            sums += values[:, self.sources[:, k]] * self.weights[:, k]
+        return sums
+
+
+class CompiledNetwork:
+    """
+    A NEAT genome compiled into NumPy layers, a drop-in replacement for neat.nn.FeedForwardNetwork
+    that also evaluates a whole batch of inputs at once.
+
+    Only the nodes FeedForwardNetwork evaluates are kept: disabled connections, nodes that don't lead
+    to an output and nodes that can't be reached from the inputs are pruned, and an output that
+    can't be reached stays at 0.0. With exact=True the links of a node are summed in the same order
+    as FeedForwardNetwork, so the outputs agree up to the rounding of the NumPy activations: exp,
+    tanh and the powers can differ from the math module in the last bit, relu, identity, clamped, abs,
+    hat and sin don't. With exact=False dense layers are multiplied as matrices instead, which is
+    faster but rounds differently.
+
+    activate, for a single input, doesn't go through NumPy: a call per layer costs more than the
+    whole network in plain Python. It evaluates node by node like FeedForwardNetwork, with neat's
+    own activation functions, so its outputs match FeedForwardNetwork to the last bit.
+    """
+
+    def __init__(self, input_count, output_columns, layers, activation_defs=None):
+        self.input_count = input_count
+        self.output_columns = output_columns
+        self.layers = layers
+        self.activation_defs = activation_defs
+        self.value_count = 1 + input_count + sum(layer.columns.size for layer in layers)
+        self.node_evals = None  # For activate, made on its first call
+        self.values = None
+
+    @staticmethod
+    def create(genome, config, exact=True):
+        genome_config = config.genome_config
+        input_keys = genome_config.input_keys
+        output_keys = genome_config.output_keys
+        connections = [cg.key for cg in genome.connections.values() if cg.enabled]
+        incoming = {}
+        for connection_key in connections:
+            incoming.setdefault(connection_key[1], []).append((connection_key[0], genome.connections[connection_key].weight))
+
+        # Column 0 is a constant 0.0, then the inputs, then every evaluated node in layer order
+        columns = {key: 1 + i for i, key in enumerate(input_keys)}
+        layers = []
+        for layer_nodes in feed_forward_layers(input_keys, output_keys, connections):
+            nodes = sorted(layer_nodes)
+            link_count = max(len(incoming[node]) for node in nodes)
+            sources = np.zeros((len(nodes), link_count), dtype=np.intp)
+            weights = np.zeros((len(nodes), link_count))
+            for i, node in enumerate(nodes):
+                for k, (source, weight) in enumerate(incoming[node]):
+                    sources[i, k] = columns[source]
+                    weights[i, k] = weight
+
+            node_genes = [genome.nodes[node] for node in nodes]
+            for node_gene in node_genes:
+                if node_gene.aggregation != "sum":
+                    raise ValueError(f"CompiledNetwork only supports the sum aggregation, got {node_gene.aggregation}")
+            activations = []
+            for activation in sorted(set(node_gene.activation for node_gene in node_genes)):
+                positions = np.array([i for i, node_gene in enumerate(node_genes) if node_gene.activation == activation])
+                activations.append((activation, activation_function(activation, genome_config), positions))
+
+            dense_weights = None
+            source_columns = np.unique(sources[sources > 0])
+            if not exact and sum(len(incoming[node]) for node in nodes) >= DENSE_LAYER_DENSITY * len(nodes) * source_columns.size:
+                weight_matrix = np.zeros((source_columns.size, len(nodes)))
+                for i, node in enumerate(nodes):
+                    for source, weight in incoming[node]:
+                        weight_matrix[np.searchsorted(source_columns, columns[source]), i] += weight
+                dense_weights = (source_columns, weight_matrix)
+
+            first_column = 1 + len(input_keys) + sum(layer.columns.size for layer in layers)
+            layer_columns = np.arange(first_column, first_column + len(nodes))
+            for node, column in zip(nodes, layer_columns):
+                columns[node] = int(column)
+            layers.append(CompiledLayer(layer_columns, sources, weights,
+                                        np.array([node_gene.bias for node_gene in node_genes]),
+                                        np.array([node_gene.response for node_gene in node_genes]),
+                                        activations, dense_weights))
+
+        output_columns = np.array([columns.get(key, 0) for key in output_keys], dtype=np.intp)
+        return CompiledNetwork(len(input_keys), output_columns, layers, genome_config.activation_defs)
+
+    def to_arrays(self):
+        """
+        Split the network into a small picklable layout and a list of NumPy arrays, so the arrays can
+        be sent through shared memory. from_arrays puts the network back together.
+        """
+        arrays = [self.output_columns]
+        layer_layouts = []
+        for layer in self.layers:
+            arrays.extend((layer.columns, layer.sources, layer.weights, layer.biases, layer.responses))
+            arrays.extend(positions for ignored_name, ignored_function, positions in layer.activations)
+            if layer.dense_weights is not None:
+                arrays.extend(layer.dense_weights)
+            layer_layouts.append(([name for name, ignored_function, ignored_positions in layer.activations],
+                                  layer.dense_weights is not None))
+        return (self.input_count, layer_layouts), arrays
+
+    @staticmethod
+    def from_arrays(layout, arrays, genome_config):
+        input_count, layer_layouts = layout
+        arrays = iter(arrays)
+        output_columns = next(arrays)
+        layers = []
+        for activation_names, dense in layer_layouts:
+            columns, sources, weights, biases, responses = [next(arrays) for _ in range(5)]
+            activations = [(name, activation_function(name, genome_config), next(arrays)) for name in activation_names]
+            dense_weights = (next(arrays), next(arrays)) if dense else None
+            layers.append(CompiledLayer(columns, sources, weights, biases, responses, activations, dense_weights))
+        return CompiledNetwork(input_count, output_columns, layers, genome_config.activation_defs)
+
+    def activate(self, inputs):
+        """Same as FeedForwardNetwork.activate: one input vector (a list or an array) in, a list of outputs back."""
+        if len(inputs) != self.input_count:
+            raise RuntimeError("Expected {0:n} inputs, got {1:n}".format(self.input_count, len(inputs)))
+        if self.node_evals is None:
+            self.node_evals = self.single_input_plan()
+            self.values = [0.0] * self.value_count
+        values = self.values
+        values[1:1 + self.input_count] = inputs.tolist() if isinstance(inputs, np.ndarray) else inputs
+        for column, activation, bias, response, links in self.node_evals:
+            # Summed from 0 in link order, exactly like neat's sum aggregation
+            total = 0
+            for source, weight in links:
+                total += values[source] * weight
+            values[column] = activation(bias + response * total)
+        return [values[column] for column in self.output_column_list]
+
+    def single_input_plan(self):
+        """(column, activation, bias, response, [(source column, weight)]) of every node in evaluation order."""
+        self.output_column_list = self.output_columns.tolist()
+        node_evals = []
+        for layer in self.layers:
+            activations = [None] * layer.columns.size
+            for name, ignored_function, positions in layer.activations:
+                function = self.activation_defs.get(name)
+                for position in positions.tolist():
+                    activations[position] = function
+            for column, activation, bias, response, sources, weights in zip(
+                    layer.columns.tolist(), activations, layer.biases.tolist(), layer.responses.tolist(),
+                    layer.sources.tolist(), layer.weights.tolist()):
+                # Column 0 only pads the rows
+                links = [(source, weight) for source, weight in zip(sources, weights) if source]
+                node_evals.append((column, activation, bias, response, links))
+        return node_evals
+
+    def activate_batch(self, inputs):
+        """Evaluate a (batch, inputs) array and return the outputs as a (batch, outputs) float64 array."""
+        inputs = np.asarray(inputs)
+        values = np.empty((inputs.shape[0], self.value_count))
+        values[:, 0] = 0.0
+        values[:, 1:1 + self.input_count] = inputs
+        for layer in self.layers:
+            pre_activations = layer.biases + layer.responses * layer.aggregate(values)
+            for ignored_name, function, positions in layer.activations:
+                values[:, layer.columns[positions]] = function(pre_activations[:, positions])
+        return values[:, self.output_columns]
@@ -0,0 +1,302 @@
+import os
+import sys
+import hmac
+import time
+import pickle
+import hashlib
+import ipaddress
+import socket
+import struct
+import threading
+import multiprocessing
+from collections import deque
+
+# Every message is a pickled tuple preceded by its length and an HMAC-SHA256 of the pickle under the
+# shared authkey. Pickle runs arbitrary code while loading, so nothing is unpickled before its HMAC
+# checks out.
+MESSAGE_HEADER = struct.Struct("!I")
+DIGEST_SIZE = hashlib.sha256().digest_size
+MAX_MESSAGE_SIZE = 1 << 30
+DEFAULT_PORT = 5125
+# Workers started with python -m neat_package.distributed_evaluator read the authkey, in hex, from here
+AUTHKEY_VARIABLE = "AZUL_DISTRIBUTED_AUTHKEY"
+
+
+def send_message(connection, message, authkey):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    digest = hmac.new(authkey, data, hashlib.sha256).digest()
+    connection.sendall(MESSAGE_HEADER.pack(len(data)) + digest + data)
+
+
+def receive_message(connection, authkey):
+    length, = MESSAGE_HEADER.unpack(receive_exactly(connection, MESSAGE_HEADER.size))
+    if length > MAX_MESSAGE_SIZE:
+        raise ConnectionError(f"Message of {length} bytes is too large")
+    digest = receive_exactly(connection, DIGEST_SIZE)
+    data = receive_exactly(connection, length)
+    if not hmac.compare_digest(digest, hmac.new(authkey, data, hashlib.sha256).digest()):
+        raise ConnectionError("Message failed authentication")
+    return pickle.loads(data)
+
+
+def receive_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by the other side")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class Batch:
+    """A slice of the population handed to workers as one unit."""
+    __slots__ = ("batch_id", "genomes", "fitness", "workers")
+
+    def __init__(self, batch_id, genomes):
+        self.batch_id = batch_id
+        self.genomes = genomes  # (genome_id, genome) pairs
+        self.fitness = None  # Fitness of every genome once a worker has answered
+        self.workers = set()  # Workers currently running the batch
+
+
+class DistributedEvaluator:
+    """
+    Coordinator that farms batches of genomes out to worker processes over TCP, on this host or
+    others. Plugs into Population.run like neat.parallel.ParallelEvaluator: p.run(evaluator.evaluate, n).
+
+    Workers run run_worker, which pulls a batch whenever the worker is idle, so fast workers take
+    more batches. When no batch is left to hand out, an idle worker steals a copy of a batch still
+    running elsewhere and the first answer wins, so a slow worker doesn't hold up the generation.
+    Workers send heartbeats while they evaluate; a worker that goes quiet for heartbeat_timeout
+    seconds or drops its connection is dropped and its unfinished batches go back to the queue.
+    Fitness is assigned in population order whatever order the answers arrive in, so with a
+    deterministic eval_function (see eval_genome_seeded) the results match ParallelEvaluator.
+
+    local_workers starts that many worker processes on this host, which need eval_function.
+
+    Messages are signed with authkey and anything a peer sends that isn't is dropped unread. The
+    coordinator listens on the loopback interface unless given another host; workers on other hosts
+    then need the same authkey, which is required in that case. Without one, a random key is made
+    for the local workers.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, batch_size=4, heartbeat_timeout=30.0,
+                 max_copies=2, local_workers=0, eval_function=None, timeout=None, authkey=None):
+        if authkey is None:
+            if not is_loopback(host):
+                raise ValueError(f"Listening on {host} accepts workers from other hosts, which needs a shared authkey")
+            authkey = os.urandom(32)
+        self.authkey = authkey
+        self.batch_size = batch_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_copies = max_copies
+        self.timeout = timeout
+
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.batches = []
+        self.batches_by_id = {}
+        self.remaining = 0
+        self.next_batch_id = 0
+        self.config = None
+        self.config_version = 0
+        self.closed = False
+
+        # Counters for the log
+        self.worker_count = 0
+        self.lost_batches = 0
+        self.stolen_batches = 0
+
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+
+        self.local_workers = []
+        for ignored_worker in range(local_workers):
+            worker = multiprocessing.Process(target=run_worker, args=("127.0.0.1", self.address[1], eval_function, authkey),
+                                             daemon=True)
+            worker.start()
+            self.local_workers.append(worker)
+
+    def __del__(self):
+        # __init__ may have failed before the socket was made
+        if hasattr(self, "server"):
+            self.close()
+
+    def close(self):
+        """Tell the workers to stop and close the listening socket."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+        for worker in self.local_workers:
+            worker.join()
+        self.server.close()
+
+    def evaluate(self, genomes, config):
+        start_time = time.perf_counter()
+        with self.condition:
+            if config is not self.config:
+                self.config = config
+                self.config_version += 1
+            self.batches = []
+            for i in range(0, len(genomes), self.batch_size):
+                self.batches.append(Batch(self.next_batch_id, genomes[i:i + self.batch_size]))
+                self.next_batch_id += 1
+            self.batches_by_id = {batch.batch_id: batch for batch in self.batches}
+            self.pending.clear()
+            self.pending.extend(self.batches)
+            self.remaining = len(self.batches)
+            self.condition.notify_all()
+            while self.remaining:
+                if not self.condition.wait(timeout=self.timeout) and self.timeout is not None:
+                    raise TimeoutError(f"{self.remaining} batches were not evaluated within {self.timeout} s")
+
+        # Assign the fitness back to each genome
+        for batch in self.batches:
+            for fitness, (ignored_genome_id, genome) in zip(batch.fitness, batch.genomes):
+                genome.fitness = fitness
+        print(f"Evaluated {len(genomes)} genomes on {self.worker_count} workers in {time.perf_counter() - start_time:.2f} s "
+              f"({self.stolen_batches} batches stolen, {self.lost_batches} resubmitted so far)")
+
+    def accept_workers(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                break  # The evaluator was closed
+            threading.Thread(target=self.serve_worker, args=(connection, f"{address[0]}:{address[1]}"), daemon=True).start()
+
+    def serve_worker(self, connection, worker_name):
+        # Any message counts as a sign of life, the worker's heartbeats keep it coming during long batches
+        connection.settimeout(self.heartbeat_timeout)
+        assigned = set()
+        config_version = 0
+        with self.condition:
+            self.worker_count += 1
+        try:
+            while True:
+                message = receive_message(connection, self.authkey)
+                if message[0] == "result":
+                    ignored_kind, batch_id, fitness = message
+                    assigned.discard(batch_id)
+                    self.complete(batch_id, fitness, worker_name)
+                elif message[0] == "request":
+                    with self.condition:
+                        batch = None if self.closed else self.next_batch(worker_name)
+                        if batch is not None:
+                            assigned.add(batch.batch_id)
+                            # The config is only sent when it changed since the worker last got it
+                            config = self.config if config_version != self.config_version else None
+                            config_version = self.config_version
+                    if self.closed:
+                        send_message(connection, ("stop",), self.authkey)
+                        break
+                    if batch is None:
+                        send_message(connection, ("wait",), self.authkey)
+                    else:
+                        send_message(connection, ("batch", batch.batch_id, config, batch.genomes), self.authkey)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass  # Lost the worker or it failed authentication, socket.timeout is an OSError too
+        finally:
+            connection.close()
+            self.drop_worker(worker_name, assigned)
+
+    def next_batch(self, worker_name):
+        while self.pending:
+            batch = self.pending.popleft()
+            if batch.fitness is None:
+                batch.workers.add(worker_name)
+                return batch
+        # Nothing left in the queue: steal a copy of the oldest batch still running on another worker
+        for batch in self.batches:
+            if batch.fitness is None and worker_name not in batch.workers and len(batch.workers) < self.max_copies:
+                batch.workers.add(worker_name)
+                self.stolen_batches += 1
+                return batch
+        return None
+
+    def complete(self, batch_id, fitness, worker_name):
+        with self.condition:
+            batch = self.batches_by_id.get(batch_id)
+            if batch is None:
+                return  # Answer to a batch of an earlier generation
+            batch.workers.discard(worker_name)
+            if batch.fitness is None:
+                batch.fitness = fitness
+                self.remaining -= 1
+                self.condition.notify_all()
+
+    def drop_worker(self, worker_name, assigned):
+        with self.condition:
+            self.worker_count -= 1
+            for batch_id in assigned:
+                batch = self.batches_by_id.get(batch_id)
+                if batch is None:
+                    continue
+                batch.workers.discard(worker_name)
+                # Resubmit the batch unless another worker is still on it
+                if batch.fitness is None and not batch.workers:
+                    self.pending.appendleft(batch)
+                    self.lost_batches += 1
+            self.condition.notify_all()
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def run_worker(host, port, eval_function, authkey, heartbeat_interval=5.0, poll_interval=0.2):
+    """
+    Connect to a DistributedEvaluator and evaluate batches with eval_function(genome, config) until
+    the coordinator says stop or goes away. authkey is the coordinator's.
+    """
+    connection = socket.create_connection((host, port))
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with send_lock:
+            send_message(connection, message, authkey)
+
+    def send_heartbeats():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                send(("heartbeat",))
+            except OSError:
+                break
+
+    threading.Thread(target=send_heartbeats, daemon=True).start()
+    config = None
+    try:
+        while True:
+            send(("request",))
+            message = receive_message(connection, authkey)
+            if message[0] == "stop":
+                break
+            if message[0] == "wait":
+                time.sleep(poll_interval)
+                continue
+            ignored_kind, batch_id, batch_config, genomes = message
+            if batch_config is not None:
+                config = batch_config
+            send(("result", batch_id, [eval_function(genome, config) for ignored_genome_id, genome in genomes]))
+    except (OSError, EOFError):
+        pass  # The coordinator is gone
+    finally:
+        stopped.set()
+        connection.close()
+
+
+if __name__ == "__main__":
+    # AZUL_DISTRIBUTED_AUTHKEY=<hex key> python -m neat_package.distributed_evaluator HOST [PORT], from the game directory
+    from neat_package.neat import eval_genome_seeded
+    run_worker(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT, eval_genome_seeded,
+               bytes.fromhex(os.environ[AUTHKEY_VARIABLE]))
@@ -0,0 +1,78 @@
+import struct
+import hashlib
+from collections import OrderedDict
+
+
+def genome_hash(genome):
+    """
+    Hash of everything that decides what a genome's network computes: the enabled connections with
+    their weights and every node's bias, response, activation and aggregation. Genome keys and
+    disabled connections don't count, so an unchanged elite and an identical offspring hash the same.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for (input_key, output_key), connection in sorted(genome.connections.items()):
+        if connection.enabled:
+            digest.update(struct.pack("<qqd", input_key, output_key, connection.weight))
+    for node_key, node in sorted(genome.nodes.items()):
+        digest.update(struct.pack("<qdd", node_key, node.bias, node.response))
+        digest.update(f"{node.activation},{node.aggregation};".encode())
+    return digest.digest()
+
+
+class CacheEntry:
+    __slots__ = ("network", "scores")
+
+    def __init__(self):
+        self.network = None  # Compiled network, once an evaluator has compiled it
+        self.scores = []  # Every game score recorded for this structure, over all generations
+
+
+class GenomeCache:
+    """
+    Compiled networks and game scores of recently seen genomes, keyed by genome_hash, so elites and
+    duplicate offspring reuse their network and add new games to the scores they already have
+    instead of starting over. Once a structure has max_games scores it isn't played again.
+
+    Holds at most max_size structures and drops the least recently used one beyond that, so
+    max_size should cover two generations (2 * pop_size) or the elites are evicted before they come
+    back. hits, misses and evictions count lookups since the start of the run.
+    """
+
+    def __init__(self, max_size=2000, max_games=50):
+        self.max_size = max_size
+        self.max_games = max_games
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, genome):
+        """The entry of the genome's structure, a new empty one on a miss."""
+        key = genome_hash(genome)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = self.entries[key] = CacheEntry()
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def state(self):
+        """The recorded scores, least recently used first, and the counters. Networks are left out, they are compiled again when needed."""
+        return {"scores": [(key, list(entry.scores)) for key, entry in self.entries.items()],
+                "counters": (self.hits, self.misses, self.evictions)}
+
+    def restore(self, state):
+        self.entries = OrderedDict()
+        for key, scores in state["scores"]:
+            entry = self.entries[key] = CacheEntry()
+            entry.scores = scores
+        self.hits, self.misses, self.evictions = state["counters"]
@@ -1,39 +1,82 @@
 import neat
 import multiprocessing
+import numpy as np
 import sys
 import os
 import datetime
 from neat.parallel import ParallelEvaluator
 from neat_package.reporter.custom_reporter import CustomReporter
-from game_engine import GameEngine
-from model.ai_players.random_player import RandomPlayer
-from model.ai_players.nn_player import NeuralNetworkPlayer
+from neat_package.reporter.incremental_checkpointer import IncrementalCheckpointer
+from neat_package.compiled_network import CompiledNetwork
+from neat_package.population_evaluator import PopulationEvaluator
+from neat_package.shared_memory_evaluator import SharedMemoryEvaluator
+from neat_package.distributed_evaluator import DistributedEvaluator, DEFAULT_PORT, AUTHKEY_VARIABLE
+from neat_package.racing_evaluator import RacingEvaluator
+from neat_package.genome_cache import GenomeCache
+from batched_game_engine import BatchedGameEngine, BatchedNetworkPolicy, BatchedRandomPolicy
 from logs.dual_logger import DualLogger
 
-def run(config_file, logging_path):
+def run(config_file, logging_path, evaluator="population", resume_from=None, distributed_host="127.0.0.1",
+        distributed_port=DEFAULT_PORT):
     # Load configuration.
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_file)
 
-    # Create the population, which is the top-level object for a NEAT run.
-    p = neat.Population(config)
+    # Compiled networks and game scores of elites and duplicate offspring are kept between generations
+    genome_cache = GenomeCache(max_size=2 * config.pop_size) if evaluator in ("shared_memory", "racing", "population") else None
+    num_workers = multiprocessing.cpu_count()
+    if evaluator == "shared_memory":
+        # Warm workers for the whole run, the compiled networks are passed through shared memory
+        pe = SharedMemoryEvaluator(num_workers, cache=genome_cache)
+    elif evaluator == "distributed":
+        # Local workers are started here. For workers on other hosts, listen on an address they can reach
+        # (distributed_host) and set AZUL_DISTRIBUTED_AUTHKEY to the same hex key here and on the workers,
+        # which connect with python -m neat_package.distributed_evaluator HOST [PORT]
+        authkey = os.environ.get(AUTHKEY_VARIABLE)
+        pe = DistributedEvaluator(host=distributed_host, port=distributed_port, local_workers=num_workers,
+                                  eval_function=eval_genome_seeded, authkey=bytes.fromhex(authkey) if authkey else None)
+        print(f"Distributed coordinator listening on {pe.address[0]}:{pe.address[1]}")
+    elif evaluator == "racing":
+        # A few games for every genome, more only for the genomes near the selection cutoffs
+        pe = RacingEvaluator(num_workers, cache=genome_cache)
+    elif evaluator == "population":
+        # Each worker plays the games of a whole chunk of genomes in lockstep
+        pe = PopulationEvaluator(num_workers, cache=genome_cache)
+    else:
+        pe = ParallelEvaluator(num_workers, eval_genome)
+
+    # Create the population, which is the top-level object for a NEAT run. With resume_from, the checkpoints
+    # directory of an earlier run, the run continues from its latest checkpoint, evaluator caches included
+    if resume_from:
+        p = IncrementalCheckpointer.restore(resume_from, config, evaluator=pe)
+    else:
+        p = neat.Population(config)
+    if evaluator == "racing":
+        # The selection cutoffs are raced per species
+        pe.species_set = p.species
 
     # Add a stdout reporter to show progress in the terminal.
     p.add_reporter(neat.StdOutReporter(True))
-    custom_reporter = CustomReporter(config_file_name=config_file, directory_path=logging_path)
+    custom_reporter = CustomReporter(config_file_name=config_file, directory_path=logging_path, genome_cache=genome_cache,
+                                     phase_profiler=getattr(pe, "phase_profiler", None), evaluator=pe)
     p.add_reporter(custom_reporter)
     stats = neat.StatisticsReporter()
     p.add_reporter(stats)
-    checkpoint_prefix = os.path.join(custom_reporter.checkpoint_path, "neat-checkpoint-")
-    p.add_reporter(neat.Checkpointer(generation_interval=100, time_interval_seconds=None, filename_prefix=checkpoint_prefix))
-
-
-    num_workers = multiprocessing.cpu_count()
-    pe = ParallelEvaluator(num_workers, eval_genome)
+    # Written in the background, so checkpoints can be frequent
+    checkpointer = IncrementalCheckpointer(custom_reporter.checkpoint_path, generation_interval=10, evaluator=pe)
+    p.add_reporter(checkpointer)
 
     # Run for up to 300 generations.
-    winner = p.run(pe.evaluate, 10000)
+    try:
+        winner = p.run(pe.evaluate, 10000)
+    finally:
+        checkpointer.close()
+        # Joins the workers and unlinks shared memory even when the run is interrupted, ParallelEvaluator has no close
+        if hasattr(pe, "close"):
+            pe.close()
+        # Write out the statistics still queued, last as it raises if writing them failed
+        custom_reporter.close()
 
     # Display the winning genome.
     print('\nBest genome:\n{!s}'.format(winner))
@@ -47,23 +90,31 @@ def run_with_logging(config_file_name):
         
     directory_path = f'{logging_path}\\{formatted_now}'
     os.makedirs(directory_path, exist_ok=True)  # exist_ok=True will not raise an error if the directory already exists
-    sys.stdout = DualLogger(directory_path + '\\console_output.txt', mode='w')
+    logger = DualLogger(directory_path + '\\console_output.txt', mode='w')
+    sys.stdout = logger
     config_path = os.path.join('C:\\Users\\tende\\Desktop\\azul\\game\\neat_package\\config\\', config_file_name)
     try:
         run(config_path, directory_path)
     finally:
         # Reset stdout to its original value
         sys.stdout = sys.__stdout__
+        logger.close()
 
 
 
-def eval_genome(genome, config):
-    net = neat.nn.FeedForwardNetwork.create(genome, config)
+def eval_genome(genome, config, seed=None):
+    net = CompiledNetwork.create(genome, config)
     number_of_games = 10
-    total_fitness = 0
-    for _ in range(number_of_games):
-        game_engine = GameEngine([NeuralNetworkPlayer("NN Player", net),RandomPlayer("Random Player 1"), RandomPlayer("Random Player 2"), RandomPlayer("Random Player 3")])
-        fitness = game_engine.play_game()
-        total_fitness += fitness
-    average_fitness = total_fitness / number_of_games
-    return average_fitness
\ No newline at end of file
+    # With a seed the deals and the random players' moves are reproducible
+    engine_seed, *player_seeds = np.random.SeedSequence(seed).spawn(4) if seed is not None else [None] * 4
+    # All games are played together, the network sits in the first seat against 3 random players
+    game_engine = BatchedGameEngine(number_of_games, [BatchedNetworkPolicy(net)] + [BatchedRandomPolicy(player_seed) for player_seed in player_seeds],
+                                    seed=engine_seed)
+    fitness = game_engine.play_games()
+    average_fitness = float(fitness.mean())
+    return average_fitness
+
+
+def eval_genome_seeded(genome, config):
+    """eval_genome seeded with the genome key, so any evaluator gives a genome the same fitness."""
+    return eval_genome(genome, config, seed=genome.key)
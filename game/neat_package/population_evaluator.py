@@ -0,0 +1,206 @@
+import time
+from multiprocessing import Pool
+import numpy as np
+from model.scenario_table import ScenarioTable, share_resource_tracker
+from neat_package.compiled_network import CompiledNetwork
+from neat_package.genome_cache import CacheEntry
+from batched_game_engine import BatchedGameEngine, BatchedPopulationPolicy, BatchedRandomPolicy
+from phase_profiler import PhaseProfiler, profiler, perf_counter, enable_in_worker
+
+
+def eval_genomes(players, config, games_per_genome, scenario_descriptor=None, first_scenario=0):
+    """
+    Play the games of a chunk of players, see game_scores. A player is a genome, which is compiled
+    here, or the (layout, arrays) of a network compiled before (CompiledNetwork.to_arrays). Returns
+    the scores of the games of every player, the (layout, arrays) of the networks compiled here (None
+    for the others) and the phase stats of this worker since its last task.
+    """
+    timed = profiler.enabled
+    if timed:
+        start_time = perf_counter()
+    networks = []
+    compiled = []
+    for player in players:
+        if isinstance(player, tuple):
+            networks.append(CompiledNetwork.from_arrays(*player, config.genome_config))
+            compiled.append(None)
+        else:
+            network = CompiledNetwork.create(player, config)
+            networks.append(network)
+            compiled.append(network.to_arrays())
+    if timed:
+        profiler.add("compile", perf_counter() - start_time, sum(arrays is not None for arrays in compiled))
+    scenarios = ScenarioTable.attach(scenario_descriptor) if scenario_descriptor is not None else None
+    try:
+        scores = game_scores(networks, games_per_genome, scenarios, first_scenario).tolist()
+    finally:
+        if scenarios is not None:
+            scenarios.close()
+    return scores, compiled, profiler.take()
+
+
+def play_networks(networks, games_per_genome, scenarios=None):
+    """The average score of every network, see game_scores."""
+    return game_scores(networks, games_per_genome, scenarios).mean(axis=1).tolist()
+
+
+def game_scores(networks, games_per_genome, scenarios=None, first_scenario=0):
+    """
+    Play the games of many networks together in one BatchedGameEngine, each network in the first
+    seat against 3 random players, and return the scores as a (networks, games_per_genome) array.
+    With a ScenarioTable every network plays the games_per_genome scenarios from first_scenario on,
+    wrapping around at the end of the table.
+    """
+    timed = profiler.enabled
+    if timed:
+        start_time = perf_counter()
+    scenario_indices = None
+    if scenarios is not None:
+        scenario_indices = np.tile((first_scenario + np.arange(games_per_genome)) % scenarios.scenario_count, len(networks))
+    game_engine = BatchedGameEngine(len(networks) * games_per_genome,
+                                    [BatchedPopulationPolicy(networks, games_per_genome),
+                                     BatchedRandomPolicy(), BatchedRandomPolicy(), BatchedRandomPolicy()],
+                                    scenarios=scenarios, scenario_indices=scenario_indices)
+    scores = game_engine.play_games().reshape(len(networks), games_per_genome)
+    if timed:
+        profiler.add("evaluate_genomes", perf_counter() - start_time, len(networks))
+    return scores
+
+
+class PopulationEvaluator:
+    """
+    Evaluates the population in chunks of genomes instead of one genome per job like
+    neat.parallel.ParallelEvaluator, so every decision step activates each network once on all of
+    its games. Plugs into Population.run the same way: p.run(evaluator.evaluate, generations).
+
+    The throughput of every generation is printed and kept in generation_stats as
+    (genomes, games, seconds). The workers' phase timings are gathered in phase_profiler, see
+    PhaseProfiler.
+
+    With common_random_numbers every genome of a generation plays the same games_per_genome
+    scenarios from a ScenarioTable in shared memory, a new table every generation. Pass a seed to
+    make the whole run reproducible.
+
+    With a GenomeCache, genomes with the same structure are played once per generation, their
+    scores are added to the ones recorded in earlier generations and the fitness is the average
+    over all of them.
+    """
+
+    def __init__(self, num_workers, games_per_genome=10, chunk_size=None, timeout=None, common_random_numbers=True, seed=None,
+                 cache=None):
+        self.num_workers = num_workers
+        self.games_per_genome = games_per_genome
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.common_random_numbers = common_random_numbers
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.cache = cache
+        self.generation_stats = []
+        self.game_counts = {}  # Games behind the fitness of every genome of the last generation, by genome id
+        self.phase_profiler = PhaseProfiler(enabled=True)
+        self.pool = None
+
+    def __del__(self):
+        self.close()
+
+    def start(self, config):
+        share_resource_tracker()
+        # The workers time their phases, the stats copied from this process by the fork are dropped
+        self.pool = Pool(self.num_workers, initializer=enable_in_worker)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def evaluate(self, genomes, config):
+        start_time = time.perf_counter()
+        entries = self.cache_entries(genomes)
+        players = self.unsettled(genomes, entries)
+        for (genome_id, ignored_genome), scores in zip(players, self.play(players, config, self.games_per_genome, entries)):
+            entries[genome_id].scores.extend(scores)
+
+        # Assign the fitness back to each genome
+        for genome_id, genome in genomes:
+            scores = entries[genome_id].scores
+            genome.fitness = sum(scores) / len(scores)
+        self.game_counts = {genome_id: len(entries[genome_id].scores) for genome_id, ignored_genome in genomes}
+        self.log_generation(len(genomes), len(players) * self.games_per_genome, time.perf_counter() - start_time)
+
+    def checkpoint_state(self):
+        """What a checkpoint needs to continue the run: where the scenario seeds are and the GenomeCache."""
+        return {"seed_sequence": (self.seed_sequence.entropy, self.seed_sequence.spawn_key, self.seed_sequence.pool_size,
+                                  self.seed_sequence.n_children_spawned),
+                "cache": self.cache.state() if self.cache is not None else None}
+
+    def restore_state(self, state):
+        entropy, spawn_key, pool_size, n_children_spawned = state["seed_sequence"]
+        self.seed_sequence = np.random.SeedSequence(entropy, spawn_key=spawn_key, pool_size=pool_size,
+                                                    n_children_spawned=n_children_spawned)
+        if self.cache is not None and state["cache"] is not None:
+            self.cache.restore(state["cache"])
+
+    def cache_entries(self, genomes):
+        """The cache entry of every genome by genome id, fresh entries without a cache."""
+        if self.cache is None:
+            return {genome_id: CacheEntry() for genome_id, ignored_genome in genomes}
+        return {genome_id: self.cache.lookup(genome) for genome_id, genome in genomes}
+
+    def unsettled(self, genomes, entries):
+        """The genomes to play: one per structure, skipping structures that already have cache.max_games scores."""
+        max_games = self.cache.max_games if self.cache is not None else None
+        players = {}
+        for genome_id, genome in genomes:
+            entry = entries[genome_id]
+            if id(entry) not in players and (max_games is None or len(entry.scores) < max_games):
+                players[id(entry)] = (genome_id, genome)
+        return list(players.values())
+
+    def log_generation(self, genome_count, game_count, seconds):
+        self.generation_stats.append((genome_count, game_count, seconds))
+        self.phase_profiler.add("evaluate_generation", seconds, genome_count)
+        print(f"Evaluated {genome_count} genomes, {game_count} games in {seconds:.2f} s "
+              f"({genome_count / seconds:.1f} genomes/s, {game_count / seconds:.1f} games/s)")
+
+    def play(self, genomes, config, games_per_genome, entries, scenarios=None, first_scenario=0):
+        """
+        Play games_per_genome games with every genome on the pool and return the list of scores of each
+        genome. The games come from scenarios, from first_scenario on, or from a new table of their own.
+        Genomes whose entry has no network yet are compiled by the workers, which send the network
+        back to be kept in the entry, the others get the entry's network.
+        """
+        if self.pool is None:
+            self.start(config)
+        # By default every worker gets about 4 chunks, so a slow chunk doesn't hold the others up
+        chunk_size = self.chunk_size or max(1, -(-len(genomes) // (self.num_workers * 4)))
+        chunks = [genomes[i:i + chunk_size] for i in range(0, len(genomes), chunk_size)]
+        own_scenarios = scenarios is None
+        if own_scenarios:
+            scenarios = self.new_scenarios(games_per_genome)
+        scenario_descriptor = scenarios.descriptor() if scenarios is not None else None
+        try:
+            jobs = [self.pool.apply_async(eval_genomes, ([genome if entries[genome_id].network is None
+                                                          else entries[genome_id].network.to_arrays()
+                                                          for genome_id, genome in chunk], config,
+                                                         games_per_genome, scenario_descriptor, first_scenario))
+                    for chunk in chunks]
+            genome_scores = []
+            for chunk, job in zip(chunks, jobs):
+                chunk_scores, compiled, phase_stats = job.get(timeout=self.timeout)
+                genome_scores.extend(chunk_scores)
+                for (genome_id, ignored_genome), arrays in zip(chunk, compiled):
+                    if arrays is not None:
+                        entries[genome_id].network = CompiledNetwork.from_arrays(*arrays, config.genome_config)
+                self.phase_profiler.merge(phase_stats)
+            return genome_scores
+        finally:
+            if own_scenarios and scenarios is not None:
+                scenarios.unlink()
+
+    def new_scenarios(self, scenario_count):
+        """A fresh ScenarioTable in shared memory, None without common random numbers."""
+        if not self.common_random_numbers:
+            return None
+        scenario_seed, = self.seed_sequence.spawn(1)
+        return ScenarioTable.generate(scenario_seed, scenario_count).to_shared_memory()
@@ -0,0 +1,138 @@
+import math
+import time
+import numpy as np
+from neat_package.population_evaluator import PopulationEvaluator
+
+
+class RacingEvaluator(PopulationEvaluator):
+    """
+    PopulationEvaluator that spends a per-generation game budget where it changes the selection.
+
+    Every genome first plays initial_games games. The selection cutoffs are then taken per species,
+    like DefaultReproduction selects: the elitism-th best genome of the species and the top
+    survival_threshold share of it (at least 2). A genome whose confidence interval (average score
+    +- confidence standard errors) still contains a cutoff of its species plays games_per_round more
+    games, and this repeats until no genome is contested, the budget of total_games games (by
+    default games_per_genome per genome) is spent or the contested genomes reached max_games.
+    Fitness is the average score over all the games a genome played. With a GenomeCache the games
+    of earlier generations count too, so a genome that was already decided on plays no new games.
+
+    The species come from species_set, the Population's (p.species), which has to be set before the
+    run. Without it the whole population is ranked as one species. With common random numbers all
+    rounds of a generation draw from one ScenarioTable, each round from the scenarios after the
+    previous round's, so the genomes racing in a round play the same games.
+
+    The game count of every genome is kept in game_counts, genome id to games, and summarized in
+    the log.
+    """
+
+    def __init__(self, num_workers, total_games=None, initial_games=3, games_per_round=3, max_games=40,
+                 confidence=1.96, species_set=None, **kwargs):
+        super().__init__(num_workers, **kwargs)
+        self.total_games = total_games
+        self.initial_games = initial_games
+        self.games_per_round = games_per_round
+        self.max_games = max_games
+        self.confidence = confidence
+        self.species_set = species_set
+        self.game_counts = {}
+
+    def evaluate(self, genomes, config):
+        start_time = time.perf_counter()
+        budget = self.total_games or self.games_per_genome * len(genomes)
+        entries = self.cache_entries(genomes)
+        # Genomes with the same structure race as one, starting from the games cached for it
+        racers = list({id(entries[genome_id]): (genome_id, genome) for genome_id, genome in genomes}.values())
+        scores = {genome_id: entries[genome_id].scores for genome_id, ignored_genome in racers}
+        groups = self.selection_groups(config, genomes)
+
+        contenders = [(genome_id, genome) for genome_id, genome in racers if len(scores[genome_id]) < self.initial_games]
+        games = max(1, min(self.initial_games, budget // len(genomes)))
+        played = 0
+        scenarios = self.new_scenarios(max(self.max_games, self.initial_games))
+        first_scenario = 0
+        try:
+            while True:
+                if contenders:
+                    genome_scores = self.play(contenders, config, games, entries, scenarios, first_scenario)
+                    for (genome_id, ignored_genome), new_scores in zip(contenders, genome_scores):
+                        scores[genome_id].extend(new_scores)
+                    budget -= games * len(contenders)
+                    played += games * len(contenders)
+                    first_scenario += games
+
+                games = self.games_per_round
+                if budget < games:
+                    break
+                contenders = self.contested(racers, entries, groups)
+                if not contenders:
+                    break
+                # Without budget for all of them, the genomes closest to a cutoff go first
+                contenders = contenders[:budget // games]
+        finally:
+            if scenarios is not None:
+                scenarios.unlink()
+
+        # Assign the fitness back to each genome
+        for genome_id, genome in genomes:
+            genome_scores = entries[genome_id].scores
+            genome.fitness = sum(genome_scores) / len(genome_scores)
+        self.game_counts = {genome_id: len(entries[genome_id].scores) for genome_id, ignored_genome in genomes}
+
+        seconds = time.perf_counter() - start_time
+        counts = list(self.game_counts.values())
+        self.generation_stats.append((len(genomes), played, seconds))
+        self.phase_profiler.add("evaluate_generation", seconds, len(genomes))
+        print(f"Evaluated {len(genomes)} genomes, {played} games in {seconds:.2f} s ({played / seconds:.1f} games/s), "
+              f"games per genome min {min(counts)} mean {sum(counts) / len(counts):.1f} max {max(counts)}")
+
+    def selection_groups(self, config, genomes):
+        """
+        The genome ids of every species with the number of its genomes above each selection cutoff:
+        DefaultReproduction keeps the elitism best genomes of a species and breeds from its top
+        survival_threshold share, at least 2.
+        """
+        genome_ids = [genome_id for genome_id, ignored_genome in genomes]
+        if self.species_set is not None and self.species_set.species:
+            present = set(genome_ids)
+            members = [[genome_id for genome_id in s.members if genome_id in present] for s in self.species_set.species.values()]
+        else:
+            members = [genome_ids]
+
+        reproduction_config = config.reproduction_config
+        groups = []
+        for group in members:
+            survivors = max(2, math.ceil(reproduction_config.survival_threshold * len(group)))
+            cutoff_ranks = sorted(set(rank for rank in (reproduction_config.elitism, survivors) if 0 < rank < len(group)))
+            if cutoff_ranks:
+                groups.append((group, cutoff_ranks))
+        return groups
+
+    def contested(self, racers, entries, groups):
+        """Racers whose confidence interval contains a cutoff of their species, closest to a cutoff first."""
+        means = np.array([np.mean(entries[genome_id].scores) for genome_id, ignored_genome in racers])
+        counts = np.array([len(entries[genome_id].scores) for genome_id, ignored_genome in racers])
+
+        # A few games give a poor variance estimate per genome, so the spread of the scores around
+        # their genome's mean is pooled over the population
+        residuals = np.concatenate([np.asarray(entries[genome_id].scores) - mean
+                                    for (genome_id, ignored_genome), mean in zip(racers, means)])
+        degrees_of_freedom = residuals.size - len(racers)
+        if degrees_of_freedom <= 0:
+            return []
+        standard_errors = math.sqrt((residuals ** 2).sum() / degrees_of_freedom) / np.sqrt(counts)
+
+        # Distance of every structure to the nearest cutoff of a species one of its genomes is in
+        distances = {}
+        for group, cutoff_ranks in groups:
+            group_means = np.array([np.mean(entries[genome_id].scores) for genome_id in group])
+            ranked_means = np.sort(group_means)[::-1]
+            cutoffs = np.array([(ranked_means[rank - 1] + ranked_means[rank]) / 2 for rank in cutoff_ranks])
+            for genome_id, distance in zip(group, np.abs(group_means[:, None] - cutoffs[None, :]).min(axis=1)):
+                key = id(entries[genome_id])
+                distances[key] = min(distance, distances.get(key, np.inf))
+        distances = np.array([distances.get(id(entries[genome_id]), np.inf) for genome_id, ignored_genome in racers])
+
+        contested = np.flatnonzero((distances <= self.confidence * standard_errors) & (counts < self.max_games))
+        order = contested[np.argsort(distances[contested] / np.maximum(standard_errors[contested], 1e-12))]
+        return [racers[i] for i in order]
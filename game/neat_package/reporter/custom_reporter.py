@@ -1,16 +1,60 @@
 import neat
 import datetime
 import os
+import time
 import shutil
+from logs.background_writer import BackgroundWriter
 
 class CustomReporter(neat.reporting.BaseReporter):
-    def __init__(self, directory_path, config_file_name, filename="fitness_stats.csv"):
+    """
+    Writes the statistics of a run into directory_path. Every file is appended to by a
+    BackgroundWriter thread, so reporting never waits for the disk:
+
+    fitness_stats.csv: average fitness per generation.
+    generations.jsonl: one line per generation with the timing, the fitness summary, the species
+        sizes and the size of the best genome.
+    genomes.jsonl: one line per generation holding columns, the genome ids with their fitness,
+        species and the number of games behind the fitness (from the evaluator's game_counts).
+    cache_stats.csv and phase_stats.csv: with a GenomeCache and a PhaseProfiler.
+
+    Call close at the end of the run to write out what is still queued.
+    """
+
+    def __init__(self, directory_path, config_file_name, filename="fitness_stats.csv", genome_cache=None, phase_profiler=None,
+                 evaluator=None):
         self.filename = os.path.join(directory_path, filename)
         self.generation = 0
         # Open the file and write the header line
         with open(self.filename, "w") as f:
             f.write("Generation,AverageFitness\n")
 
+        # Hits and misses of the evaluator's GenomeCache, per generation
+        self.genome_cache = genome_cache
+        self.cache_filename = os.path.join(directory_path, "cache_stats.csv")
+        self.cache_counts = (0, 0, 0)
+        if genome_cache is not None:
+            # A resumed run starts from the restored counters, only the generations after it are reported
+            self.cache_counts = (genome_cache.hits, genome_cache.misses, genome_cache.evictions)
+            with open(self.cache_filename, "w") as f:
+                f.write("Generation,Hits,Misses,Evictions,Size,HitRate\n")
+
+        # Where the evaluator's time went, per generation and phase
+        self.phase_profiler = phase_profiler
+        self.phase_filename = os.path.join(directory_path, "phase_stats.csv")
+        if phase_profiler is not None:
+            with open(self.phase_filename, "w") as f:
+                f.write("Generation,Phase,Seconds,Count,MicrosecondsPerCount\n")
+
+        # Per-generation and per-genome records, the generation record is written once the generation ends
+        self.evaluator = evaluator
+        self.generations_filename = os.path.join(directory_path, "generations.jsonl")
+        self.genomes_filename = os.path.join(directory_path, "genomes.jsonl")
+        for records_filename in (self.generations_filename, self.genomes_filename):
+            open(records_filename, "w").close()
+        self.generation_start_time = None
+        self.pending_record = None
+        self.writer = BackgroundWriter()
+
         # Copy the configuration file to the same directory
         config_base_name = os.path.basename(config_file_name)
         config_base_name = os.path.splitext(config_base_name)[0]
@@ -19,15 +63,77 @@ class CustomReporter(neat.reporting.BaseReporter):
 
         # Save the directory path as an instance variable
         self.directory_path = directory_path
-        
+
         # Create a subdirectory for checkpoints
         self.checkpoint_path = os.path.join(self.directory_path, "checkpoints")
         os.makedirs(self.checkpoint_path, exist_ok=True)
 
+    def close(self):
+        self.write_generation_record()
+        self.writer.close()
+
+    def start_generation(self, generation):
+        self.generation_start_time = time.perf_counter()
+
     def post_evaluate(self, config, population, species, best_genome):
         # Calculate average fitness
-        avg_fitness = sum([c.fitness for c in population.values()]) / len(population)
+        fitnesses = [c.fitness for c in population.values()]
+        avg_fitness = sum(fitnesses) / len(population)
         self.generation += 1
         # Append the stats to the file
-        with open(self.filename, "a") as f:
-            f.write(f"{self.generation},{avg_fitness}\n")
\ No newline at end of file
+        self.writer.write(self.filename, f"{self.generation},{avg_fitness}\n")
+
+        genome_species = {genome_id: species_id for species_id, s in species.species.items() for genome_id in s.members}
+        game_counts = getattr(self.evaluator, "game_counts", None) or {}
+        genome_ids = list(population)
+        self.writer.write_json(self.genomes_filename, {
+            "generation": self.generation,
+            "genome_id": genome_ids,
+            "fitness": fitnesses,
+            "species_id": [genome_species.get(genome_id) for genome_id in genome_ids],
+            "games": [game_counts.get(genome_id) for genome_id in genome_ids],
+        })
+
+        node_count, connection_count = best_genome.size()
+        self.pending_record = {
+            "generation": self.generation,
+            "evaluation_seconds": time.perf_counter() - self.generation_start_time if self.generation_start_time else None,
+            "generation_seconds": None,
+            "population": len(population),
+            "average_fitness": avg_fitness,
+            "max_fitness": max(fitnesses),
+            "min_fitness": min(fitnesses),
+            "games": sum(count for count in game_counts.values() if count) if game_counts else None,
+            "species_sizes": {str(species_id): len(s.members) for species_id, s in species.species.items()},
+            "best_genome_id": best_genome.key,
+            "best_fitness": best_genome.fitness,
+            "best_nodes": node_count,
+            "best_connections": connection_count,
+        }
+
+        if self.genome_cache is not None:
+            counts = (self.genome_cache.hits, self.genome_cache.misses, self.genome_cache.evictions)
+            hits, misses, evictions = (count - previous for count, previous in zip(counts, self.cache_counts))
+            self.cache_counts = counts
+            hit_rate = hits / (hits + misses) if hits + misses else 0.0
+            self.writer.write(self.cache_filename, f"{self.generation},{hits},{misses},{evictions},{len(self.genome_cache)},{hit_rate}\n")
+            print(f"Genome cache: {hits} hits, {misses} misses, {evictions} evictions, {len(self.genome_cache)} entries")
+
+        if self.phase_profiler is not None:
+            self.writer.write(self.phase_filename, "".join(
+                f"{self.generation},{phase},{seconds},{count},{seconds / count * 1e6 if count else 0.0}\n"
+                for phase, (seconds, count) in sorted(self.phase_profiler.take().items())))
+
+    def end_generation(self, config, population, species_set):
+        if self.pending_record is not None and self.generation_start_time:
+            self.pending_record["generation_seconds"] = time.perf_counter() - self.generation_start_time
+        self.write_generation_record()
+
+    def found_solution(self, config, generation, best):
+        # The run stops before end_generation
+        self.write_generation_record()
+
+    def write_generation_record(self):
+        if self.pending_record is not None:
+            self.writer.write_json(self.generations_filename, self.pending_record)
+            self.pending_record = None
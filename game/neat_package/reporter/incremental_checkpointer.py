@@ -0,0 +1,229 @@
+import os
+import re
+import copy
+import glob
+import zlib
+import pickle
+import random
+import hashlib
+import queue
+import threading
+from itertools import count
+import neat
+
+MANIFEST_PATTERN = re.compile(r"checkpoint-(\d+)\.pkl\.z$")
+
+
+def indexer_value(indexer):
+    """The next number an itertools.count will return, read without advancing it."""
+    return int(repr(indexer)[len("count("):-1])
+
+
+class IncrementalCheckpointer(neat.reporting.BaseReporter):
+    """
+    Checkpoints a run every generation_interval generations without holding it up. At the end of
+    the generation the state is copied in memory: shallow copies of the genomes (a genome's genes
+    never change once it was created, only its fitness does), the species, the random state and
+    what the evaluator returns from checkpoint_state. A background thread pickles and compresses
+    the copy and writes it to directory.
+
+    Every genome is stored once, as a blob named by the hash of its pickle under blobs/, and the
+    checkpoint-<generation>.pkl.z manifests refer to the blobs and hold the fitnesses. Elites and
+    other genomes that didn't change since an earlier checkpoint cost nothing more. Only the last keep manifests are kept, and
+    blobs no manifest refers to any more are deleted.
+
+    restore continues a run from the latest checkpoint. Call close at the end of the run to wait for
+    the checkpoints still being written.
+    """
+
+    def __init__(self, directory, generation_interval=10, keep=5, evaluator=None, compression_level=6):
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_directory, exist_ok=True)
+        self.generation_interval = generation_interval
+        self.keep = keep
+        self.evaluator = evaluator
+        self.compression_level = compression_level
+        self.generation = None
+        self.last_generation_checkpoint = None
+
+        # Blobs already on disk, and the blobs each kept manifest refers to. Only the writer thread uses them after this
+        self.blobs = {os.path.basename(path) for path in glob.glob(os.path.join(self.blob_directory, "*", "*"))
+                      if not path.endswith(".tmp")}
+        self.manifest_blobs = {}
+
+        self.queue = queue.SimpleQueue()
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def end_generation(self, config, population, species_set):
+        if self.error is not None:
+            raise RuntimeError("Writing a checkpoint failed") from self.error
+        if self.last_generation_checkpoint is None:
+            self.last_generation_checkpoint = self.generation
+        if self.generation - self.last_generation_checkpoint >= self.generation_interval:
+            # The population and species are those of the next generation already
+            self.queue.put(self.snapshot(config, population, species_set, self.generation + 1))
+            self.last_generation_checkpoint = self.generation
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def snapshot(self, config, population, species_set, generation):
+        """Everything a checkpoint holds, copied so the run can go on while it is written."""
+        species = [{
+            "key": s.key,
+            "created": s.created,
+            "last_improved": s.last_improved,
+            "representative": s.representative.key if s.representative is not None else None,
+            "members": list(s.members),
+            "fitness": s.fitness,
+            "adjusted_fitness": s.adjusted_fitness,
+            "fitness_history": list(s.fitness_history),
+        } for s in species_set.species.values()]
+        genomes = {genome_id: copy.copy(genome) for genome_id, genome in population.items()}
+        # Representatives are members in neat-python, a representative that isn't is kept along
+        for s in species_set.species.values():
+            if s.representative is not None and s.representative.key not in genomes:
+                genomes[s.representative.key] = copy.copy(s.representative)
+        return {
+            "generation": generation,
+            "config": config,
+            "genomes": genomes,
+            "fitness": {genome_id: genome.fitness for genome_id, genome in genomes.items()},
+            "population": list(population),
+            "species": species,
+            "genome_to_species": dict(species_set.genome_to_species),
+            "next_species_id": indexer_value(species_set.indexer),
+            "next_genome_id": max(genomes) + 1 if genomes else 1,
+            "random_state": random.getstate(),
+            "evaluator": self.evaluator.checkpoint_state() if hasattr(self.evaluator, "checkpoint_state") else None,
+        }
+
+    def run(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.write(snapshot)
+            except Exception as error:
+                # Raised in the run loop at the end of the next generation
+                self.error = error
+
+    def write(self, snapshot):
+        genome_blobs = {}
+        for genome_id, genome in snapshot["genomes"].items():
+            # The fitness is in the manifest, so a re-evaluated elite still matches its blob
+            genome.fitness = None
+            data = pickle.dumps(genome, pickle.HIGHEST_PROTOCOL)
+            name = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if name not in self.blobs:
+                self.write_file(self.blob_path(self.directory, name), zlib.compress(data, self.compression_level))
+                self.blobs.add(name)
+            genome_blobs[genome_id] = name
+        snapshot["genomes"] = genome_blobs
+
+        path = os.path.join(self.directory, f"checkpoint-{snapshot['generation']:06d}.pkl.z")
+        self.write_file(path, zlib.compress(pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL), self.compression_level))
+        self.manifest_blobs[path] = set(genome_blobs.values())
+        print(f"Saved checkpoint of generation {snapshot['generation']} to {path}")
+        self.prune()
+
+    def prune(self):
+        """Delete the manifests beyond the last keep, then the blobs the remaining ones don't refer to."""
+        manifests = self.manifests(self.directory)
+        if len(manifests) <= self.keep:
+            return
+        for path in manifests[:-self.keep]:
+            os.remove(path)
+            self.manifest_blobs.pop(path, None)
+        referenced = set()
+        for path in manifests[-self.keep:]:
+            if path not in self.manifest_blobs:
+                self.manifest_blobs[path] = set(self.load_manifest(path)["genomes"].values())
+            referenced |= self.manifest_blobs[path]
+        for name in self.blobs - referenced:
+            os.remove(self.blob_path(self.directory, name))
+        self.blobs &= referenced
+
+    @staticmethod
+    def write_file(path, data):
+        # Written under a temporary name first, so a crash never leaves half a checkpoint
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def blob_path(directory, name):
+        return os.path.join(directory, "blobs", name[:2], name)
+
+    @staticmethod
+    def manifests(directory):
+        """Paths of the checkpoints in directory, oldest first."""
+        found = []
+        for path in glob.glob(os.path.join(directory, "checkpoint-*.pkl.z")):
+            match = MANIFEST_PATTERN.search(path)
+            if match:
+                found.append((int(match.group(1)), path))
+        return [path for generation, path in sorted(found)]
+
+    @staticmethod
+    def load_manifest(path):
+        with open(path, "rb") as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+    @staticmethod
+    def restore(directory, config=None, evaluator=None):
+        """
+        A Population that continues the run from the latest checkpoint in directory, with the random
+        state, the species, the id counters and the evaluator state (restore_state) as they were.
+        The config saved with the checkpoint is used unless one is given.
+        """
+        manifests = IncrementalCheckpointer.manifests(directory)
+        if not manifests:
+            raise FileNotFoundError(f"No checkpoint in {directory}")
+        manifest = IncrementalCheckpointer.load_manifest(manifests[-1])
+        config = config or manifest["config"]
+
+        genomes = {}
+        for genome_id, name in manifest["genomes"].items():
+            with open(IncrementalCheckpointer.blob_path(directory, name), "rb") as f:
+                genomes[genome_id] = pickle.loads(zlib.decompress(f.read()))
+            genomes[genome_id].fitness = manifest["fitness"][genome_id]
+        population = {genome_id: genomes[genome_id] for genome_id in manifest["population"]}
+
+        # The reporters are the Population's, they are set once it exists
+        species_set = config.species_set_type(config.species_set_config, None)
+        for saved in manifest["species"]:
+            s = neat.species.Species(saved["key"], saved["created"])
+            s.last_improved = saved["last_improved"]
+            s.representative = genomes.get(saved["representative"])
+            s.members = {genome_id: genomes[genome_id] for genome_id in saved["members"]}
+            s.fitness = saved["fitness"]
+            s.adjusted_fitness = saved["adjusted_fitness"]
+            s.fitness_history = saved["fitness_history"]
+            species_set.species[s.key] = s
+        species_set.genome_to_species = manifest["genome_to_species"]
+        species_set.indexer = count(manifest["next_species_id"])
+
+        p = neat.Population(config, (population, species_set, manifest["generation"]))
+        species_set.reporters = p.reporters
+        p.reproduction.genome_indexer = count(manifest["next_genome_id"])
+        random.setstate(manifest["random_state"])
+        if hasattr(evaluator, "restore_state") and manifest["evaluator"] is not None:
+            evaluator.restore_state(manifest["evaluator"])
+        return p
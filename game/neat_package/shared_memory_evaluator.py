@@ -0,0 +1,183 @@
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from neat_package.compiled_network import CompiledNetwork
+from neat_package.population_evaluator import PopulationEvaluator, game_scores
+from model.scenario_table import ScenarioTable, share_resource_tracker
+from batched_game_engine import BatchedGameEngine, BatchedRandomPolicy
+from phase_profiler import profiler, perf_counter, enable_in_worker
+
+# Arrays are placed at multiples of this many bytes in the shared block
+ARRAY_ALIGNMENT = 64
+
+
+def warm_up():
+    """Build the engine and encoder lookup tables and run the code paths once, so the first task isn't slower."""
+    BatchedGameEngine(4, [BatchedRandomPolicy(0)] * 4, seed=0).play_games()
+
+
+def worker_main(worker_index, genome_config, tasks, results):
+    warm_up()
+    enable_in_worker()  # Neither the warm-up nor the parent's stats copied by the fork count
+    shm = None
+    scenarios = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, shm_name, scenario_descriptor, first_scenario, games_per_genome, network_layouts = task
+        start_time = time.perf_counter()
+        if shm is None or shm.name != shm_name:
+            if shm is not None:
+                shm.close()
+            shm = shared_memory.SharedMemory(name=shm_name)
+        if scenarios is not None and (scenario_descriptor is None or scenarios.shm.name != scenario_descriptor[0]):
+            scenarios.close()
+            scenarios = None
+        if scenarios is None and scenario_descriptor is not None:
+            scenarios = ScenarioTable.attach(scenario_descriptor)
+
+        # The networks are views on the shared block, nothing is copied
+        networks = [CompiledNetwork.from_arrays(layout, [np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                                                         for offset, dtype, shape in array_layouts],
+                                                genome_config)
+                    for layout, array_layouts in network_layouts]
+        scores = game_scores(networks, games_per_genome, scenarios, first_scenario).tolist()
+        del networks  # Release the views before the block can be closed
+        results.put((task_id, worker_index, scores, time.perf_counter() - start_time, profiler.take()))
+    if shm is not None:
+        shm.close()
+    if scenarios is not None:
+        scenarios.close()
+
+
+class SharedMemoryEvaluator(PopulationEvaluator):
+    """
+    Evaluates the population on worker processes that stay alive for the whole run. Every
+    generation the genomes are compiled once and the weights of all networks are written into one
+    shared memory block, so a task on the queue only carries the offsets of its networks instead
+    of pickled genomes. Workers build the lookup tables once at startup and take chunks from a
+    shared queue, so a free worker picks up the next chunk.
+
+    Plugs into Population.run like neat.parallel.ParallelEvaluator: p.run(evaluator.evaluate, n).
+    Per-worker counters are kept in worker_busy_seconds, worker_task_counts and
+    worker_genome_counts, and utilization() relates the busy time to the time spent evaluating.
+
+    Common random numbers, the seed and the GenomeCache work as in PopulationEvaluator: the
+    generation's ScenarioTable sits in its own shared memory block next to the networks, and
+    networks compiled in an earlier generation are taken from the cache.
+    """
+
+    def __init__(self, num_workers, games_per_genome=10, chunk_size=None, timeout=None, common_random_numbers=True, seed=None,
+                 cache=None):
+        super().__init__(num_workers, games_per_genome, chunk_size, timeout, common_random_numbers, seed, cache)
+        self.workers = []
+        self.tasks = None
+        self.results = None
+        self.shm = None
+
+        self.worker_busy_seconds = [0.0] * num_workers
+        self.worker_task_counts = [0] * num_workers
+        self.worker_genome_counts = [0] * num_workers
+        self.evaluation_seconds = 0.0
+
+    def start(self, config):
+        share_resource_tracker()
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        for worker_index in range(self.num_workers):
+            worker = multiprocessing.Process(target=worker_main, daemon=True,
+                                             args=(worker_index, config.genome_config, self.tasks, self.results))
+            worker.start()
+            self.workers.append(worker)
+
+    def close(self):
+        for worker in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def play(self, genomes, config, games_per_genome, entries, scenarios=None, first_scenario=0):
+        if not self.workers:
+            self.start(config)
+        start_time = time.perf_counter()
+
+        networks = []
+        compiled_count = 0
+        for genome_id, genome in genomes:
+            entry = entries[genome_id]
+            if entry.network is None:
+                entry.network = CompiledNetwork.create(genome, config)
+                compiled_count += 1
+            networks.append(entry.network)
+        compiled_time = perf_counter()
+        self.phase_profiler.add("compile", compiled_time - start_time, compiled_count)
+        network_layouts = self.write_networks(networks)
+        self.phase_profiler.add("write_networks", perf_counter() - compiled_time, len(networks))
+
+        chunk_size = self.chunk_size or max(1, -(-len(genomes) // (self.num_workers * 4)))
+        chunk_starts = list(range(0, len(genomes), chunk_size))
+        scores = [None] * len(chunk_starts)
+        own_scenarios = scenarios is None
+        if own_scenarios:
+            scenarios = self.new_scenarios(games_per_genome)
+        scenario_descriptor = scenarios.descriptor() if scenarios is not None else None
+        try:
+            for task_id, chunk_start in enumerate(chunk_starts):
+                self.tasks.put((task_id, self.shm.name, scenario_descriptor, first_scenario, games_per_genome,
+                                network_layouts[chunk_start:chunk_start + chunk_size]))
+
+            for ignored_task in chunk_starts:
+                task_id, worker_index, chunk_scores, busy_seconds, phase_stats = self.results.get(timeout=self.timeout)
+                scores[task_id] = chunk_scores
+                self.phase_profiler.merge(phase_stats)
+                self.worker_busy_seconds[worker_index] += busy_seconds
+                self.worker_task_counts[worker_index] += 1
+                self.worker_genome_counts[worker_index] += len(chunk_scores)
+        finally:
+            if own_scenarios and scenarios is not None:
+                scenarios.unlink()
+        self.evaluation_seconds += time.perf_counter() - start_time
+        return [genome_scores for chunk_scores in scores for genome_scores in chunk_scores]
+
+    def log_generation(self, genome_count, game_count, seconds):
+        self.generation_stats.append((genome_count, game_count, seconds))
+        self.phase_profiler.add("evaluate_generation", seconds, genome_count)
+        utilization = self.utilization()
+        print(f"Evaluated {genome_count} genomes, {game_count} games in {seconds:.2f} s "
+              f"({game_count / seconds:.1f} games/s, worker utilization {sum(utilization) / len(utilization):.0%})")
+
+    def write_networks(self, networks):
+        """Copy the arrays of every network into the shared block and return their layouts with the array offsets."""
+        network_arrays = [network.to_arrays() for network in networks]
+        total_size = sum(-(-array.nbytes // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+                         for ignored_layout, arrays in network_arrays for array in arrays)
+        if self.shm is None or self.shm.size < total_size:
+            if self.shm is not None:
+                self.shm.close()
+                self.shm.unlink()
+            # Leave room to grow, genomes gain nodes and connections over the run
+            self.shm = shared_memory.SharedMemory(create=True, size=max(total_size * 2, ARRAY_ALIGNMENT))
+
+        network_layouts = []
+        offset = 0
+        for layout, arrays in network_arrays:
+            array_layouts = []
+            for array in arrays:
+                np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=offset)[...] = array
+                array_layouts.append((offset, array.dtype.str, array.shape))
+                offset += -(-array.nbytes // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+            network_layouts.append((layout, array_layouts))
+        return network_layouts
+
+    def utilization(self):
+        """Share of the evaluation time every worker spent on tasks."""
+        if not self.evaluation_seconds:
+            return [0.0] * self.num_workers
+        return [busy_seconds / self.evaluation_seconds for busy_seconds in self.worker_busy_seconds]
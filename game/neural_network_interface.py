@@ -1,6 +1,9 @@
 import numpy as np
 from enums.tile_color import TileColor
-from model.starting_player_tile import StartingPlayerTile
+from model.move_tables import FACTORY_CONTENTS
+
+# 5 color neurons for a single tile, indexed by the tile's position in TileColor
+ONE_HOT_COLORS = [[1 if i == color_index else 0 for i in range(5)] for color_index in range(5)]
 
 class NeuralNetworkInterface:
     def __init__(self, enable_generation_logging=False):
@@ -20,9 +23,9 @@ class NeuralNetworkInterface:
 
     def player_board_to_network_input(self, player_board):
         binary_array = []
-        binary_array.extend(self.pattern_lines_to_network_input(player_board.pattern_lines))
-        binary_array.extend(self.wall_to_network_input(player_board.wall))
-        binary_array.extend(self.floor_line_to_network_input(player_board.floor_line))
+        binary_array.extend(self.pattern_lines_to_network_input(player_board))
+        binary_array.extend(self.wall_to_network_input(player_board))
+        binary_array.extend(self.floor_line_to_network_input(player_board))
         return binary_array
     
     def simplest_input(self, game_engine):
@@ -31,111 +34,115 @@ class NeuralNetworkInterface:
         binary_array.extend(self.factories_to_network_input(game_engine.factories))
         return binary_array
 
-    def pattern_lines_to_network_input(self, pattern_lines):
+    def pattern_lines_to_network_input(self, player_board):
         """
         Transforms the pattern line state into the input format required by the neural network.
         """
         binary_array = []
 
         # Iterate through each pattern line
-        for line_index, line in enumerate(pattern_lines):
-            # print(f"Processing line {line_index+1} with tiles: {[tile.color.name if tile is not None else 'None' for tile in line]}")
+        for line_index in range(5):
+            color_index = player_board.pattern_line_colors[line_index]
+            tile_count = player_board.pattern_line_counts[line_index]
 
             # First, add 6 neurons for the first slot (5 for color, 1 for empty)
-            if len(line) > 0 and line[0] is not None:  # If there's at least one tile in the line
-                # print(f"  Line {line_index+1} is not empty, adding color neurons.")
-                for color in TileColor:  # Add 1 for the tile's color, 0 for others
-                    binary_array.append(1 if line[0].color == color else 0)
-                    # print(f"    Added {'1' if line[0].color == color else '0'} for color {color.name}.")
+            if tile_count > 0:  # If there's at least one tile in the line
+                binary_array.extend(1 if color_index == i else 0 for i in range(5))  # Add 1 for the tile's color, 0 for others
                 binary_array.append(0)  # This line is not empty
-                # print("    Added '0' because line is not empty")
             else:  # If the line is empty
                 binary_array.extend([0, 0, 0, 0, 0, 1])  # All colors are 0, 'empty' neuron is 1
-                # print("  Line is empty, added [0, 0, 0, 0, 0, 1].")
                 
             # Now, add 1 neuron for each additional slot in the line, indicating occupancy
             for slot_index in range(1, line_index + 1):
-                binary_array.append(1 if line[slot_index] is not None else 0)
-                # print(f"    Added {'1' if line[slot_index] is not None else '0'} for slot {slot_index} occupancy.")
+                binary_array.append(1 if slot_index < tile_count else 0)
                     
         return binary_array
     
-    def wall_to_network_input(self, wall):
+    def wall_to_network_input(self, player_board):
         """
         Transforms the wall state into a binary input format required by the neural network.
         Each spot on the 5x5 wall grid is represented by a binary value, resulting in a
         25-entry array. A value of 1 indicates that a tile is present in that spot, while 0
         indicates an empty spot.
         """
-        binary_array = []
-
-        # Assuming the wall is a 5x5 list of lists, with each inner list representing a row.
-        # Each spot in the row may contain a Tile object (indicating a tile is present) or None (indicating the spot is empty).
-        for row in wall:
-            for tile in row:
-                binary_array.append(1 if tile is not None else 0)
-
-        # Log the binary array to the console for verification
-
-        return binary_array
+        # The wall mask keeps the cells in row-major order, bit 0 being the top-left spot
+        wall_mask = player_board.wall_mask
+        return [wall_mask >> cell & 1 for cell in range(25)]
     
-    def floor_line_to_network_input(self, floor_line):
+    def floor_line_to_network_input(self, player_board):
         """
         Transforms the floor line state into the input format required by the neural network.
         """
-        binary_array = []
-
         # Add 1 neuron for each tile in the floor line, indicating occupancy
-        for i in range(8):
-            binary_array.append(1 if i < len(floor_line) else 0)
-
-        return binary_array
+        floor_line_length = player_board.floor_line_length()
+        return [1 if i < floor_line_length else 0 for i in range(8)]
     
     def factories_to_network_input(self, factories):
         """
         Transforms the factories state into the input format required by the neural network.
+        Each factory takes 4 slots of 5 color neurons, tiles are listed in TileColor order. Before the
+        factories kept per-color counts the slots followed the draw order, so genomes evolved from an
+        older checkpoint see the same tiles in different slots until they adapt.
         """
         binary_array = []
 
-        # Add 1 neuron for each tile in the floor line, indicating occupancy
         for factory in factories:
-            tiles = len(factory.tiles)
-            if tiles > 0:
-                for i in range(4):
-                    if i <= tiles:
-                        for color in TileColor:
-                            binary_array.append(1 if factory.tiles[i].color == color else 0)
-            else:
-                binary_array.extend([0] * 20)
+            for color_index, count in enumerate(factory.counts):
+                binary_array.extend(ONE_HOT_COLORS[color_index] * count)
+            binary_array.extend([0] * (5 * (4 - factory.tile_count)))
 
-        
         return binary_array
     
     def central_factory_to_network_input(self, central_factory):
         """
         Transforms the central factory state into the input format required by the neural network.
+        The first neuron flags the starting player tile, followed by 27 slots of 5 color neurons,
+        tiles are listed in TileColor order. They used to follow the order they reached the center in,
+        see factories_to_network_input.
         """
-        binary_array = []
-        buffer = 0
-        tiles = len(central_factory.tiles)
-        if tiles == 0:
-            binary_array.extend([0] * 136)
-        else:
-            if isinstance(central_factory.tiles[0], StartingPlayerTile):
-                binary_array.append(1)
-                tiles -= 1
-                buffer = 1
-            else:
-                binary_array.append(0)
-            for i in range(27):
-                if i < tiles:
-                    for color in TileColor:
-                        binary_array.append(1 if central_factory.tiles[i + buffer].color == color else 0)
-                else:
-                    binary_array.extend([0] * 5)
+        binary_array = [1 if central_factory.has_starting_player_tile else 0]
+        tiles = 0
+        for color_index, count in enumerate(central_factory.counts):
+            count = min(count, 27 - tiles)
+            binary_array.extend(ONE_HOT_COLORS[color_index] * count)
+            tiles += count
+        binary_array.extend([0] * (5 * (27 - tiles)))
 
         return binary_array
     
+    def game_states_to_network_input(self, game_engines, out=None):
+        """
+        game_state_to_network_input for many games at once, as a (len(game_engines), 608) float32
+        array for 4 players. Pass out to reuse an array of that shape.
+        """
+        batch_size = len(game_engines)
+        player_count = game_engines[0].player_count
+        factory_count = len(game_engines[0].factories)
+        factories_offset = player_count * BOARD_INPUT_SIZE
+        central_factory_offset = factories_offset + factory_count * FACTORY_INPUT_SIZE
+        if out is None:
+            out = np.empty((batch_size, central_factory_offset + CENTRAL_FACTORY_INPUT_SIZE), dtype=np.float32)
+        for position in range(player_count):
+            boards = [game_engine.players[(game_engine.current_player_index + position) % player_count].board
+                      for game_engine in game_engines]
+            encode_boards(*board_arrays(boards), out[:, position * BOARD_INPUT_SIZE:(position + 1) * BOARD_INPUT_SIZE])
+        encode_tile_slots(factory_arrays(game_engines), 4, out[:, factories_offset:central_factory_offset])
+        central_factories = [game_engine.central_factory for game_engine in game_engines]
+        out[:, central_factory_offset] = [central_factory.has_starting_player_tile for central_factory in central_factories]
+        encode_tile_slots(np.array([central_factory.counts for central_factory in central_factories], dtype=np.int32)[:, None, :], 27,
+                          out[:, central_factory_offset + 1:])
+        return out
+
+    def simplest_inputs(self, game_engines, out=None):
+        """simplest_input for many games at once, as a (len(game_engines), 253) float32 array."""
+        batch_size = len(game_engines)
+        factory_count = len(game_engines[0].factories)
+        if out is None:
+            out = np.empty((batch_size, BOARD_INPUT_SIZE + factory_count * FACTORY_INPUT_SIZE), dtype=np.float32)
+        encode_boards(*board_arrays([game_engine.players[0].board for game_engine in game_engines]), out[:, :BOARD_INPUT_SIZE])
+        encode_tile_slots(factory_arrays(game_engines), 4, out[:, BOARD_INPUT_SIZE:])
+        return out
+
     def iterate_from_index(self, list, start_index):
         n = len(list)  # Length of the list
         reordered_list = []
@@ -146,3 +153,199 @@ class NeuralNetworkInterface:
             reordered_list.append(list[current_index])
         
         return reordered_list
+
+
+# Layout of one player board block: 5 pattern lines (6 + line index neurons each), the wall and the floor line
+BOARD_INPUT_SIZE = 73
+PATTERN_LINE_OFFSETS = [0, 6, 13, 21, 30]
+WALL_OFFSET = 40
+FLOOR_LINE_OFFSET = 65
+FACTORY_INPUT_SIZE = 20
+CENTRAL_FACTORY_INPUT_SIZE = 136
+WALL_CELL_BITS = 1 << np.arange(25, dtype=np.int64)
+
+
+def board_arrays(player_boards):
+    """Pattern line colors and counts (B, 5), wall masks (B,) and floor line lengths (B,) of many boards."""
+    pattern_line_colors = np.array([board.pattern_line_colors for board in player_boards], dtype=np.int32)
+    pattern_line_counts = np.array([board.pattern_line_counts for board in player_boards], dtype=np.int32)
+    wall_masks = np.array([board.wall_mask for board in player_boards], dtype=np.int64)
+    floor_lengths = np.array([board.floor_line_length() for board in player_boards], dtype=np.int32)
+    return pattern_line_colors, pattern_line_counts, (wall_masks[:, None] & WALL_CELL_BITS) != 0, floor_lengths
+
+
+def factory_arrays(game_engines):
+    """Tile counts of the factory displays of many games, (B, factories, 5)."""
+    return np.array([[factory.counts for factory in game_engine.factories] for game_engine in game_engines], dtype=np.int32)
+
+
+def encode_boards(pattern_line_colors, pattern_line_counts, walls, floor_lengths, out):
+    """
+    Vectorized player_board_to_network_input. Takes pattern line colors and counts (B, 5), the walls
+    as (B, 25) booleans in row-major order and the floor line lengths (B,), and fills out, (B, 73).
+    """
+    rows = np.arange(out.shape[0])
+    out[:] = 0
+    for line_index in range(5):
+        offset = PATTERN_LINE_OFFSETS[line_index]
+        line_counts = pattern_line_counts[:, line_index]
+        occupied = line_counts > 0
+        out[rows[occupied], offset + pattern_line_colors[occupied, line_index]] = 1
+        out[:, offset + 5] = ~occupied
+        out[:, offset + 6:offset + 6 + line_index] = np.arange(1, line_index + 1) < line_counts[:, None]
+    out[:, WALL_OFFSET:FLOOR_LINE_OFFSET] = walls
+    out[:, FLOOR_LINE_OFFSET:BOARD_INPUT_SIZE] = np.arange(8) < floor_lengths[:, None]
+    return out
+
+
+def encode_tile_slots(counts, slot_count, out):
+    """
+    Vectorized factories_to_network_input and the tile part of central_factory_to_network_input.
+    counts is (B, sources, 5); every source gets slot_count slots of 5 color neurons, tiles listed in
+    TileColor order, and tiles past the last slot are left out. Fills out, (B, sources * slot_count * 5).
+    """
+    batch_size, source_count = counts.shape[:2]
+    cumulative_counts = counts.cumsum(axis=2)
+    slots = np.arange(slot_count)
+    # A slot holds the first color whose cumulative count is past the slot index
+    slot_colors = (slots[None, None, :, None] >= cumulative_counts[:, :, None, :]).sum(axis=3)
+    filled = slots[None, None, :] < cumulative_counts[:, :, 4:5]
+    one_hot = (slot_colors[..., None] == np.arange(5)) & filled[..., None]
+    out[:] = one_hot.reshape(batch_size, source_count * slot_count * 5)
+    return out
+
+
+def _pattern_line_code(line_index, color_index, tile_count):
+    code = np.zeros(6 + line_index, dtype=np.float32)
+    if tile_count:
+        code[color_index] = 1
+    else:
+        code[5] = 1
+    code[6:] = np.arange(1, line_index + 1) < tile_count
+    return code
+
+
+# Precomputed input slices: [line][color][tile count], [floor line length] and [FACTORY_CONTENTS index]
+PATTERN_LINE_CODES = [[[_pattern_line_code(line_index, color_index, tile_count) for tile_count in range(line_index + 2)]
+                       for color_index in range(5)]
+                      for line_index in range(5)]
+FLOOR_LINE_CODES = [(np.arange(8) < length).astype(np.float32) for length in range(9)]
+
+
+def _factory_code(counts):
+    code = np.zeros(FACTORY_INPUT_SIZE, dtype=np.float32)
+    slot = 0
+    for color_index, count in enumerate(counts):
+        code[slot * 5 + color_index:(slot + count) * 5:5] = 1
+        slot += count
+    return code
+
+
+FACTORY_CONTENT_CODES = [_factory_code(counts) for counts in FACTORY_CONTENTS]
+
+
+class IncrementalEncoder:
+    """
+    Keeps the network input of one game in preallocated float32 buffers and patches only the
+    slots a move changes: one pattern line and the floor line of the mover, the factory display the
+    tiles came from and the center.
+
+    The "full" layout matches game_state_to_network_input and keeps one buffer per perspective,
+    since that input starts with the board of the player to move. The "simplest" layout matches
+    simplest_input. The encoder registers itself with the game engine, which reports every move
+    and asks for a full refresh after end_round and restore.
+    """
+
+    def __init__(self, game_engine, layout="full"):
+        self.game_engine = game_engine
+        self.layout = layout
+        player_count = game_engine.player_count
+        factory_count = len(game_engine.factories)
+        if layout == "full":
+            perspective_count = player_count
+            # Perspective p starts with the board of player p, followed by the others in seat order
+            self.board_offsets = [[(perspective, ((player_index - perspective) % player_count) * BOARD_INPUT_SIZE)
+                                   for perspective in range(player_count)]
+                                  for player_index in range(player_count)]
+            self.factories_offset = player_count * BOARD_INPUT_SIZE
+            self.central_factory_offset = self.factories_offset + factory_count * FACTORY_INPUT_SIZE
+            input_size = self.central_factory_offset + CENTRAL_FACTORY_INPUT_SIZE
+        elif layout == "simplest":
+            perspective_count = 1
+            # Only the first player's board is part of the input
+            self.board_offsets = [[(0, 0)]] + [[] for _ in range(player_count - 1)]
+            self.factories_offset = BOARD_INPUT_SIZE
+            self.central_factory_offset = None
+            input_size = self.factories_offset + factory_count * FACTORY_INPUT_SIZE
+        else:
+            raise ValueError(f"Unknown network input layout: {layout}")
+
+        self.buffers = np.zeros((perspective_count, input_size), dtype=np.float32)
+        game_engine.encoders.append(self)
+        self.refresh()
+
+    def network_input(self):
+        """The input for the player to move, a view of the buffer that stays valid until the next move."""
+        if self.layout == "full":
+            return self.buffers[self.game_engine.current_player_index]
+        return self.buffers[0]
+
+    def detach(self):
+        self.game_engine.encoders.remove(self)
+
+    def refresh(self):
+        """Encode the whole game state again."""
+        game_engine = self.game_engine
+        for player_index, player in enumerate(game_engine.players):
+            board = player.board
+            for line_index in range(5):
+                self.encode_pattern_line(player_index, board, line_index)
+            wall = ((board.wall_mask >> np.arange(25)) & 1).astype(np.float32)
+            for perspective, offset in self.board_offsets[player_index]:
+                self.buffers[perspective, offset + WALL_OFFSET:offset + FLOOR_LINE_OFFSET] = wall
+            self.encode_floor_line(player_index, board)
+        for factory_index in range(len(game_engine.factories)):
+            self.encode_factory(factory_index)
+        self.encode_central_factory()
+
+    def on_move(self, player_index, factory_index, pattern_line_index):
+        board = self.game_engine.players[player_index].board
+        self.encode_pattern_line(player_index, board, min(pattern_line_index, 4))
+        self.encode_floor_line(player_index, board)
+        if factory_index != -1:
+            self.encode_factory(factory_index)
+        self.encode_central_factory()
+
+    def encode_pattern_line(self, player_index, board, line_index):
+        code = PATTERN_LINE_CODES[line_index][board.pattern_line_colors[line_index]][board.pattern_line_counts[line_index]]
+        start = PATTERN_LINE_OFFSETS[line_index]
+        for perspective, offset in self.board_offsets[player_index]:
+            self.buffers[perspective, offset + start:offset + start + 6 + line_index] = code
+
+    def encode_floor_line(self, player_index, board):
+        code = FLOOR_LINE_CODES[board.floor_line_length()]
+        for perspective, offset in self.board_offsets[player_index]:
+            self.buffers[perspective, offset + FLOOR_LINE_OFFSET:offset + BOARD_INPUT_SIZE] = code
+
+    def encode_factory(self, factory_index):
+        factory = self.game_engine.factories[factory_index]
+        start = self.factories_offset + factory_index * FACTORY_INPUT_SIZE
+        if factory.content_index != -1:
+            self.buffers[:, start:start + FACTORY_INPUT_SIZE] = FACTORY_CONTENT_CODES[factory.content_index]
+        else:
+            self.buffers[:, start:start + FACTORY_INPUT_SIZE] = _factory_code(factory.counts)
+
+    def encode_central_factory(self):
+        if self.central_factory_offset is None:
+            return
+        central_factory = self.game_engine.central_factory
+        segment = self.buffers[:, self.central_factory_offset:self.central_factory_offset + CENTRAL_FACTORY_INPUT_SIZE]
+        segment[:] = 0
+        segment[:, 0] = central_factory.has_starting_player_tile
+        # Tiles are listed in TileColor order, 5 neurons per slot
+        slot = 0
+        for color_index, count in enumerate(central_factory.counts):
+            count = min(count, 27 - slot)
+            if count:
+                segment[:, 1 + slot * 5 + color_index:1 + (slot + count) * 5:5] = 1
+                slot += count
@@ -0,0 +1,58 @@
+import time
+from collections import defaultdict
+
+perf_counter = time.perf_counter
+
+
+class PhaseProfiler:
+    """
+    Wall time and counts of the main phases of play, added up by the code that runs them:
+
+    decision: choosing the moves, all seats. The network seats split it further into
+        decision.encode, decision.activate and decision.decode.
+    apply_move: applying the chosen moves.
+    end_round: moving the tiles to the walls and scoring.
+    refill_factories: dealing the factories for the next round, including refills of the tile bag
+        from the box lid.
+    compile and evaluate_genomes: compiling networks and playing the games of a chunk of genomes,
+        counted per genome.
+
+    Counts are calls for GameEngine and moves or games for BatchedGameEngine. Every process adds
+    to its own module-level profiler. It is off unless enabled is set, and the call sites check
+    enabled once before reading the clock, so games played outside an evaluation don't pay for the
+    timing. The evaluators turn it on in their workers (enable_in_worker), the workers send
+    profiler.take() back with their results and the evaluator merges them into its own PhaseProfiler.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, phase, seconds, count=1):
+        self.seconds[phase] += seconds
+        self.counts[phase] += count
+
+    def stats(self):
+        """{phase: (seconds, count)}, small enough to send with every result."""
+        return {phase: (seconds, self.counts[phase]) for phase, seconds in self.seconds.items()}
+
+    def merge(self, stats):
+        for phase, (seconds, count) in stats.items():
+            self.add(phase, seconds, count)
+
+    def take(self):
+        """The stats gathered since the last take, the profiler starts over."""
+        stats = self.stats()
+        self.seconds.clear()
+        self.counts.clear()
+        return stats
+
+
+profiler = PhaseProfiler()
+
+
+def enable_in_worker():
+    """Turn on this process's profiler, without the stats a fork copied from the parent."""
+    profiler.enabled = True
+    profiler.take()
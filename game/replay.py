@@ -0,0 +1,185 @@
+import os
+import mmap
+import struct
+import numpy as np
+from game_engine import GameEngine
+from game_observer import GameObserver
+from model.player import Player
+from model.move_tables import encode_move
+
+# A replay file starts with FILE_HEADER and holds one record per game: RECORD_HEADER (engine seed,
+# move count, player count), the final score of every player as int16 and the moves packed by
+# encode_move as uint16. The seed replays the deals, so a game takes 11 + 2 * players + 2 * moves bytes.
+# The index file next to it (path + ".idx") holds the uint64 offset of every record.
+FILE_HEADER = b"AZULRPL1"
+RECORD_HEADER = struct.Struct("<QHB")
+INDEX_SUFFIX = ".idx"
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def record_size(move_count, player_count):
+    return RECORD_HEADER.size + 2 * player_count + 2 * move_count
+
+
+def rebuild_index(path):
+    """Scan a replay file and rewrite its index. A record cut short by a crash is dropped from the file."""
+    offsets = []
+    with open(path, "r+b") as f:
+        data = f.read()
+        if not data.startswith(FILE_HEADER):
+            raise ValueError(f"{path} is not a replay file")
+        offset = len(FILE_HEADER)
+        while offset + RECORD_HEADER.size <= len(data):
+            ignored_seed, move_count, player_count = RECORD_HEADER.unpack_from(data, offset)
+            if offset + record_size(move_count, player_count) > len(data):
+                break
+            offsets.append(offset)
+            offset += record_size(move_count, player_count)
+        f.truncate(offset)
+    np.array(offsets, dtype="<u8").tofile(index_path(path))
+    return len(offsets)
+
+
+class ReplayWriter:
+    """Appends games to a replay file and its index. Opening an existing file continues it."""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path) or not os.path.getsize(path):
+            with open(path, "wb") as f:
+                f.write(FILE_HEADER)
+            open(index_path(path), "wb").close()
+        elif not self.index_is_current():
+            rebuild_index(path)
+        self.data_file = open(path, "ab")
+        self.index_file = open(index_path(path), "ab")
+        self.offset = self.data_file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def index_is_current(self):
+        """Whether the last indexed record ends where the file ends."""
+        if not os.path.exists(index_path(self.path)):
+            return False
+        index_size = os.path.getsize(index_path(self.path))
+        if index_size % 8:
+            return False
+        with open(self.path, "rb") as f:
+            if not index_size:
+                return f.read() == FILE_HEADER
+            with open(index_path(self.path), "rb") as index_file:
+                index_file.seek(index_size - 8)
+                offset, = struct.unpack("<Q", index_file.read(8))
+            f.seek(offset)
+            ignored_seed, move_count, player_count = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            return offset + record_size(move_count, player_count) == os.path.getsize(self.path)
+
+    def write_game(self, seed, moves, scores):
+        """Append a game given by its engine seed, its moves packed by encode_move and the final scores."""
+        if seed is None or not 0 <= seed < 1 << 64:
+            raise ValueError("Only games of an engine seeded with an unsigned 64-bit int can be replayed")
+        record = (RECORD_HEADER.pack(seed, len(moves), len(scores))
+                  + np.asarray(scores, dtype="<i2").tobytes()
+                  + np.asarray(moves, dtype="<u2").tobytes())
+        self.data_file.write(record)
+        self.index_file.write(struct.pack("<Q", self.offset))
+        self.offset += len(record)
+
+    def flush(self):
+        # The data goes first, so the index never points past the end of the file
+        self.data_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        if not self.data_file.closed:
+            self.flush()
+            self.data_file.close()
+            self.index_file.close()
+
+
+class ReplayRecorder(GameObserver):
+    """Records every game played by the engines it is attached to into a ReplayWriter."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.moves = []
+
+    def on_round_start(self, game_engine):
+        if game_engine.round_number == 1:
+            self.moves = []
+
+    def on_move_applied(self, game_engine, player_index, factory_index, color_index, pattern_line_index, tile_count,
+                        starting_player_tile):
+        self.moves.append(encode_move(factory_index, color_index, pattern_line_index))
+
+    def on_game_end(self, game_engine):
+        self.writer.write_game(game_engine.seed, self.moves, [player.score for player in game_engine.players])
+
+
+class ReplayReader:
+    """
+    Memory-maps a replay file and its index. record(i) reads a game without replaying it, and
+    game(i) reconstructs it through GameEngine, up to any move.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(FILE_HEADER)] != FILE_HEADER:
+            raise ValueError(f"{path} is not a replay file")
+        if os.path.getsize(index_path(path)):
+            self.offsets = np.memmap(index_path(path), dtype="<u8", mode="r")
+        else:
+            self.offsets = np.zeros(0, dtype="<u8")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.offsets = None
+        self.data.close()
+
+    def record(self, game_index):
+        """(seed, moves, scores) of a game. The arrays are views on the file, drop them before close."""
+        offset = int(self.offsets[game_index])
+        seed, move_count, player_count = RECORD_HEADER.unpack_from(self.data, offset)
+        offset += RECORD_HEADER.size
+        scores = np.frombuffer(self.data, dtype="<i2", count=player_count, offset=offset)
+        moves = np.frombuffer(self.data, dtype="<u2", count=move_count, offset=offset + 2 * player_count)
+        return seed, moves, scores
+
+    def game(self, game_index, move_count=None, players=None):
+        """
+        A GameEngine in the position after the first move_count moves of a game, by default at its
+        end. players default to plain Players, the engine only needs their boards.
+        """
+        seed, moves, scores = self.record(game_index)
+        if players is None:
+            players = [Player(f"Player {player_index + 1}") for player_index in range(len(scores))]
+        game_engine = GameEngine(players, seed=seed)
+        game_engine.round_number = 1
+        round_over = False
+        for move in moves[:move_count].tolist():
+            if round_over:
+                game_engine.round_number += 1
+            game_engine.apply_move(move)
+            game_engine.next_player()
+            round_over = game_engine.is_round_over()
+            if round_over:
+                game_engine.end_round()
+                game_engine.check_game_over()
+        return game_engine
@@ -0,0 +1,203 @@
+import os
+import re
+import sys
+import inspect
+from multiprocessing import Pool
+import numpy as np
+from game_engine import GameEngine
+from game_observer import GameObserver
+from neural_network_interface import IncrementalEncoder
+from model.move_tables import MOVE_COUNT, encode_move
+from model.player import Player
+from model.ai_players.random_player import RandomPlayer
+
+SHARD_PATTERN = re.compile(r"shard-(\d{6})\.npy$")
+
+
+def record_dtype(input_size):
+    """
+    One decision: the network input of the player to move, encoded like NeuralNetworkInterface, the
+    mask of legal moves by encode_move, the move taken, the seat that took it and that seat's final score.
+    """
+    return np.dtype([("state", np.float32, (input_size,)),
+                     ("legal", np.bool_, (MOVE_COUNT,)),
+                     ("action", np.int16),
+                     ("player", np.uint8),
+                     ("score", np.int16)])
+
+
+def shard_path(directory, shard_index):
+    return os.path.join(directory, f"shard-{shard_index:06d}.npy")
+
+
+def shard_indices(directory):
+    """Indices of the complete shards in a directory, in order."""
+    return sorted(int(match.group(1)) for match in map(SHARD_PATTERN.match, os.listdir(directory)) if match)
+
+
+def open_shards(directory):
+    """Every shard of a directory as a read-only memory-mapped record array."""
+    return [np.load(shard_path(directory, shard_index), mmap_mode="r") for shard_index in shard_indices(directory)]
+
+
+class DecisionRecorder(GameObserver):
+    """Collects the records of the games it sees, the scores are filled in when a game ends."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.encoder = None
+        self.states = []
+        self.legal = []
+        self.actions = []
+        self.players = []
+        self.scores = []
+        self.game_start = 0
+
+    def on_round_start(self, game_engine):
+        if self.encoder is None or self.encoder.game_engine is not game_engine:
+            if self.encoder is not None:
+                self.encoder.detach()
+            self.encoder = IncrementalEncoder(game_engine, layout=self.layout)
+        if game_engine.round_number == 1:
+            self.game_start = len(self.actions)
+
+    def on_turn_start(self, game_engine, player):
+        self.states.append(self.encoder.network_input().copy())
+        legal = np.zeros(MOVE_COUNT, dtype=np.bool_)
+        legal[game_engine.legal_moves()] = True
+        self.legal.append(legal)
+
+    def on_move_applied(self, game_engine, player_index, factory_index, color_index, pattern_line_index, tile_count,
+                        starting_player_tile):
+        self.actions.append(encode_move(factory_index, color_index, pattern_line_index))
+        self.players.append(player_index)
+
+    def on_game_end(self, game_engine):
+        final_scores = [player.score for player in game_engine.players]
+        self.scores.extend(final_scores[player_index] for player_index in self.players[self.game_start:])
+
+    def records(self):
+        records = np.empty(len(self.actions), dtype=record_dtype(self.encoder.buffers.shape[1]))
+        if len(records):
+            records["state"] = self.states
+            records["legal"] = self.legal
+            records["action"] = self.actions
+            records["player"] = self.players
+            records["score"] = self.scores
+        return records
+
+
+def input_size_of(player_count, layout):
+    encoder = IncrementalEncoder(GameEngine([Player(f"Player {seat + 1}") for seat in range(player_count)], seed=0), layout=layout)
+    return encoder.buffers.shape[1]
+
+
+def play_games(seed_sequence, game_count, player_specs, layout):
+    """
+    Play game_count games with players built from (class, kwargs) specs and return their records.
+    Players that take a seed and have none in their kwargs get one derived from the game's seed.
+    """
+    recorder = DecisionRecorder(layout)
+    seeded_seats = [("seed" in inspect.signature(player_class).parameters and "seed" not in kwargs)
+                    for player_class, kwargs in player_specs]
+    for game_seed in seed_sequence.spawn(game_count):
+        players = []
+        for seat, ((player_class, kwargs), seeded, seat_seed) in enumerate(zip(player_specs, seeded_seats,
+                                                                               game_seed.spawn(len(player_specs)))):
+            if seeded:
+                kwargs = dict(kwargs, seed=int(seat_seed.generate_state(1, np.uint64)[0]))
+            players.append(player_class(f"Player {seat + 1}", **kwargs))
+        game_engine = GameEngine(players, seed=int(game_seed.generate_state(1, np.uint64)[0]))
+        game_engine.observers.append(recorder)
+        game_engine.play_game()
+    return recorder.records()
+
+
+class DatasetWriter:
+    """
+    Writes records into fixed-size .npy shards through np.memmap, so only the shard being filled is
+    mapped. A shard is written under a temporary name and renamed once full, and numbering continues
+    after the shards already in the directory.
+    """
+
+    def __init__(self, directory, input_size, shard_size=100_000):
+        self.directory = directory
+        self.dtype = record_dtype(input_size)
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+        existing = shard_indices(directory)
+        self.next_shard_index = existing[-1] + 1 if existing else 0
+        self.shard = None
+        self.filled = 0
+        self.written_shards = []
+
+    def write(self, records):
+        while len(records):
+            if self.shard is None:
+                self.shard = np.lib.format.open_memmap(self.temporary_path(), mode="w+", dtype=self.dtype,
+                                                       shape=(self.shard_size,))
+                self.filled = 0
+            count = min(len(records), self.shard_size - self.filled)
+            self.shard[self.filled:self.filled + count] = records[:count]
+            self.filled += count
+            records = records[count:]
+            if self.filled == self.shard_size:
+                self.finish_shard()
+
+    def temporary_path(self):
+        return shard_path(self.directory, self.next_shard_index) + ".tmp"
+
+    def finish_shard(self):
+        self.shard.flush()
+        self.shard = None
+        os.replace(self.temporary_path(), shard_path(self.directory, self.next_shard_index))
+        self.written_shards.append(self.next_shard_index)
+        self.next_shard_index += 1
+
+    def close(self):
+        """Write out the records of a partly filled shard as a shorter last shard."""
+        if self.shard is None:
+            return
+        temporary_path = self.temporary_path()
+        if self.filled:
+            np.save(shard_path(self.directory, self.next_shard_index), self.shard[:self.filled])
+            self.written_shards.append(self.next_shard_index)
+            self.next_shard_index += 1
+        self.shard = None
+        os.remove(temporary_path)
+
+
+def generate_dataset(directory, game_count, player_specs=None, layout="full", num_workers=None, games_per_task=50,
+                     shard_size=100_000, seed=None):
+    """
+    Play game_count self-play games on a process pool and stream their records into shards in
+    directory. player_specs is a (class, kwargs) pair per seat, four RandomPlayers by default. At
+    most two tasks per worker are in flight, so memory stays bounded however many games are played.
+    Returns the indices of the shards written.
+    """
+    player_specs = player_specs or [(RandomPlayer, {})] * 4
+    num_workers = num_workers or os.cpu_count()
+    input_size = input_size_of(len(player_specs), layout)
+    task_seeds = iter(np.random.SeedSequence(seed).spawn(-(-game_count // games_per_task)))
+    task_sizes = iter([min(games_per_task, game_count - start) for start in range(0, game_count, games_per_task)])
+
+    writer = DatasetWriter(directory, input_size, shard_size)
+    try:
+        with Pool(num_workers) as pool:
+            pending = []
+            for task_seed, task_size in zip(task_seeds, task_sizes):
+                pending.append(pool.apply_async(play_games, (task_seed, task_size, player_specs, layout)))
+                if len(pending) >= 2 * num_workers:
+                    writer.write(pending.pop(0).get())
+            for job in pending:
+                writer.write(job.get())
+    finally:
+        # Also when a worker fails, so no temporary shard is left behind
+        writer.close()
+    return writer.written_shards
+
+
+if __name__ == "__main__":
+    # python self_play_dataset.py DIRECTORY GAMES [SEED], from the game directory
+    shards = generate_dataset(sys.argv[1], int(sys.argv[2]), seed=int(sys.argv[3]) if len(sys.argv) > 3 else None)
+    print(f"Wrote shards {shards[0]}-{shards[-1]} to {sys.argv[1]}" if shards else "No shards written")
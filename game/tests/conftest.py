@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules import each other from game/ (from game_engine import ..., from model ...), so the tests
+# run from the repository root or any other directory as well
+GAME_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if GAME_DIRECTORY not in sys.path:
+    sys.path.insert(0, GAME_DIRECTORY)
@@ -0,0 +1,80 @@
+import os
+import copy
+import threading
+import neat
+from neat.parallel import ParallelEvaluator
+import pytest
+from neat_package.distributed_evaluator import DistributedEvaluator, run_worker
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "neat_package", "config",
+                           "config_one_round_one_board.txt")
+
+
+def connection_count_fitness(genome, config):
+    return float(len(genome.connections)) + genome.key / 1000
+
+
+def new_genomes(config, count):
+    genomes = []
+    for key in range(1, count + 1):
+        genome = config.genome_type(key)
+        genome.configure_new(config.genome_config)
+        genomes.append((key, genome))
+    return genomes
+
+
+def test_coordinator_with_two_local_workers():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_FILE)
+    genomes = new_genomes(config, 30)
+    evaluator = DistributedEvaluator(port=0, batch_size=4, local_workers=2, eval_function=connection_count_fitness, timeout=120)
+    try:
+        assert evaluator.address[0] == "127.0.0.1"
+        for ignored_generation in range(2):
+            evaluator.evaluate(genomes, config)
+            assert [genome.fitness for ignored_key, genome in genomes] == \
+                   [connection_count_fitness(genome, config) for ignored_key, genome in genomes]
+    finally:
+        evaluator.close()
+
+
+def test_fitness_matches_local_evaluator():
+    # eval_genome_seeded is seeded with the genome key, so both evaluators must give every genome the same fitness
+    from neat_package.neat import eval_genome_seeded
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_FILE)
+    distributed_genomes = new_genomes(config, 8)
+    local_genomes = [(key, copy.deepcopy(genome)) for key, genome in distributed_genomes]
+
+    evaluator = DistributedEvaluator(port=0, batch_size=3, local_workers=2, eval_function=eval_genome_seeded, timeout=300)
+    try:
+        evaluator.evaluate(distributed_genomes, config)
+    finally:
+        evaluator.close()
+    local_evaluator = ParallelEvaluator(2, eval_genome_seeded)
+    try:
+        local_evaluator.evaluate(local_genomes, config)
+    finally:
+        local_evaluator.pool.close()
+        local_evaluator.pool.join()
+
+    assert all(genome.fitness is not None for ignored_key, genome in distributed_genomes)
+    assert [genome.fitness for ignored_key, genome in distributed_genomes] == \
+           [genome.fitness for ignored_key, genome in local_genomes]
+
+
+def test_worker_with_wrong_authkey_is_dropped():
+    evaluator = DistributedEvaluator(port=0, timeout=10)
+    try:
+        worker = threading.Thread(target=run_worker, args=("127.0.0.1", evaluator.address[1], connection_count_fitness,
+                                                          b"not the coordinator's key"))
+        worker.start()
+        worker.join(10)
+        assert not worker.is_alive()
+    finally:
+        evaluator.close()
+
+
+def test_remote_binding_needs_authkey():
+    with pytest.raises(ValueError):
+        DistributedEvaluator(host="0.0.0.0", port=0)
@@ -0,0 +1,101 @@
+import random
+from game_engine import GameEngine
+from model import zobrist
+from model.move_tables import encode_move
+from model.ai_players.random_player import RandomPlayer
+
+TILE_TOTAL = 100
+GAME_SEEDS = range(20)
+
+
+def new_game(seed):
+    return GameEngine([RandomPlayer(f"Player {seat + 1}", seed=seed * 4 + seat) for seat in range(4)], seed=seed)
+
+
+def tile_total(game_engine):
+    """Colored tiles anywhere in the game: bag, box lid, displays, center and the player boards."""
+    total = game_engine.tile_bag.tile_count + game_engine.box_lid.tile_count + game_engine.central_factory.tile_count
+    total += sum(factory.tile_count for factory in game_engine.factories)
+    total += sum(player.board.count_placed_tiles() for player in game_engine.players)
+    return total
+
+
+def brute_force_moves(game_engine):
+    """Every (source, color, pattern line) with tiles of that color on the source, the floor line being line 5."""
+    sources = [(-1, game_engine.central_factory)] + list(enumerate(game_engine.factories))
+    return {encode_move(factory_index, color_index, pattern_line_index)
+            for factory_index, factory in sources
+            for color_index in range(5) if factory.counts[color_index]
+            for pattern_line_index in range(6)}
+
+
+def play_rounds(game_engine, rng, round_count=5):
+    """Plays random legal moves through round_count rounds, yields after every move and every end of round."""
+    for ignored_round in range(round_count):
+        while not game_engine.is_round_over():
+            game_engine.apply_move(rng.choice(game_engine.legal_moves().tolist()))
+            game_engine.next_player()
+            yield
+        game_engine.end_round()
+        yield
+        if game_engine.game_over:
+            return
+
+
+def test_legal_moves_match_brute_force():
+    for seed in GAME_SEEDS:
+        game_engine = new_game(seed)
+        for ignored_step in play_rounds(game_engine, random.Random(seed)):
+            moves = game_engine.legal_moves().tolist()
+            assert len(moves) == len(set(moves))
+            assert set(moves) == brute_force_moves(game_engine)
+
+
+def test_incremental_hash_matches_compute_hash():
+    for seed in GAME_SEEDS:
+        game_engine = new_game(seed)
+        assert game_engine.hash == zobrist.compute_hash(game_engine)
+        for ignored_step in play_rounds(game_engine, random.Random(seed)):
+            assert game_engine.hash == zobrist.compute_hash(game_engine)
+
+
+def test_tiles_are_conserved():
+    for seed in GAME_SEEDS:
+        game_engine = new_game(seed)
+        assert tile_total(game_engine) == TILE_TOTAL
+        for ignored_step in play_rounds(game_engine, random.Random(seed)):
+            assert tile_total(game_engine) == TILE_TOTAL
+
+
+def test_unmake_move_restores_snapshot():
+    for seed in GAME_SEEDS:
+        game_engine = new_game(seed)
+        rng = random.Random(seed)
+        # Later rounds too, with tiles on the walls and the box lid
+        for ignored_round in range(seed % 3):
+            for ignored_step in play_rounds(game_engine, rng, round_count=1):
+                pass
+
+        history = []
+        while not game_engine.is_round_over():
+            history.append((game_engine.snapshot(), game_engine.hash))
+            game_engine.make_move(rng.choice(game_engine.legal_moves().tolist()))
+        while history:
+            game_engine.unmake_move()
+            state, state_hash = history.pop()
+            assert game_engine.snapshot() == state
+            assert game_engine.hash == state_hash
+        assert not game_engine.undo_stack
+
+
+def test_restore_after_end_round():
+    for seed in GAME_SEEDS:
+        game_engine = new_game(seed)
+        rng = random.Random(seed)
+        while not game_engine.is_round_over():
+            game_engine.make_move(rng.choice(game_engine.legal_moves().tolist()))
+        state = game_engine.snapshot()
+        game_engine.end_round()
+        game_engine.restore(state)
+        assert game_engine.snapshot() == state
+        assert game_engine.hash == zobrist.compute_hash(game_engine)